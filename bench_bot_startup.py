@@ -0,0 +1,78 @@
+"""
+Benchmark de inicialização do processo do bot: tempo de import, RSS e módulos carregados.
+
+Compara o caminho antigo (`import database`, que puxa Streamlit, pandas,
+backup_manager e models) com o caminho enxuto usado pelo worker
+(`services.bot_engine` -> `services.chat_store`). Cada cenário roda num
+processo Python novo, N vezes; o resultado é a mediana.
+
+Uso: python bench_bot_startup.py [repeticoes]
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+SCENARIOS = [
+    ("python vazio", "pass"),
+    ("persistência enxuta (services.chat_store)", "import services.chat_store"),
+    ("worker do bot (services.bot_engine)", "import services.bot_engine"),
+    ("legado (import database)", "import database"),
+]
+
+PROBE = """
+import json, sys, time
+sys.path.insert(0, {root!r})
+start = time.perf_counter()
+error = None
+try:
+    {stmt}
+except BaseException as e:
+    error = f"{{type(e).__name__}}: {{e}}"[:100]
+elapsed = time.perf_counter() - start
+try:
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    rss_mb = rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+except ImportError:
+    rss_mb = None
+print(json.dumps({{"seconds": elapsed, "rss_mb": rss_mb, "modules": len(sys.modules), "error": error}}))
+"""
+
+
+def run_scenario(stmt, repeat, workdir):
+    samples = []
+    for _ in range(repeat):
+        out = subprocess.run(
+            [sys.executable, "-c", PROBE.format(root=ROOT, stmt=stmt)],
+            cwd=workdir, capture_output=True, text=True, timeout=300,
+        )
+        samples.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    rss = [s["rss_mb"] for s in samples if s["rss_mb"] is not None]
+    return {
+        "seconds": statistics.median(s["seconds"] for s in samples),
+        "rss_mb": statistics.median(rss) if rss else None,
+        "modules": samples[-1]["modules"],
+        "error": samples[-1]["error"],
+    }
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    # Diretório vazio: o import do bot cria bot.log e lê bot_config.json no cwd
+    with tempfile.TemporaryDirectory() as workdir:
+        print(f"{'cenário':<45} {'import (s)':>10} {'RSS (MB)':>9} {'módulos':>8}")
+        for name, stmt in SCENARIOS:
+            r = run_scenario(stmt, repeat, workdir)
+            rss = f"{r['rss_mb']:.0f}" if r["rss_mb"] is not None else "n/d"
+            print(f"{name:<45} {r['seconds']:>10.2f} {rss:>9} {r['modules']:>8}")
+            if r["error"]:
+                print(f"   ⚠️ import falhou: {r['error']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -9,7 +9,8 @@ import json
 import sqlite3
 from sqlmodel import select, Session, text
 import database_config
-from models import Cliente, Contato, Endereco, AuditLog, ChatHistory
+from models import Cliente, Contato, Endereco, AuditLog
+from services import chat_store
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -550,16 +551,19 @@ def get_incomplete_customers():
     """
     Busca clientes com informações chave faltando.
     """
+    # Os aliases do SELECT não existem no WHERE (o Postgres rejeita): filtra por fora
     query = """
-        SELECT cl.id, cl.nome_completo, 
-               CASE WHEN co.email_contato IS NULL OR co.email_contato = '' THEN 1 ELSE 0 END as missing_email,
-               CASE WHEN co.telefone IS NULL OR co.telefone = '' THEN 1 ELSE 0 END as missing_phone,
-               CASE WHEN en.cep IS NULL OR en.cep = '' THEN 1 ELSE 0 END as missing_cep
-        FROM clientes cl
-        LEFT JOIN contatos co ON cl.id = co.cliente_id AND co.tipo_contato = 'Principal'
-        LEFT JOIN enderecos en ON cl.id = en.cliente_id AND en.tipo_endereco = 'Principal'
+        SELECT * FROM (
+            SELECT cl.id, cl.nome_completo, 
+                   CASE WHEN co.email_contato IS NULL OR co.email_contato = '' THEN 1 ELSE 0 END as missing_email,
+                   CASE WHEN co.telefone IS NULL OR co.telefone = '' THEN 1 ELSE 0 END as missing_phone,
+                   CASE WHEN en.cep IS NULL OR en.cep = '' THEN 1 ELSE 0 END as missing_cep
+            FROM clientes cl
+            LEFT JOIN contatos co ON cl.id = co.cliente_id AND co.tipo_contato = 'Principal'
+            LEFT JOIN enderecos en ON cl.id = en.cliente_id AND en.tipo_endereco = 'Principal'
+        ) as sub
         WHERE missing_email = 1 OR missing_phone = 1 OR missing_cep = 1
-        ORDER BY cl.id DESC;
+        ORDER BY id DESC;
     """
     try:
         df = pd.read_sql_query(query, database_config.engine)
@@ -601,70 +605,28 @@ def get_all_states() -> list:
 
 
 
+# Implementação em services/chat_store.py (SQLAlchemy Core, sem Streamlit),
+# usada diretamente pelo processo do bot; aqui ficam os wrappers da UI.
+
 def save_chat_message(phone_number, role, content, external_id=None):
-    """Salva uma mensagem no histórico do chat (Postgres) via SQL direto."""
-    try:
-        from sqlalchemy import text as sa_text
-        with database_config.engine.connect() as conn:
-            conn.execute(
-                sa_text("""
-                    INSERT INTO chat_history (phone_number, role, content, timestamp, is_read, external_id)
-                    VALUES (:phone, :role, :content, NOW(), 0, :eid)
-                """),
-                {"phone": phone_number, "role": role, "content": content, "eid": external_id}
-            )
-            conn.commit()
-    except Exception as e:
-        logging.error(f"Erro ao salvar mensagem de chat: {e}")
+    """Salva uma mensagem no histórico do chat."""
+    chat_store.save_chat_message(phone_number, role, content, external_id)
 
 def check_message_exists(external_id):
     """Verifica se uma mensagem com este ID externo já foi processada."""
-    if not external_id:
-        return False
-    try:
-        from sqlalchemy import text as sa_text
-        with database_config.engine.connect() as conn:
-            result = conn.execute(
-                sa_text("SELECT id FROM chat_history WHERE external_id = :eid LIMIT 1"),
-                {"eid": external_id}
-            ).fetchone()
-            return result is not None
-    except Exception as e:
-        logging.error(f"Erro ao verificar existência de mensagem: {e}")
-        return False
+    return chat_store.check_message_exists(external_id)
 
 def get_chat_history(phone_number, limit=20):
-    """Recupera o histórico recente de conversas com um número (Postgres)."""
-    try:
-        with get_session() as session:
-            # SQLModel select
-            statement = select(ChatHistory).where(ChatHistory.phone_number == phone_number).order_by(ChatHistory.timestamp.desc()).limit(limit)
-            results = session.exec(statement).all()
-            
-            # Retorna na ordem cronológica (mais antigo primeiro) para o LLM entender
-            history = []
-            for r in reversed(results):
-                history.append({
-                    "role": r.role,
-                    "parts": [r.content]
-                })
-            return history
-    except Exception as e:
-        logging.error(f"Erro ao recuperar histórico de chat: {e}")
-        return []
+    """Recupera o histórico recente de conversas com um número."""
+    return chat_store.get_chat_history(phone_number, limit=limit)
 
 def get_recent_chats_summary(limit=50):
-    """Retorna um resumo das últimas mensagens trocadas para o Dashboard (Postgres)."""
+    """Retorna um resumo das últimas mensagens trocadas para o Dashboard."""
     try:
-        # Using pandas with the engine directly for summary query
-        query = '''
-            SELECT phone_number, role, content, timestamp 
-            FROM chat_history 
-            ORDER BY timestamp DESC
-            LIMIT %s
-        '''
-        df = pd.read_sql_query(query, database_config.engine, params=(limit,))
-        return df
+        return pd.DataFrame(
+            chat_store.get_recent_chats(limit=limit),
+            columns=["phone_number", "role", "content", "timestamp"],
+        )
     except Exception as e:
         logging.error(f"Erro ao buscar resumo de chats: {e}")
         return pd.DataFrame()
@@ -1,4 +1,6 @@
-from sqlmodel import SQLModel, create_engine, Session
+# Só SQLAlchemy no topo: o processo do bot importa este módulo sem carregar
+# sqlmodel/modelos (get_session e create_db_and_tables importam sob demanda).
+from sqlalchemy import create_engine
 import os
 
 # Configuração do Supabase Postgres
@@ -21,9 +23,17 @@ engine = create_engine(
     pool_recycle=300,
 )
 
+# LISTEN/NOTIFY precisa de uma sessão fixa, o que o pooler em Transaction Mode (6543)
+# não garante: o aviso de mudanças (services/change_notifications.py) abre UMA conexão
+# própria em Session Mode (5432, mesmo host) ou na URL de LISTEN_DATABASE_URL
+# (ex.: conexão direta ao banco).
+LISTEN_DATABASE_URL = os.getenv("LISTEN_DATABASE_URL") or DATABASE_URL.replace(":6543/", ":5432/")
+
 def get_session():
+    from sqlmodel import Session
     with Session(engine) as session:
         yield session
 
 def create_db_and_tables():
+    from sqlmodel import SQLModel
     SQLModel.metadata.create_all(engine)
@@ -1,6 +1,7 @@
 
 import streamlit as st
 from sqlalchemy.orm import clear_mappers
+from sqlalchemy import text
 from sqlmodel import SQLModel
 from database_config import engine
 
@@ -21,6 +22,17 @@ def get_models():
     
     # Ensure tables exist
     SQLModel.metadata.create_all(engine)
+    # create_all não altera tabelas existentes: garante a coluna da busca por proximidade,
+    # os flags de completude, o índice usado pela série temporal de cadastros e os
+    # triggers que avisam as outras sessões quando os dados mudam
+    from services.change_notifications import ensure_change_triggers
+    from services.completeness import ensure_completeness_flags
+    from services.geo_search import ensure_geo_cells
+    ensure_geo_cells(engine)
+    ensure_completeness_flags(engine)
+    ensure_change_triggers(engine)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_clientes_data_cadastro ON clientes (data_cadastro)"))
     
     return {
         "Cliente": models_src.Cliente,
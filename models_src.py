@@ -1,6 +1,10 @@
 from typing import Optional, List
 from datetime import date, datetime
+from sqlalchemy import event
+from sqlalchemy.orm import Session
 from sqlmodel import Field, Relationship, SQLModel
+from services.completeness import refresh_completeness
+from services.geo_search import grid_cell
 
 class ClienteBase(SQLModel):
     nome_completo: str
@@ -9,13 +13,17 @@ class ClienteBase(SQLModel):
     cnpj: Optional[str] = Field(default=None, unique=True)
     data_nascimento: Optional[date] = None
     observacao: Optional[str] = None
-    data_cadastro: Optional[date] = Field(default_factory=date.today)
+    data_cadastro: Optional[date] = Field(default_factory=date.today, index=True)
     receber_atualizacoes: bool = Field(default=False)
 
 class Cliente(ClienteBase, table=True):
     __tablename__ = "clientes"
     __table_args__ = {"extend_existing": True}
     id: Optional[int] = Field(default=None, primary_key=True)
+    # Mantidos por services.completeness a cada mudança de contato/endereço
+    missing_email: bool = Field(default=True)
+    missing_phone: bool = Field(default=True)
+    missing_cep: bool = Field(default=True)
     
     contatos: List["Contato"] = Relationship(
         back_populates="cliente", 
@@ -58,9 +66,26 @@ class Endereco(EnderecoBase, table=True):
     __table_args__ = {"extend_existing": True}
     id: Optional[int] = Field(default=None, primary_key=True)
     cliente_id: int = Field(foreign_key="clientes.id")
+    # Célula da grade de services.geo_search, mantida a partir de latitude/longitude
+    geo_cell: Optional[int] = Field(default=None, index=True)
     
     cliente: Cliente = Relationship(back_populates="enderecos")
 
+
+@event.listens_for(Endereco, "before_insert")
+@event.listens_for(Endereco, "before_update")
+def _set_geo_cell(mapper, connection, endereco):
+    endereco.geo_cell = grid_cell(endereco.latitude, endereco.longitude)
+
+
+@event.listens_for(Session, "after_flush")
+def _refresh_completeness(session, flush_context):
+    changed = (*session.new, *session.dirty, *session.deleted)
+    cliente_ids = {obj.cliente_id for obj in changed
+                   if isinstance(obj, (Contato, Endereco)) and obj.cliente_id is not None}
+    for cliente_id in cliente_ids:
+        refresh_completeness(session.connection(), cliente_id)
+
 class AuditLog(SQLModel, table=True):
     __tablename__ = "audit_logs"
     __table_args__ = {"extend_existing": True}
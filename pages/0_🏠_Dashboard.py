@@ -3,8 +3,10 @@ import pandas as pd
 import pydeck as pdk
 import json
 import datetime
+import time
 import integration_services as services
 from services.customer_service import CustomerService
+from services.change_notifications import CUSTOMER_ENTITIES, get_change_listener
 
 customer_service = CustomerService()
 
@@ -33,31 +35,76 @@ else:
 st.info(f"📊 Exibindo dados de **{start_date.strftime('%d/%m/%Y')}** até **{today.strftime('%d/%m/%Y')}**")
 
 
-# --- Estrutura de Abas ---
-tab_overview, tab_geo, tab_health, tab_bot = st.tabs([
-    "Visão Geral", 
-    "Análise Geográfica", 
-    "Saúde dos Dados",
-    "🤖 Bot Atendimento"
-])
-
-with tab_overview:
-    st.header("Visão Geral do Crescimento de Clientes")
+# Escritas (de qualquer sessão, do bot ou de uma restauração) chegam pelo aviso de
+# mudanças e limpam os caches de clientes (on_data_changed). TTLs longos só depois
+# que o aviso comprovadamente chega; até lá, os TTLs curtos de sempre.
+change_listener = get_change_listener()
 
-    # Adicionar KPIs
-    total_geral = customer_service.count_customers()
-    
-    ts_df_kpi = customer_service.get_new_customers_timeseries(start_date, today, period='D')
-    novos_no_periodo = ts_df_kpi['count'].sum() if not ts_df_kpi.empty else 0
 
+@st.cache_data(ttl=change_listener.cache_ttl(60, 600), show_spinner=False)
+def load_dashboard_snapshot(start, end, granularity):
+    """KPIs + série em uma consulta, compartilhados entre sessões."""
+    return customer_service.get_dashboard_snapshot(start, end, granularity)
 
-    col1, col2, col3 = st.columns(3)
-    with col1:
-        st.metric(label="Total de Clientes (Base)", value=total_geral)
-    with col2:
-        st.metric(label="Clientes no Período Selecionado", value=novos_no_periodo)
-    with col3:
-        st.metric(label="Saúde da Base", value=f"{customer_service.get_data_health_summary().get('email_completeness', 0):.1f}%", help="Porcentagem de clientes com e-mail cadastrado")
+
+@st.cache_data(ttl=change_listener.cache_ttl(300, 3600), show_spinner=False)
+def load_map_clusters(zoom, start, end):
+    """Células da grade agregadas no banco (nunca a lista completa de clientes)."""
+    return customer_service.get_map_clusters(zoom, start, end)
+
+
+@st.cache_data(ttl=change_listener.cache_ttl(300, 3600), show_spinner=False)
+def load_customers_per_state(start, end):
+    return customer_service.get_customers_per_state(start, end)
+
+
+@st.cache_data(ttl=86400, show_spinner=False)
+def geocode_place(place):
+    return services.get_coords_for_address(place)
+
+
+@st.cache_data(ttl=change_listener.cache_ttl(60, 600), show_spinner=False)
+def load_customers_near(lat, lon, radius_km, limit):
+    return customer_service.find_customers_near(lat, lon, radius_km, limit)
+
+
+@st.cache_data(ttl=change_listener.cache_ttl(60, 600), show_spinner=False)
+def load_incomplete_customers(missing, after_id, limit):
+    return customer_service.get_incomplete_customers(list(missing), after_id, limit)
+
+
+@st.cache_data(ttl=change_listener.cache_ttl(60, 600), show_spinner=False)
+def count_incomplete_customers(missing):
+    return customer_service.count_incomplete_customers(list(missing))
+
+
+def on_data_changed(changes):
+    """Chamado pela thread de aviso de mudanças com a lista de (entidade, id) alterados."""
+    if any(entity is None or entity in CUSTOMER_ENTITIES for entity, _ in changes):
+        for loader in (load_dashboard_snapshot, load_map_clusters, load_customers_per_state,
+                       load_customers_near, load_incomplete_customers, count_incomplete_customers):
+            loader.clear()
+
+
+change_listener.subscribe("dashboard", on_data_changed)
+
+
+# --- Estrutura de Abas ---
+# st.tabs executa o conteúdo de todas as abas a cada rerun; com a navegação por
+# radio só a aba visível roda suas consultas (e cada uma tem cache próprio).
+TAB_OVERVIEW, TAB_GEO, TAB_HEALTH, TAB_BOT = "Visão Geral", "Análise Geográfica", "Saúde dos Dados", "🤖 Bot Atendimento"
+active_tab = st.radio(
+    "Seção", [TAB_OVERVIEW, TAB_GEO, TAB_HEALTH, TAB_BOT],
+    horizontal=True, label_visibility="collapsed", key="dashboard_tab",
+)
+period_map = {'Diário': 'D', 'Semanal': 'W', 'Mensal': 'M'}
+default_periodo = 'Diário' if period_choice == "Últimos 30 Dias" else 'Mensal'
+
+if active_tab == TAB_OVERVIEW:
+    st.header("Visão Geral do Crescimento de Clientes")
+
+    # KPIs ficam acima do gráfico, mas dependem da agregação escolhida abaixo (mesma consulta)
+    kpi_container = st.container()
 
     st.markdown("---")
 
@@ -67,11 +114,22 @@ with tab_overview:
     periodo = st.selectbox(
         "Agregar por:",
         options=['Diário', 'Semanal', 'Mensal'],
-        index=0 if period_choice == "Últimos 30 Dias" else 2
+        # Widgets de abas não exibidas perdem o estado: a escolha fica guardada à parte
+        index=['Diário', 'Semanal', 'Mensal'].index(st.session_state.get("overview_periodo", default_periodo))
     )
-
-    period_map = {'Diário': 'D', 'Semanal': 'W', 'Mensal': 'M'}
-    ts_data = customer_service.get_new_customers_timeseries(start_date, today, period=period_map[periodo])
+    st.session_state["overview_periodo"] = periodo
+
+    snapshot = load_dashboard_snapshot(start_date, today, period_map[periodo])
+    ts_data = snapshot['timeseries']
+
+    with kpi_container:
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric(label="Total de Clientes (Base)", value=snapshot['total_customers'])
+        with col2:
+            st.metric(label="Clientes no Período Selecionado", value=snapshot['new_in_period'])
+        with col3:
+            st.metric(label="Saúde da Base", value=f"{snapshot['email_completeness']:.1f}%", help="Porcentagem de clientes com e-mail cadastrado")
     
     if not ts_data.empty:
         ts_data = ts_data.set_index('time_period')
@@ -79,21 +137,23 @@ with tab_overview:
     else:
         st.info("Não há dados de novos clientes no período selecionado.")
 
-with tab_geo:
+elif active_tab == TAB_GEO:
     st.header("Mapa de Distribuição de Clientes")
 
-    # Filtramos as localizações também pelo período no banco de dados
-    # Para isso, precisamos atualizar a função get_customer_locations no database.py em um passo futuro, 
-    # mas por agora vamos filtrar o DF aqui para ser mais rápido.
-    customer_locations_df = customer_service.get_customer_locations()
-    
-    # Nota: Como get_customer_locations não recebe data, vamos mostrar TODOS no mapa por padrão 
-    # para garantir que você veja seus pontos.
-    
-    if not customer_locations_df.empty:
-        # Calculate initial view state based on customer locations
-        avg_lat = customer_locations_df['latitude'].mean()
-        avg_lon = customer_locations_df['longitude'].mean()
+    # Agregação em grade feita no banco, já filtrada pelo período da barra lateral
+    map_detail = st.select_slider(
+        "Nível de detalhe", options=[3, 4, 5, 6, 7, 8, 10, 12], value=4,
+        help="Quanto maior, menores as células de agrupamento (como o zoom do mapa)",
+    )
+    clusters_df = load_map_clusters(map_detail, start_date, today)
+
+    if not clusters_df.empty:
+        # Centro do mapa ponderado pela quantidade de clientes em cada célula
+        total_points = clusters_df['count'].sum()
+        avg_lat = (clusters_df['latitude'] * clusters_df['count']).sum() / total_points
+        avg_lon = (clusters_df['longitude'] * clusters_df['count']).sum() / total_points
+        max_count = clusters_df['count'].max()
+        clusters_df['radius'] = 20000 * (clusters_df['count'] / max_count) ** 0.5 * (2 ** (4 - map_detail)) + 2000
 
         st.pydeck_chart(pdk.Deck(
             initial_view_state=pdk.ViewState(
@@ -103,29 +163,101 @@ with tab_geo:
                 pitch=40,
             ),
             layers=[
+                pdk.Layer(
+                    'HeatmapLayer',
+                    data=clusters_df,
+                    get_position='[longitude, latitude]',
+                    get_weight='count',
+                    opacity=0.5,
+                ),
                 pdk.Layer(
                     'ScatterplotLayer',
-                    data=customer_locations_df,
+                    data=clusters_df,
                     get_position='[longitude, latitude]',
                     get_color='[0, 104, 201, 160]', # Azul Streamlit
-                    get_radius=20000, 
+                    get_radius='radius',
                     pickable=True,
                 ),
             ],
             tooltip={
-                "html": "<b>{nome_completo}</b><br/>{cidade} - {estado}",
+                "html": "<b>{count}</b> cliente(s) nesta região",
                 "style": {"backgroundColor": "#0068c9", "color": "white"}
             }
         ))
-        
-        st.bar_chart(customer_locations_df['estado'].value_counts()) 
+        st.caption(f"{total_points} clientes geolocalizados em {len(clusters_df)} regiões.")
+
+        per_state_df = load_customers_per_state(start_date, today)
+        if not per_state_df.empty:
+            st.bar_chart(per_state_df.set_index('estado')['count'])
     else:
         st.info("Não há dados de localização para exibir.")
 
-with tab_health:
+    st.divider()
+    st.subheader("📍 Clientes Próximos")
+    with st.form("nearby_form"):
+        col_place, col_radius, col_limit = st.columns([3, 1, 1])
+        place = col_place.text_input("Endereço, cidade ou CEP", placeholder="Ex: Av. Paulista, 1000, São Paulo")
+        radius_km = col_radius.number_input("Raio (km)", min_value=1, max_value=2000, value=20)
+        limit = col_limit.number_input("Máx. clientes", min_value=1, max_value=500, value=10)
+        if st.form_submit_button("Buscar") and place.strip():
+            lat, lon = geocode_place(place.strip())
+            if lat is None:
+                st.session_state.pop("nearby_query", None)
+                st.warning("Endereço não encontrado.")
+            else:
+                # Guardado na sessão para o resultado continuar visível nos próximos reruns
+                st.session_state["nearby_query"] = (lat, lon, int(radius_km), int(limit))
+
+    if "nearby_query" in st.session_state:
+        lat, lon, radius_km, limit = st.session_state["nearby_query"]
+        nearby_df = load_customers_near(lat, lon, radius_km, limit)
+        if nearby_df.empty:
+            st.info(f"Nenhum cliente geolocalizado num raio de {radius_km} km.")
+        else:
+            st.pydeck_chart(pdk.Deck(
+                initial_view_state=pdk.ViewState(latitude=lat, longitude=lon, zoom=9),
+                layers=[
+                    pdk.Layer(
+                        'ScatterplotLayer',
+                        data=pd.DataFrame([{"latitude": lat, "longitude": lon}]),
+                        get_position='[longitude, latitude]',
+                        get_color='[255, 75, 75, 200]',
+                        get_radius=radius_km * 1000,
+                        stroked=True,
+                        filled=False,
+                        line_width_min_pixels=2,
+                    ),
+                    pdk.Layer(
+                        'ScatterplotLayer',
+                        data=nearby_df,
+                        get_position='[longitude, latitude]',
+                        get_color='[0, 104, 201, 200]',
+                        get_radius=300,
+                        radius_min_pixels=4,
+                        pickable=True,
+                    ),
+                ],
+                tooltip={"html": "<b>{nome_completo}</b><br/>{distancia_km} km"}
+            ))
+            st.dataframe(
+                nearby_df[['nome_completo', 'cidade', 'estado', 'distancia_km']].round({'distancia_km': 1}),
+                column_config={
+                    "nome_completo": "Cliente",
+                    "cidade": "Cidade",
+                    "estado": "UF",
+                    "distancia_km": st.column_config.NumberColumn("Distância (km)", format="%.1f"),
+                },
+                hide_index=True,
+                use_container_width=True,
+            )
+
+elif active_tab == TAB_HEALTH:
     st.header("Análise da Qualidade dos Dados dos Clientes")
 
-    health_summary = customer_service.get_data_health_summary()
+    # Completude vem do snapshot da Visão Geral (mesma chave de cache se ela já foi aberta)
+    health_summary = load_dashboard_snapshot(
+        start_date, today, period_map[st.session_state.get("overview_periodo", default_periodo)]
+    )
 
     col1, col2, col3 = st.columns(3)
     with col1:
@@ -147,14 +279,52 @@ with tab_health:
     st.markdown("---")
 
     st.subheader("Clientes com Dados Incompletos")
-    incomplete_data = customer_service.get_incomplete_customers()
+    INCOMPLETE_PAGE_SIZE = 50
+    missing_labels = {"E-mail": "email", "Telefone": "phone", "CEP": "cep"}
+
+    def _reset_incomplete_pages():
+        st.session_state["incomplete_cursors"] = [None]
+
+    selected_missing = st.multiselect(
+        "Faltando", list(missing_labels), placeholder="Qualquer campo",
+        key="incomplete_missing", on_change=_reset_incomplete_pages,
+    )
+    missing = tuple(missing_labels[label] for label in selected_missing)
+    # Pilha de cursores (último id da página anterior); o topo é a página atual
+    cursors = st.session_state.setdefault("incomplete_cursors", [None])
+
+    incomplete_total = count_incomplete_customers(missing)
+    incomplete_data = load_incomplete_customers(missing, cursors[-1], INCOMPLETE_PAGE_SIZE)
 
     if not incomplete_data.empty:
+        st.caption(f"{incomplete_total} cliente(s) incompleto(s) — página {len(cursors)}")
         st.dataframe(incomplete_data, hide_index=True)
-    else:
+
+        col_prev, col_next, col_export = st.columns([1, 1, 2])
+        if col_prev.button("⬅️ Anterior", disabled=len(cursors) == 1):
+            cursors.pop()
+            st.rerun()
+        if col_next.button("Próxima ➡️", disabled=len(incomplete_data) < INCOMPLETE_PAGE_SIZE):
+            cursors.append(int(incomplete_data['id'].iloc[-1]))
+            st.rerun()
+        col_export.download_button(
+            "📥 Exportar CSV",
+            # Gerado só no clique, em lotes, sem montar um DataFrame com todos
+            data=lambda: "".join(customer_service.iter_incomplete_customers_csv(list(missing))),
+            file_name="clientes_incompletos.csv",
+            mime="text/csv",
+            on_click="ignore",
+        )
+    elif len(cursors) > 1:
+        # A página ficou vazia (clientes foram completados): volta ao início
+        _reset_incomplete_pages()
+        st.rerun()
+    elif not missing:
         st.success("Parabéns! Todos os seus clientes têm dados essenciais completos.")
+    else:
+        st.info("Nenhum cliente incompleto com esse filtro.")
 
-with tab_bot:
+elif active_tab == TAB_BOT:
     st.header("🤖 Configuração e Logs do Bot")
     
     # Carregar configuração
@@ -175,100 +345,157 @@ with tab_bot:
         # Carrega configuração atual
         bot_active = st.toggle("Bot Ativo", value=config.get("bot_active", False))
         
-        # Salva se mudou
+        # Motor roda num processo separado, mantido pelo supervisor (services/bot_supervisor.py)
+        from services.bot_supervisor import read_status, send_command, launch_supervisor
+
+        supervisor = read_status()
+
+        # Salva se mudou e avisa o supervisor
         if bot_active != config.get("bot_active", False):
             config["bot_active"] = bot_active
             with open(CONFIG_FILE, 'w') as f:
                 json.dump(config, f, indent=4)
+            if supervisor["alive"]:
+                send_command("start" if bot_active else "stop")
             st.rerun()
-            
-        # --- Lógica de Thread Nativa (Singleton thread-safe) ---
-        from services.bot_engine import get_bot_runner, start_bot_runner, stop_bot_runner
 
-        runner = get_bot_runner()
-
-        if bot_active:
-            if not runner:
-                # Toggle ligado: inicia runner (para qualquer thread anterior automaticamente)
-                st.info("▶️ Iniciando motor do bot...")
-                try:
-                    start_bot_runner()
-                    st.rerun()
-                except Exception as e:
-                    st.error(f"Erro ao iniciar bot: {e}")
-            else:
-                st.success("🟢 Bot Rodando")
-                st.caption(f"Thread ID: {runner.ident}")
-                if st.button("🔄 Reiniciar Motor", help="Use se o bot parar de responder"):
-                    start_bot_runner()  # para o atual e cria novo automaticamente
-                    st.rerun()
-        else:
-            if runner:
-                # Toggle desligado: para completamente
-                st.warning("⏹️ Parando bot...")
-                stop_bot_runner()
+        if bot_active and not supervisor["alive"]:
+            # Toggle ligado sem supervisor: inicia (um segundo supervisor sai sozinho pelo lock)
+            st.info("▶️ Iniciando supervisor do bot...")
+            try:
+                launch_supervisor()
+            except Exception as e:
+                st.error(f"Erro ao iniciar bot: {e}")
+        elif supervisor["alive"] and supervisor.get("worker_pid"):
+            st.success("🟢 Bot Rodando")
+            _uptime = time.time() - (supervisor.get("worker_started_at") or time.time())
+            st.caption(f"Worker PID {supervisor['worker_pid']} · ativo há {_uptime / 60:.0f} min · "
+                       f"{supervisor.get('restarts', 0)} reinício(s)")
+            if st.button("🔄 Reiniciar Motor", help="Use se o bot parar de responder"):
+                send_command("restart")
                 st.rerun()
-            else:
-                st.error("🔴 Bot Parado")
-
+        elif supervisor["alive"] and supervisor.get("state") == "restarting":
+            st.warning(f"⏳ Motor reiniciando (última saída: código {supervisor.get('last_exit_code')})")
+        elif supervisor["alive"] and bot_active:
+            send_command("start")
+            st.info("▶️ Iniciando motor do bot...")
+        else:
+            st.error("🔴 Bot Parado")
+
+
+        # Instâncias (números de WhatsApp) atendidas pelo mesmo motor, com pausa individual
+        from services.bot_instances import instance_configs, set_instance_active
+        from services.leader_lease import current_leader
+        _instances = instance_configs(config)
+        for _inst in _instances:
+            _name = _inst["evolution_instance_name"]
+            _paused = bot_active and not _inst["bot_active"]
+            if len(_instances) > 1:
+                _running = st.toggle(f"📱 {_name}", value=not _paused, key=f"instance_active_{_name}",
+                                     disabled=not bot_active, help="Pausa/retoma só este número")
+                if bot_active and _running == _paused:
+                    set_instance_active(config, _name, _running)
+                    with open(CONFIG_FILE, 'w') as f:
+                        json.dump(config, f, indent=4)
+                    st.rerun()
+            # Réplica que detém o lease da instância (só ela faz polling e responde)
+            _lease = current_leader(f"bot:{_name}")
+            if _lease:
+                st.caption(f"👑 {_name} — líder: {_lease['holder']} (term {_lease['term']})")
+            elif bot_active and not _paused:
+                st.caption(f"{_name}: nenhuma réplica com liderança ativa no momento.")
 
         # --- Painel de Uso do Gemini ---
         st.markdown("---")
         st.subheader("📊 Uso do Gemini (Plano Gratuito)")
 
-        # Tenta obter stats do bot_intelligence via thread ativa
-        gemini_stats = None
-        try:
-            from services.bot_engine import get_bot_runner as _get_runner
-            _runner = _get_runner()
-            # Acessa bot_intelligence apenas se thread estiver rodando
-            # Fallback: mostra placeholders se não disponível
-        except Exception:
-            pass
-
-        # Lê estatísticas do log
+        # Cota global (compartilhada por todos os runners/processos), só lida do banco
+        from services.rate_limiter import (
+            GEMINI_MAX_CALLS_PER_DAY, GEMINI_MAX_CALLS_PER_MINUTE, SharedRateLimiter, gemini_bucket,
+        )
+        _usage = SharedRateLimiter(
+            bucket=gemini_bucket(config.get("gemini_key")),
+            per_minute=GEMINI_MAX_CALLS_PER_MINUTE,
+            per_day=GEMINI_MAX_CALLS_PER_DAY,
+        ).peek()
+        if _usage is None:
+            st.caption("Cota do Gemini: sem dados (o bot ainda não registrou chamadas ou o banco não respondeu).")
+        else:
+            _c1, _c2 = st.columns(2)
+            with _c1:
+                st.metric("Calls hoje", f"{_usage['calls_today']} / {_usage['max_per_day']}",
+                          help=f"Restam {_usage['remaining_today']} chamadas hoje")
+                st.progress(min(_usage['calls_today'] / _usage['max_per_day'], 1.0))
+            with _c2:
+                st.metric("Disponíveis agora", f"{_usage['available_now']} / {_usage['max_per_minute']}",
+                          help="Chamadas que podem ser feitas imediatamente (token bucket por minuto)")
+                st.progress(min(_usage['available_now'] / _usage['max_per_minute'], 1.0))
+            if _usage['cooldown_remaining'] > 0:
+                st.warning(f"⏳ Cooldown após rate limit da API: mais {_usage['cooldown_remaining']:.0f}s")
+
+        # Métricas estruturadas publicadas pelo motor (uma leitura por chave, sem varrer o bot.log)
         try:
-            import re as _re
-            with open("bot.log", "r", encoding="utf-8") as _f:
-                _lines = _f.readlines()
-
-            # Extrai a última linha com stats do Gemini
-            _stats_line = ""
-            for _l in reversed(_lines):
-                if "calls/min |" in _l and "calls/dia" in _l:
-                    _stats_line = _l
-                    break
-
-            if _stats_line:
-                _m = _re.search(r'(\d+) calls/min \| (\d+)/(\d+) calls/dia', _stats_line)
-                if _m:
-                    _cpm = int(_m.group(1))
-                    _today = int(_m.group(2))
-                    _max_day = int(_m.group(3))
-
-                    _c1, _c2 = st.columns(2)
-                    with _c1:
-                        st.metric("Calls hoje", f"{_today} / {_max_day}")
-                        st.progress(min(_today / _max_day, 1.0))
-                    with _c2:
-                        st.metric("Calls último minuto", f"{_cpm} / 10")
-                        st.progress(min(_cpm / 10, 1.0))
-                else:
-                    st.info("Aguardando primeira chamada ao Gemini...")
-            else:
-                st.info("Nenhuma chamada ao Gemini registrada ainda.")
-
-            # Detecta cooldown ativo nos logs
-            _cooldown_line = ""
-            for _l in reversed(_lines[-50:]):
-                if "Rate limit da API" in _l or "cooldown" in _l.lower():
-                    _cooldown_line = _l.strip()
-                    break
-            if _cooldown_line:
-                st.warning(f"⏳ {_cooldown_line.split(' - ')[-1]}")
+            from services.bot_metrics import load_metrics, histogram_quantile
+            _metrics_instance = _instances[0]["evolution_instance_name"]
+            if len(_instances) > 1:
+                _metrics_instance = st.selectbox("Instância", [i["evolution_instance_name"] for i in _instances],
+                                                 key="metrics_instance")
+            _m = load_metrics(_metrics_instance)
+        except Exception as e:
+            _m = None
+            st.caption(f"Métricas do bot indisponíveis: {e}")
+
+        if _m:
+            _cnt, _gg, _hist = _m["counters"], _m["gauges"], _m["histograms"]
+
+            def _ms(name, q):
+                v = histogram_quantile(_hist.get(name), q)
+                return f"{v * 1000:.0f} ms" if v is not None else "—"
+
+            st.subheader("📈 Métricas do Motor")
+            _m1, _m2, _m3 = st.columns(3)
+            with _m1:
+                st.metric("Polls", _cnt.get("polls", 0), help=f"Latência p95: {_ms('poll_latency_seconds', 0.95)}")
+                st.metric("Mensagens processadas", _cnt.get("messages_processed", 0),
+                          help=f"Duplicadas ignoradas: {_cnt.get('dedup_memory_hits', 0)} (memória) / "
+                               f"{_cnt.get('dedup_db_hits', 0)} (banco); spam: {_cnt.get('spam_filtered', 0)}")
+            with _m2:
+                st.metric("Gemini p50 / p95", f"{_ms('gemini_latency_seconds', 0.5)} / {_ms('gemini_latency_seconds', 0.95)}",
+                          help=f"{_cnt.get('gemini_calls', 0)} chamadas, {_cnt.get('gemini_errors', 0)} erros, "
+                               f"{_cnt.get('gemini_rate_limited', 0)} rate limits")
+                st.metric("Cache de respostas", f"{_gg.get('cache_hit_rate', 0):.1f}%",
+                          help="Mensagens respondidas sem chamar o Gemini")
+                _prompts = _cnt.get("prompts", 0)
+                st.metric("Prompt médio", f"~{_cnt.get('prompt_tokens', 0) / _prompts:.0f} tokens" if _prompts else "—",
+                          help=f"Último: ~{_gg.get('last_prompt_tokens', 0)} tokens · "
+                               f"{_cnt.get('summaries', 0)} resumo(s) de conversa gerados")
+            with _m3:
+                st.metric("Entrega p95", _ms("delivery_latency_seconds", 0.95),
+                          help=f"Da resposta pronta até a entrega (HTTP p95: {_ms('send_latency_seconds', 0.95)}). "
+                               f"{_cnt.get('replies_sent', 0)} respostas enviadas, {_cnt.get('send_errors', 0)} falhas")
+                st.metric("Fila de envio", _gg.get("outbound_queue", 0),
+                          help="Respostas aguardando envio pelo WhatsApp (ritmo/retry)")
+                st.metric("Fila de gravação", _gg.get("chat_write_queue", 0),
+                          help=f"Turnos aguardando o cliente parar de digitar: {_gg.get('open_turns', 0)}")
+            _age = (datetime.datetime.now() - _m["updated_at"]).total_seconds()
+            st.caption(f"Atualizado há {_age:.0f}s.")
+        else:
+            st.caption("Sem métricas publicadas ainda. Inicie o bot primeiro.")
 
-        except FileNotFoundError:
-            st.caption("bot.log não encontrado. Inicie o bot primeiro.")
+        # Backlog de respostas adiadas por falta de cota
+        try:
+            from services.pending_replies import PendingReplyQueue
+            _backlog = PendingReplyQueue().counts()
+            _b1, _b2 = st.columns(2)
+            with _b1:
+                st.metric("Respostas adiadas", _backlog["pending"],
+                          help="Mensagens aguardando cota do Gemini para serem respondidas")
+            with _b2:
+                st.metric("Expiradas (7 dias)", _backlog["expired"])
+            if _backlog["pending"]:
+                st.caption(f"Mais antiga aguardando há {_backlog['oldest_pending_seconds'] / 60:.0f} min.")
+        except Exception as e:
+            st.caption(f"Fila de respostas adiadas indisponível: {e}")
 
 
     with col_conf:
@@ -288,6 +515,129 @@ with tab_bot:
                     json.dump(config, f, indent=4)
                 st.success("Configurações salvas!")
 
+            # Vários números no mesmo motor: cada linha sobrescreve os campos acima para aquele número
+            st.markdown("**Instâncias (vários números de WhatsApp)**")
+            st.caption("Deixe vazio para usar só a instância acima. Campos em branco herdam os valores acima.")
+            _instances_df = pd.DataFrame(config.get("instances") or [],
+                                         columns=["evolution_instance_name", "evolution_api_url",
+                                                  "evolution_api_token", "active"])
+            edited_instances = st.data_editor(
+                _instances_df, num_rows="dynamic", hide_index=True, key="instances_editor", use_container_width=True,
+                column_config={
+                    "evolution_instance_name": st.column_config.TextColumn("Instância", required=True),
+                    "evolution_api_url": st.column_config.TextColumn("URL (opcional)"),
+                    "evolution_api_token": st.column_config.TextColumn("Token (opcional)"),
+                    "active": st.column_config.CheckboxColumn("Ativa", default=True),
+                },
+            )
+            if st.button("Salvar Instâncias"):
+                _entries = []
+                for _row in edited_instances.to_dict("records"):
+                    _entry = {k: v for k, v in _row.items() if isinstance(v, bool) or (isinstance(v, str) and v.strip())}
+                    if _entry.get("evolution_instance_name"):
+                        _entries.append(_entry)
+                if _entries:
+                    config["instances"] = _entries
+                else:
+                    config.pop("instances", None)
+                with open(CONFIG_FILE, 'w') as f:
+                    json.dump(config, f, indent=4)
+                st.success("Instâncias salvas! O motor inicia/para os números em alguns segundos.")
+
+        with st.expander("📚 FAQ do Bot (respostas sem gastar cota)"):
+            from services.answer_cache import load_faq, save_faq
+            st.caption("Perguntas frequentes respondidas direto, sem chamar o Gemini. "
+                       "A correspondência ignora acentos, pontuação e pequenas variações.")
+            faq_df = pd.DataFrame(load_faq(), columns=["pergunta", "resposta"])
+            edited_faq = st.data_editor(faq_df, num_rows="dynamic", hide_index=True, key="faq_editor",
+                                        use_container_width=True)
+            if st.button("Salvar FAQ"):
+                save_faq(edited_faq.dropna().itertuples(index=False, name=None))
+                st.success("FAQ salvo! O bot passa a usá-lo na próxima mensagem.")
+
+    # --- Campanhas para clientes que aceitaram receber atualizações ---
+    st.markdown("---")
+    st.subheader("📣 Campanhas")
+    from services import campaign_engine
+
+    col_new_campaign, col_campaigns = st.columns([1, 2])
+
+    with col_new_campaign:
+        with st.form("nova_campanha", clear_on_submit=True):
+            campaign_name = st.text_input("Nome da campanha")
+            campaign_template = st.text_area(
+                "Mensagem", placeholder="Olá {nome}, temos novidades para você!",
+                help="Campos disponíveis: {nome} (primeiro nome), {nome_completo} e {contato} (nome do contato principal).",
+            )
+            _r1, _r2 = st.columns(2)
+            with _r1:
+                campaign_rate = st.number_input("Envios por minuto", min_value=1, max_value=60, value=20,
+                                                help="Teto global: vale para todas as réplicas do bot juntas.")
+            with _r2:
+                campaign_concurrency = st.number_input("Envios simultâneos", min_value=1, max_value=8, value=2)
+            if st.form_submit_button("Criar campanha"):
+                try:
+                    campaign_engine.create_campaign(campaign_name, campaign_template,
+                                                    rate_per_minute=campaign_rate, concurrency=campaign_concurrency)
+                    st.success("Campanha criada como rascunho. Clique em ▶️ para iniciar.")
+                except ValueError as e:
+                    st.error(str(e))
+                except Exception as e:
+                    st.error(f"Erro ao criar campanha: {e}")
+        try:
+            st.caption(f"{campaign_engine.count_recipients()} clientes com opt-in e telefone principal.")
+        except Exception as e:
+            st.caption(f"Contagem de destinatários indisponível: {e}")
+
+    with col_campaigns:
+        # Fragmento com auto-refresh: acompanha o envio ao vivo sem recarregar a página toda
+        @st.fragment(run_every=5)
+        def campaigns_panel():
+            try:
+                campaign_list = campaign_engine.list_campaigns(limit=10)
+            except Exception as e:
+                st.error(f"Erro ao carregar campanhas: {e}")
+                return
+            if not campaign_list:
+                st.info("Nenhuma campanha criada ainda.")
+                return
+
+            status_labels = {"draft": "📝 Rascunho", "running": "🟢 Enviando", "paused": "⏸️ Pausada",
+                             "done": "✅ Concluída", "cancelled": "🚫 Cancelada"}
+            for campaign in campaign_list:
+                with st.container(border=True):
+                    _t, _a = st.columns([3, 2])
+                    with _t:
+                        st.markdown(f"**{campaign['name']}** · {status_labels.get(campaign['status'], campaign['status'])}")
+                    with _a:
+                        _b1, _b2 = st.columns(2)
+                        if campaign["status"] in ("draft", "paused"):
+                            if _b1.button("▶️", key=f"campaign_run_{campaign['id']}", help="Iniciar / retomar"):
+                                campaign_engine.set_campaign_status(campaign["id"], "running")
+                                st.rerun(scope="fragment")
+                        elif campaign["status"] == "running":
+                            if _b1.button("⏸️", key=f"campaign_pause_{campaign['id']}", help="Pausar"):
+                                campaign_engine.set_campaign_status(campaign["id"], "paused")
+                                st.rerun(scope="fragment")
+                        if campaign["status"] in ("draft", "running", "paused"):
+                            if _b2.button("🚫", key=f"campaign_cancel_{campaign['id']}", help="Cancelar"):
+                                campaign_engine.set_campaign_status(campaign["id"], "cancelled")
+                                st.rerun(scope="fragment")
+
+                    if campaign["total"] is not None:
+                        st.progress(campaign["progress"],
+                                    text=f"{campaign['processed']} de {campaign['total']} clientes")
+                    _c1, _c2, _c3, _c4 = st.columns(4)
+                    _c1.metric("Enviadas", campaign["sent"])
+                    _c2.metric("Falhas", campaign["failed"])
+                    _c3.metric("Vazão", f"{campaign['throughput_per_minute']:.1f}/min")
+                    _eta = campaign["eta_seconds"]
+                    _c4.metric("Previsão", f"{_eta / 60:.0f} min" if _eta is not None and campaign["status"] == "running" else "—")
+                    if campaign["last_error"]:
+                        st.warning(campaign["last_error"])
+
+        campaigns_panel()
+
     st.markdown("---")
     
     # Visualizador de Logs e Histórico
@@ -298,14 +648,10 @@ with tab_bot:
         if st.button("Atualizar Logs"):
             st.rerun()
         
-        log_content = "Nenhum log encontrado."
-        try:
-            with open("bot.log", "r", encoding="utf-8") as f:
-                lines = f.readlines()
-                log_content = "".join(lines[-20:]) # Últimas 20 linhas
-        except FileNotFoundError:
-            pass
-            
+        from services.bot_logging import tail_lines
+        log_lines = tail_lines("bot.log", 20)  # Últimas 20 linhas, lidas do fim do arquivo
+        log_content = "\n".join(log_lines) if log_lines else "Nenhum log encontrado."
+
         st.code(log_content, language="text")
 
     with col_chat:
@@ -4,9 +4,12 @@ import datetime
 
 import math
 import logging
+import functools
 import urllib.parse
 import integration_services as services
 from services.customer_service import CustomerService, DatabaseError, DuplicateEntryError
+from services.customer_detail_cache import CustomerDetailCache, invalidate_all
+from services.change_notifications import CUSTOMER_ENTITIES, get_change_listener
 import base64
 
 # Inicializa o serviço
@@ -35,6 +38,72 @@ def load_whatsapp_icon_b64():
 
 WHATSAPP_ICON = load_whatsapp_icon_b64()
 
+
+@functools.lru_cache(maxsize=512)
+def whatsapp_link_html(phone, div_style):
+    """Markup do ícone do WhatsApp para um telefone (o base64 do ícone não é remontado a cada rerun)."""
+    whatsapp_url = validators.get_whatsapp_url(validators.unformat_whatsapp(phone))
+    return f"""
+        <div style="{div_style}">
+            <a href="{whatsapp_url}" target="_blank">
+                <img src="data:image/png;base64,{WHATSAPP_ICON}" width="25">
+            </a>
+        </div>
+    """
+
+
+# --- Dados com cache (compartilhados entre sessões) ---
+# Qualquer escrita no banco (outra sessão, bot, restauração) chega pelo aviso de
+# mudanças e limpa estes caches na hora (on_data_changed). TTLs longos só depois
+# que o aviso comprovadamente chega; até lá, os TTLs curtos de sempre.
+change_listener = get_change_listener()
+
+
+@st.cache_data(ttl=change_listener.cache_ttl(300, 3600), show_spinner=False)
+def load_unique_states():
+    return customer_service.get_unique_states()
+
+
+@st.cache_data(ttl=change_listener.cache_ttl(60, 600), show_spinner=False)
+def load_customer_count(search_query, state_filter):
+    return customer_service.count_customers(search_query, state_filter)
+
+
+@st.cache_data(ttl=change_listener.cache_ttl(60, 600), show_spinner=False)
+def load_grid_page(search_query, state_filter, page_number, page_size, columns):
+    return customer_service.get_customer_grid_data(search_query, state_filter, page_number, page_size, columns=list(columns))
+
+
+def clear_customer_caches(customer_id):
+    detail_cache.invalidate(customer_id)
+    load_unique_states.clear()
+    load_customer_count.clear()
+    load_grid_page.clear()
+
+
+def on_data_changed(changes):
+    """Chamado pela thread de aviso de mudanças com a lista de (entidade, id) alterados."""
+    customer_ids = {customer_id for entity, customer_id in changes if entity is None or entity in CUSTOMER_ENTITIES}
+    if not customer_ids:
+        return
+    if None in customer_ids:
+        invalidate_all()
+    else:
+        for customer_id in customer_ids:
+            invalidate_all(customer_id)
+    load_unique_states.clear()
+    load_customer_count.clear()
+    load_grid_page.clear()
+
+
+change_listener.subscribe("banco_de_dados", on_data_changed)
+
+# Detalhes da página visível do grid (e da próxima) carregados em segundo plano
+if 'customer_detail_cache' not in st.session_state:
+    st.session_state.customer_detail_cache = CustomerDetailCache(customer_service.get_customer_details_batch)
+detail_cache = st.session_state.customer_detail_cache
+detail_cache.ttl_seconds = change_listener.cache_ttl(300, 1800)
+
 # --- Lógica de Roteamento via URL ---
 if "id" in st.query_params:
     try:
@@ -74,15 +143,8 @@ def editable_field(label: str, value: any, key: str, is_date=False, is_text_area
             unformatted_value = validators.unformat_whatsapp(display_value)
             st.session_state.edited_data[key] = st.text_input(label, value=unformatted_value, key=f"edit_{key}", help=help_text)
             if WHATSAPP_ICON and unformatted_value:
-                 whatsapp_url = validators.get_whatsapp_url(unformatted_value)
                  st.markdown(
-                     f"""
-                     <div style="text-align: right; margin-top: -30px; margin-bottom: 20px;">
-                         <a href="{whatsapp_url}" target="_blank">
-                             <img src="data:image/png;base64,{WHATSAPP_ICON}" width="25">
-                         </a>
-                     </div>
-                     """, 
+                     whatsapp_link_html(unformatted_value, "text-align: right; margin-top: -30px; margin-bottom: 20px;"),
                      unsafe_allow_html=True
                  )
         else:
@@ -95,18 +157,7 @@ def editable_field(label: str, value: any, key: str, is_date=False, is_text_area
                 display_field_with_copy(label, value, is_date, is_text_area)
             with col_icon:
                 if value and WHATSAPP_ICON:
-                    unformatted_phone = validators.unformat_whatsapp(value)
-                    whatsapp_url = validators.get_whatsapp_url(unformatted_phone)
-                    st.markdown(
-                        f"""
-                        <div style="padding-top: 45px;">
-                            <a href="{whatsapp_url}" target="_blank">
-                                <img src="data:image/png;base64,{WHATSAPP_ICON}" width="25">
-                            </a>
-                        </div>
-                        """, 
-                        unsafe_allow_html=True
-                    )
+                    st.markdown(whatsapp_link_html(value, "padding-top: 45px;"), unsafe_allow_html=True)
         else:
             display_field_with_copy(label, value, is_date, is_text_area)
 
@@ -127,7 +178,7 @@ with st.sidebar:
     search_query = st.text_input("Buscar por Nome ou CPF")
     
     try:
-        all_states_list = customer_service.get_unique_states()
+        all_states_list = load_unique_states()
         state_options = ["Todos"] + all_states_list
         state_filter = st.selectbox("Filtrar por Estado", options=state_options)
     except Exception:
@@ -172,18 +223,26 @@ with st.sidebar:
     selected_columns = [k for k, v in COLUMN_OPTIONS.items() if v in selected_col_labels]
 
     st.markdown("---")
-    page_size = st.selectbox("Itens por página", options=[10, 25, 50, 100], index=0)
-    total_records = customer_service.count_customers(search_query, state_filter)
-    total_pages = math.ceil(total_records / page_size) if total_records > 0 else 1
-    page_number = st.number_input('Página', min_value=1, max_value=total_pages, value=1, step=1)
-    st.markdown("---")
 
 # --- Functions for Displaying Content ---
+# Grid e detalhes são fragments: paginar, selecionar ou digitar na edição só
+# reexecuta o próprio fragment. Trocar de tela (abrir/fechar/salvar) usa
+# st.rerun() do app inteiro; os filtros da barra lateral sempre afetam o grid.
+
+def start_editing(customer):
+    st.session_state.edit_mode = True
+    st.session_state.edited_data = customer.copy()
 
+
+def set_confirming_delete(value):
+    st.session_state.confirming_delete = value
+
+
+@st.fragment
 def show_customer_details(customer_id):
     try:
-        customer = customer_service.get_customer_details(customer_id)
-    except DatabaseError as e:
+        customer = detail_cache.get(customer_id)
+    except Exception as e:
         st.error(f"Erro ao buscar dados do cliente: {e}")
         customer = None
 
@@ -242,6 +301,7 @@ def show_customer_details(customer_id):
                         st.session_state.edited_data['longitude'] = longitude
 
                         customer_service.update_customer(customer_id, st.session_state.edited_data)
+                        clear_customer_caches(customer_id)
                         st.session_state['db_status'] = {'success': True, 'message': "Cliente atualizado com sucesso!"}
                         
                         st.session_state.edit_mode = False
@@ -253,10 +313,8 @@ def show_customer_details(customer_id):
                         st.rerun()
 
             else:
-                if st.button("✏️ Editar Cliente", use_container_width=True):
-                    st.session_state.edit_mode = True
-                    st.session_state.edited_data = customer.copy()
-                    st.rerun()
+                # Callbacks rodam antes do rerun do fragment: sem st.rerun() extra
+                st.button("✏️ Editar Cliente", use_container_width=True, on_click=start_editing, args=(customer,))
 
         with col_delete:
             # Initialize confirmation state
@@ -273,6 +331,7 @@ def show_customer_details(customer_id):
                         if st.button("Sim, excluir permanentemente", type="primary", use_container_width=True):
                             try:
                                 customer_service.delete_customer(customer_id)
+                                clear_customer_caches(customer_id)
                                 st.session_state['db_status'] = {'success': True, 'message': "Cliente excluído com sucesso!"}
                                 st.session_state.confirming_delete = False
                                 del st.session_state.selected_customer_id
@@ -282,13 +341,9 @@ def show_customer_details(customer_id):
                                 st.session_state.confirming_delete = False
                                 st.rerun()
                     with c2:
-                        if st.button("Cancelar", use_container_width=True):
-                            st.session_state.confirming_delete = False
-                            st.rerun()
+                        st.button("Cancelar", use_container_width=True, on_click=set_confirming_delete, args=(False,))
                 else:
-                    if st.button("🗑️ Excluir Cliente", use_container_width=True):
-                        st.session_state.confirming_delete = True
-                        st.rerun()
+                    st.button("🗑️ Excluir Cliente", use_container_width=True, on_click=set_confirming_delete, args=(True,))
 
         st.markdown("---")
 
@@ -350,8 +405,23 @@ def show_customer_details(customer_id):
             del st.session_state.selected_customer_id
             st.rerun()
 
-def show_customer_grid(search_query, state_filter, page_number, page_size, total_records, total_pages, selected_columns, column_labels_map):
-    grid_data = customer_service.get_customer_grid_data(search_query, state_filter, page_number, page_size)
+@st.fragment
+def show_customer_grid(search_query, state_filter, selected_columns, column_labels_map):
+    # Filtro novo volta para a primeira página
+    if st.session_state.get('grid_filters') != (search_query, state_filter):
+        st.session_state.grid_filters = (search_query, state_filter)
+        st.session_state.grid_page = 1
+
+    total_records = load_customer_count(search_query, state_filter)
+    col_size, col_page = st.columns(2)
+    with col_size:
+        page_size = st.selectbox("Itens por página", options=[10, 25, 50, 100], index=0, key="grid_page_size")
+    total_pages = math.ceil(total_records / page_size) if total_records > 0 else 1
+    st.session_state.grid_page = min(st.session_state.get('grid_page', 1), total_pages)
+    with col_page:
+        page_number = st.number_input('Página', min_value=1, max_value=total_pages, step=1, key="grid_page")
+
+    grid_data = load_grid_page(search_query, state_filter, page_number, page_size, tuple(selected_columns))
     df_page = pd.DataFrame(grid_data)
     if not df_page.empty:
         st.info("Selecione um cliente na tabela para ver seus detalhes completos.")
@@ -370,11 +440,19 @@ def show_customer_grid(search_query, state_filter, page_number, page_size, total
                 column_config[col] = column_labels_map.get(col, col)
 
         st.dataframe(
-            df_page[[col for col in selected_columns if col in df_page.columns]],
+            df_page.reindex(columns=selected_columns),
             key="customer_grid", on_select="rerun", selection_mode="single-row",
             hide_index=True, column_config=column_config, width='stretch'
         )
         st.markdown(f"Mostrando **{len(df_page)}** de **{total_records}** registros. Página **{page_number}** de **{total_pages}**.")
+
+        # Abrir um cliente desta página (ou da próxima) não precisa ir ao banco
+        detail_cache.prefetch(df_page['id'].tolist())
+        if page_number < total_pages:
+            detail_cache.prefetch(lambda: [
+                row['id'] for row in customer_service.get_customer_grid_data(
+                    search_query, state_filter, page_number + 1, page_size, columns=['id'])
+            ])
         
         # Check if selection exists and is not empty
         selection = st.session_state.get('customer_grid', {}).get('selection', {}).get('rows', [])
@@ -392,4 +470,4 @@ def show_customer_grid(search_query, state_filter, page_number, page_size, total
 if "selected_customer_id" in st.session_state and st.session_state.selected_customer_id:
     show_customer_details(st.session_state.selected_customer_id)
 else:
-    show_customer_grid(search_query, state_filter, page_number, page_size, total_records, total_pages, selected_columns, COLUMN_OPTIONS)
\ No newline at end of file
+    show_customer_grid(search_query, state_filter, selected_columns, COLUMN_OPTIONS)
\ No newline at end of file
@@ -1,13 +1,75 @@
 from typing import List, Optional
 from sqlmodel import Session, select
 from sqlalchemy.orm import selectinload
-from sqlalchemy import text
+from sqlalchemy import case, inspect, text
+from sqlalchemy import select as sa_select
 from models import Cliente, Contato, Endereco, AuditLog
 from repositories.base import BaseRepository
+from services.completeness import COMPLETENESS_FIELDS, missing_filter
 import json
 import datetime
 import pandas as pd
 
+# Rollup opcional (dia DATE, novos INTEGER) com os cadastros por dia; sem ela a
+# série é calculada direto de clientes
+ROLLUP_TABLE = "clientes_novos_por_dia"
+_rollup_available = {}
+
+COMPLETENESS_COLUMNS = {f"missing_{field}" for field in COMPLETENESS_FIELDS}
+
+# Coluna do grid -> (tabela, coluna). Contato/endereço são o principal (ou o
+# primeiro cadastrado); campos marcados com `principal` só valem para o principal.
+GRID_COLUMN_SOURCES = {
+    "id": ("cliente", "id"),
+    "nome_completo": ("cliente", "nome_completo"),
+    "tipo_documento": ("cliente", "tipo_documento"),
+    "cpf": ("cliente", "cpf"),
+    "cnpj": ("cliente", "cnpj"),
+    "data_nascimento": ("cliente", "data_nascimento"),
+    "data_cadastro": ("cliente", "data_cadastro"),
+    "observacao": ("cliente", "observacao"),
+    "telefone1": ("contato", "telefone"),
+    "link_wpp_1": ("contato", "telefone"),
+    "contato1": ("contato", "nome_contato", "principal"),
+    "email": ("contato", "email_contato", "principal"),
+    "cargo": ("contato", "cargo_contato", "principal"),
+    "endereco": ("endereco", "logradouro"),
+    "numero": ("endereco", "numero"),
+    "complemento": ("endereco", "complemento"),
+    "bairro": ("endereco", "bairro"),
+    "cidade": ("endereco", "cidade"),
+    "estado": ("endereco", "estado"),
+    "cep": ("endereco", "cep"),
+}
+
+_TIMESERIES_FREQ = {'D': 'D', 'W': 'W-MON', 'M': 'MS'}
+
+
+def _bucket_start(day, period: str) -> pd.Timestamp:
+    day = pd.Timestamp(day).normalize()
+    if period == 'W':
+        return day - pd.Timedelta(days=day.weekday())
+    if period == 'D':
+        return day
+    return day.replace(day=1)
+
+
+def fill_timeseries_gaps(series: pd.DataFrame, start_date, end_date, period: str = 'M', first_day=None) -> pd.DataFrame:
+    """
+    Completa a série com zero nos períodos sem cadastro, do início do período
+    de `start_date` (ou do primeiro cadastro da base, se posterior) até `end_date`.
+    """
+    if series.empty:
+        return pd.DataFrame({'time_period': pd.Series(dtype='datetime64[ns]'), 'count': pd.Series(dtype='int64')})
+    start = _bucket_start(start_date, period)
+    if first_day is not None and not pd.isna(first_day):
+        start = max(start, _bucket_start(first_day, period))
+    calendar = pd.date_range(start, _bucket_start(end_date, period), freq=_TIMESERIES_FREQ.get(period, 'MS'))
+    counts = series.assign(time_period=pd.to_datetime(series['time_period'])).groupby('time_period')['count'].sum()
+    return (counts.reindex(calendar, fill_value=0).astype('int64')
+            .rename_axis('time_period').reset_index())
+
+
 class CustomerRepository(BaseRepository[Cliente]):
     def __init__(self, session: Session):
         super().__init__(session, Cliente)
@@ -20,6 +82,16 @@ class CustomerRepository(BaseRepository[Cliente]):
         ).where(Cliente.id == id)
         return self.session.exec(statement).first()
 
+    def get_many(self, ids: List[int]) -> List[Cliente]:
+        """Vários clientes com contatos e endereços (mesmo eager loading de `get`)."""
+        if not ids:
+            return []
+        statement = select(Cliente).options(
+            selectinload(Cliente.contatos),
+            selectinload(Cliente.enderecos)
+        ).where(Cliente.id.in_(ids))
+        return self.session.exec(statement).all()
+
     def create_customer(self, cliente: Cliente, contatos: List[Contato], enderecos: List[Endereco]) -> Cliente:
         """
         Cria um cliente com seus contatos e endereços em uma transação única.
@@ -57,7 +129,8 @@ class CustomerRepository(BaseRepository[Cliente]):
             # para evitar ValueError quando campos de UI (como 'contato1') são passados
             cliente_fields = self.model.__fields__.keys()
             for key, value in data.items():
-                if key in cliente_fields and key != 'id':
+                # Os flags de completude são recalculados pelo banco, nunca vêm da UI
+                if key in cliente_fields and key != 'id' and key not in COMPLETENESS_COLUMNS:
                     setattr(cliente, key, value)
             
             self.session.add(cliente)
@@ -180,6 +253,61 @@ class CustomerRepository(BaseRepository[Cliente]):
             
         return self.session.exec(statement).one()
 
+    def list_customer_rows(self, columns: List[str], search_query: str = None, state_filter: str = None,
+                           offset: int = 0, limit: int = 10) -> List[dict]:
+        """
+        Página do grid só com as `columns` pedidas (valores crus, sem formatação):
+        contatos/endereços só entram no JOIN se alguma coluna deles for pedida.
+        """
+        cl = Cliente.__table__
+        contato = Contato.__table__.alias("co")
+        endereco = Endereco.__table__.alias("en")
+        aliases = {"cliente": cl, "contato": contato, "endereco": endereco}
+
+        projection, joined = [cl.c.id.label("id")], set()
+        for name in dict.fromkeys(columns):
+            source = GRID_COLUMN_SOURCES.get(name)
+            if not source or name == "id":
+                continue
+            table, column = aliases[source[0]], aliases[source[0]].c[source[1]]
+            if len(source) > 2:
+                column = case((table.c.tipo_contato == 'Principal', column))
+            projection.append(column.label(name))
+            joined.add(source[0])
+
+        def first_related(table, type_column):
+            # Um único contato/endereço por cliente (principal primeiro), sem DISTINCT
+            return (
+                sa_select(table.c.id)
+                .where(table.c.cliente_id == cl.c.id)
+                .order_by(case((table.c[type_column] == 'Principal', 0), else_=1), table.c.id)
+                .limit(1).correlate(cl).scalar_subquery()
+            )
+
+        statement = sa_select(*projection).select_from(cl)
+        if "contato" in joined:
+            statement = statement.outerjoin(contato, contato.c.id == first_related(Contato.__table__, "tipo_contato"))
+        if "endereco" in joined:
+            statement = statement.outerjoin(endereco, endereco.c.id == first_related(Endereco.__table__, "tipo_endereco"))
+
+        if state_filter and state_filter != "Todos":
+            statement = statement.where(
+                sa_select(Endereco.__table__.c.id).where(
+                    Endereco.__table__.c.cliente_id == cl.c.id,
+                    Endereco.__table__.c.tipo_endereco == 'Principal',
+                    Endereco.__table__.c.estado == state_filter,
+                ).correlate(cl).exists()
+            )
+        if search_query:
+            statement = statement.where(
+                cl.c.nome_completo.ilike(f"%{search_query}%") |
+                cl.c.cpf.ilike(f"%{search_query}%") |
+                cl.c.cnpj.ilike(f"%{search_query}%")
+            )
+
+        statement = statement.order_by(cl.c.id).offset(offset).limit(limit)
+        return [dict(row) for row in self.session.connection().execute(statement).mappings()]
+
     def get_unique_states(self) -> List[str]:
         """Retorna lista de estados únicos dos endereços principais."""
         query = text("""
@@ -190,24 +318,171 @@ class CustomerRepository(BaseRepository[Cliente]):
         """)
         return pd.read_sql_query(query, self.session.connection())['estado'].tolist()
 
+    def _bucket_expression(self, period: str, column: str = "data_cadastro") -> str:
+        """Início do dia/semana (segunda)/mês de `column`, como date_trunc, no dialeto da sessão."""
+        if self.session.get_bind().dialect.name == "sqlite":
+            if period == 'D':
+                return f"date({column})"
+            if period == 'W':
+                return f"date({column}, '-' || ((CAST(strftime('%w', {column}) AS INTEGER) + 6) % 7) || ' days')"
+            return f"date({column}, 'start of month')"
+        unit = {'D': 'day', 'W': 'week'}.get(period, 'month')
+        return f"CAST(DATE_TRUNC('{unit}', {column}) AS DATE)"
+
+    def _has_rollup(self) -> bool:
+        bind = self.session.get_bind()
+        if bind not in _rollup_available:
+            _rollup_available[bind] = inspect(bind).has_table(ROLLUP_TABLE)
+        return _rollup_available[bind]
+
+    def _series_query(self, period: str) -> str:
+        """
+        Novos clientes por período num intervalo semiaberto (range scan no índice
+        de data_cadastro). Usa a tabela de rollup diário quando ela existe.
+        """
+        if self._has_rollup():
+            return f"""
+                SELECT {self._bucket_expression(period, "dia")} as time_period, SUM(novos) as count
+                FROM {ROLLUP_TABLE}
+                WHERE dia >= :start_date AND dia < :end_exclusive
+                GROUP BY 1
+            """
+        return f"""
+            SELECT {self._bucket_expression(period)} as time_period, COUNT(*) as count
+            FROM clientes
+            WHERE data_cadastro >= :start_date AND data_cadastro < :end_exclusive
+            GROUP BY 1
+        """
+
+    @staticmethod
+    def _series_params(start_date, end_date) -> dict:
+        return {"start_date": start_date, "end_date": end_date,
+                "end_exclusive": end_date + datetime.timedelta(days=1)}
+
     def get_new_customers_timeseries(self, start_date, end_date, period='M') -> pd.DataFrame:
-        if period == 'D':
-            date_format = 'YYYY-MM-DD'
-        elif period == 'W':
-            date_format = 'YYYY-IW'
-        else:
-            date_format = 'YYYY-MM'
-            
         query = text(f"""
-            SELECT 
-                TO_CHAR(data_cadastro, '{date_format}') as time_period,
-                COUNT(id) as count
-            FROM clientes
-            WHERE data_cadastro BETWEEN :start_date AND :end_date
-            GROUP BY time_period
-            ORDER BY time_period;
+            SELECT series.time_period, series.count,
+                   (SELECT MIN(data_cadastro) FROM clientes) as first_day
+            FROM ({self._series_query(period)}) series
+            ORDER BY series.time_period;
         """)
-        return pd.read_sql_query(query, self.session.connection(), params={"start_date": start_date, "end_date": end_date})
+        df = pd.read_sql_query(query, self.session.connection(), params=self._series_params(start_date, end_date))
+        first_day = df['first_day'].iloc[0] if not df.empty else None
+        return fill_timeseries_gaps(df, start_date, end_date, period, first_day)
+
+    def get_dashboard_snapshot(self, start_date, end_date, period='M') -> dict:
+        """
+        KPIs da Visão Geral (total, novos no período, completude) e a série de
+        novos clientes numa única consulta: cada linha da série traz os KPIs.
+        """
+        query = text(f"""
+            WITH kpi AS (
+                SELECT
+                    COUNT(*) as total_customers,
+                    COUNT(CASE WHEN cl.data_cadastro BETWEEN :start_date AND :end_date THEN 1 END) as new_in_period,
+                    COUNT(CASE WHEN NOT cl.missing_email THEN 1 END) as with_email,
+                    COUNT(CASE WHEN NOT cl.missing_phone THEN 1 END) as with_phone,
+                    COUNT(CASE WHEN NOT cl.missing_cep THEN 1 END) as with_cep,
+                    MIN(cl.data_cadastro) as first_day
+                FROM clientes cl
+            ),
+            series AS ({self._series_query(period)})
+            SELECT kpi.*, series.time_period, series.count
+            FROM kpi LEFT JOIN series ON 1 = 1
+            ORDER BY series.time_period;
+        """)
+        df = pd.read_sql_query(query, self.session.connection(), params=self._series_params(start_date, end_date))
+
+        first = df.iloc[0] if not df.empty else None
+        total = int(first['total_customers']) if first is not None else 0
+        snapshot = {
+            'total_customers': total,
+            'new_in_period': int(first['new_in_period']) if first is not None else 0,
+            'email_completeness': 0,
+            'phone_completeness': 0,
+            'cep_completeness': 0,
+            'timeseries': fill_timeseries_gaps(
+                df[df['time_period'].notna()], start_date, end_date, period,
+                first['first_day'] if first is not None else None,
+            ),
+        }
+        if total:
+            snapshot['email_completeness'] = float(first['with_email']) / total * 100
+            snapshot['phone_completeness'] = float(first['with_phone']) / total * 100
+            snapshot['cep_completeness'] = float(first['with_cep']) / total * 100
+        return snapshot
+
+    def _floor_expression(self, expression: str) -> str:
+        """FLOOR portátil (o SQLite nem sempre tem as funções matemáticas)."""
+        if self.session.get_bind().dialect.name == "sqlite":
+            return f"(CAST({expression} AS INTEGER) - ({expression} < CAST({expression} AS INTEGER)))"
+        return f"FLOOR({expression})"
+
+    def _location_filter(self, start_date=None, end_date=None) -> tuple:
+        """WHERE comum do mapa: endereços geocodificados, opcionalmente pelo cadastro do cliente."""
+        where = ["en.latitude IS NOT NULL", "en.longitude IS NOT NULL"]
+        params = {}
+        if start_date is not None and end_date is not None:
+            where.append("cl.data_cadastro BETWEEN :start_date AND :end_date")
+            params.update(start_date=start_date, end_date=end_date)
+        return " AND ".join(where), params
+
+    def get_location_clusters(self, cell_size: float, start_date=None, end_date=None) -> pd.DataFrame:
+        """
+        Agrupa os endereços numa grade de `cell_size` graus e devolve uma linha
+        por célula ocupada: centróide (média das coordenadas) e quantidade.
+        """
+        where, params = self._location_filter(start_date, end_date)
+        params["cell_size"] = cell_size
+        query = text(f"""
+            SELECT
+                AVG(en.latitude) as latitude,
+                AVG(en.longitude) as longitude,
+                COUNT(*) as count
+            FROM clientes cl
+            JOIN enderecos en ON cl.id = en.cliente_id
+            WHERE {where}
+            GROUP BY {self._floor_expression("en.latitude / :cell_size")}, {self._floor_expression("en.longitude / :cell_size")}
+            ORDER BY count DESC;
+        """)
+        return pd.read_sql_query(query, self.session.connection(), params=params)
+
+    def get_customers_per_state(self, start_date=None, end_date=None) -> pd.DataFrame:
+        """Quantidade de endereços geocodificados por estado (mesmo recorte do mapa)."""
+        where, params = self._location_filter(start_date, end_date)
+        query = text(f"""
+            SELECT en.estado as estado, COUNT(*) as count
+            FROM clientes cl
+            JOIN enderecos en ON cl.id = en.cliente_id
+            WHERE {where} AND en.estado IS NOT NULL
+            GROUP BY en.estado
+            ORDER BY count DESC;
+        """)
+        return pd.read_sql_query(query, self.session.connection(), params=params)
+
+    def get_customers_in_box(self, box: tuple, cell_ranges: Optional[list] = None) -> pd.DataFrame:
+        """
+        Pré-filtro da busca por proximidade: endereços dentro da caixa
+        (min_lat, max_lat, min_lon, max_lon). Com `cell_ranges`, a busca passa
+        pelo índice de `geo_cell` e a latitude/longitude só refinam as bordas.
+        """
+        min_lat, max_lat, min_lon, max_lon = box
+        params = {"min_lat": min_lat, "max_lat": max_lat, "min_lon": min_lon, "max_lon": max_lon}
+        cell_filter = ""
+        if cell_ranges:
+            conditions = []
+            for i, (first, last) in enumerate(cell_ranges):
+                conditions.append(f"en.geo_cell BETWEEN :cell_start_{i} AND :cell_end_{i}")
+                params[f"cell_start_{i}"], params[f"cell_end_{i}"] = first, last
+            cell_filter = f"({' OR '.join(conditions)}) AND "
+        query = text(f"""
+            SELECT cl.id, cl.nome_completo, en.cidade, en.estado, en.latitude, en.longitude
+            FROM clientes cl
+            JOIN enderecos en ON cl.id = en.cliente_id
+            WHERE {cell_filter}en.latitude BETWEEN :min_lat AND :max_lat
+              AND en.longitude BETWEEN :min_lon AND :max_lon;
+        """)
+        return pd.read_sql_query(query, self.session.connection(), params=params)
 
     def get_customer_locations(self) -> pd.DataFrame:
         query = text("""
@@ -221,13 +496,11 @@ class CustomerRepository(BaseRepository[Cliente]):
     def get_data_health_summary(self) -> dict:
         query = text("""
             SELECT
-                COUNT(DISTINCT cl.id) as total_customers,
-                COUNT(CASE WHEN co.email_contato IS NOT NULL AND co.email_contato != '' THEN 1 END) as with_email,
-                COUNT(CASE WHEN co.telefone IS NOT NULL AND co.telefone != '' THEN 1 END) as with_phone,
-                COUNT(CASE WHEN en.cep IS NOT NULL AND en.cep != '' THEN 1 END) as with_cep
-            FROM clientes cl
-            LEFT JOIN contatos co ON cl.id = co.cliente_id AND co.tipo_contato = 'Principal'
-            LEFT JOIN enderecos en ON cl.id = en.cliente_id AND en.tipo_endereco = 'Principal';
+                COUNT(*) as total_customers,
+                COUNT(CASE WHEN NOT missing_email THEN 1 END) as with_email,
+                COUNT(CASE WHEN NOT missing_phone THEN 1 END) as with_phone,
+                COUNT(CASE WHEN NOT missing_cep THEN 1 END) as with_cep
+            FROM clientes;
         """)
         df = pd.read_sql_query(query, self.session.connection())
         if df.empty or df['total_customers'][0] == 0:
@@ -240,19 +513,35 @@ class CustomerRepository(BaseRepository[Cliente]):
         }
         return summary
 
-    def get_incomplete_customers(self) -> pd.DataFrame:
-        query = text("""
-            SELECT * FROM (
-                SELECT cl.id, cl.nome_completo, 
-                       CASE WHEN co.email_contato IS NULL OR co.email_contato = '' THEN 1 ELSE 0 END as missing_email,
-                       CASE WHEN co.telefone IS NULL OR co.telefone = '' THEN 1 ELSE 0 END as missing_phone,
-                       CASE WHEN en.cep IS NULL OR en.cep = '' THEN 1 ELSE 0 END as missing_cep
-                FROM clientes cl
-                LEFT JOIN contatos co ON cl.id = co.cliente_id AND co.tipo_contato = 'Principal'
-                LEFT JOIN enderecos en ON cl.id = en.cliente_id AND en.tipo_endereco = 'Principal'
-            ) as sub
-            WHERE missing_email = 1 OR missing_phone = 1 OR missing_cep = 1
-            ORDER BY id DESC;
+    def get_incomplete_customers(self, missing: Optional[list] = None, after_id: Optional[int] = None,
+                                 limit: Optional[int] = 50) -> pd.DataFrame:
+        """
+        Página de clientes incompletos, do id mais recente para o mais antigo
+        (keyset: a próxima página começa em `after_id` = último id desta).
+        `missing` filtra por campos faltando ('email', 'phone', 'cep').
+        """
+        where = missing_filter(missing)
+        params = {}
+        if after_id is not None:
+            where += " AND id < :after_id"
+            params["after_id"] = after_id
+        limit_clause = ""
+        if limit:
+            limit_clause = "LIMIT :limit"
+            params["limit"] = limit
+        query = text(f"""
+            SELECT id, nome_completo,
+                   CASE WHEN missing_email THEN 1 ELSE 0 END as missing_email,
+                   CASE WHEN missing_phone THEN 1 ELSE 0 END as missing_phone,
+                   CASE WHEN missing_cep THEN 1 ELSE 0 END as missing_cep
+            FROM clientes
+            WHERE {where}
+            ORDER BY id DESC
+            {limit_clause};
         """)
-        return pd.read_sql_query(query, self.session.connection())
+        return pd.read_sql_query(query, self.session.connection(), params=params)
+
+    def count_incomplete_customers(self, missing: Optional[list] = None) -> int:
+        query = text(f"SELECT COUNT(*) FROM clientes WHERE {missing_filter(missing)}")
+        return int(self.session.connection().execute(query).scalar() or 0)
 
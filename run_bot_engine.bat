@@ -6,5 +6,5 @@ echo.
 echo Certifique-se de que o ambiente virtual está ativado, se houver.
 echo Pressione Ctrl+C para parar.
 echo.
-python services/bot_engine.py
+python services/bot_supervisor.py
 pause
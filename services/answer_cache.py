@@ -0,0 +1,246 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+FAQ_FILE = "bot_faq.json"
+
+
+def normalize_text(text):
+    """Minúsculas, sem acentos, sem pontuação e com espaços colapsados."""
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFKD", str(text).lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = re.sub(r"[^\w\s]", " ", text)
+    return " ".join(text.split())
+
+
+def _trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def similarity(a, b):
+    """Similaridade (0..1) entre dois textos já normalizados: max(token-set, trigramas)."""
+    if not a or not b:
+        return 0.0
+    if a == b:
+        return 1.0
+    tokens_a, tokens_b = set(a.split()), set(b.split())
+    token_score = len(tokens_a & tokens_b) / len(tokens_a | tokens_b)
+    grams_a, grams_b = _trigrams(a), _trigrams(b)
+    gram_score = len(grams_a & grams_b) / len(grams_a | grams_b)
+    return max(token_score, gram_score)
+
+
+# Palavras que não mudam o sentido da pergunta (já normalizadas, sem acento)
+STOP_WORDS = frozenset("""
+    a o as os um uma uns umas de do da dos das em no na nos nas por pra pro para com e ou que
+    me te eu voce voces vc vcs oi ola favor pf pfv eh ai
+""".split())
+
+
+def _stem(token):
+    """Junta singular e plural ("caneca"/"canecas", "unidade"/"unidades", "flor"/"flores")."""
+    if len(token) > 3 and token.endswith("s"):
+        token = token[:-1]
+    if len(token) > 3 and token.endswith("e"):
+        token = token[:-1]
+    return token
+
+
+def _is_code(token):
+    """Números, CEPs, quantidades, letras de modelo/tamanho: mudam a resposta."""
+    return len(token) <= 2 or any(c.isdigit() for c in token)
+
+
+def content_tokens(text):
+    return {_stem(token) for token in text.split() if token not in STOP_WORDS}
+
+
+def differs_in_codes(a, b):
+    """True se os textos (normalizados) diferem em algum número, letra ou código."""
+    return any(_is_code(token) for token in content_tokens(a) ^ content_tokens(b))
+
+
+def fuzzy_score(a, b):
+    """
+    Similaridade (0..1) usada no cache aproximado: token-set sobre as palavras de
+    conteúdo (sem stop words, singular/plural juntos). Zero se os textos diferem
+    em número, letra ou código ("modelo A" x "modelo B", "100" x "500 unidades").
+    """
+    if a == b:
+        return 1.0
+    tokens_a, tokens_b = content_tokens(a), content_tokens(b)
+    if not tokens_a or not tokens_b or any(_is_code(token) for token in tokens_a ^ tokens_b):
+        return 0.0
+    return len(tokens_a & tokens_b) / len(tokens_a | tokens_b)
+
+
+def context_fingerprint(system_prompt, chat_history_list=None, summary=None):
+    """
+    Identifica o contexto em que uma resposta vale. Conversa nova: só o prompt
+    do sistema (a resposta serve para qualquer cliente). Conversa em andamento
+    (o bot já respondeu antes ou há resumo): entram também o resumo e as
+    mensagens recentes, para um "sim" de um cliente nunca receber a resposta
+    personalizada dada na conversa de outro.
+    """
+    history = chat_history_list or []
+    ongoing = bool(summary) or any(m.get("role") == "model" for m in history)
+    digest = hashlib.sha1((system_prompt or "").encode("utf-8"))
+    if not ongoing:
+        return f"{digest.hexdigest()[:12]}:novo"
+    digest.update((summary or "").encode("utf-8"))
+    for message in history:
+        parts = message.get("parts", [])
+        content = " ".join(parts) if isinstance(parts, list) else str(parts)
+        digest.update(f"\x00{message.get('role')}\x00{content}".encode("utf-8"))
+    return f"{digest.hexdigest()[:12]}:cont"
+
+
+class AnswerCache:
+    """
+    Cache de respostas do bot para perguntas repetidas, economizando cota do Gemini.
+
+    Camadas, em ordem de consulta:
+    1. FAQ curado pelo administrador (bot_faq.json), sem expiração;
+    2. cache exato pelo texto normalizado + fingerprint do contexto;
+    3. cache aproximado (`fuzzy_score`, só palavras de conteúdo) acima de
+       `similarity_threshold`; nunca entre perguntas com números/códigos diferentes.
+    As entradas 2 e 3 expiram após `ttl_seconds`.
+    """
+
+    def __init__(self, ttl_seconds=86400, similarity_threshold=0.85, max_entries=500, faq_file=FAQ_FILE):
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        self.faq_file = faq_file
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # {(fingerprint, texto_normalizado): (resposta, criado_em)}
+        self._faq = []                 # [(pergunta_normalizada, resposta)]
+        self._faq_mtime = None
+        self._stats = {"faq": 0, "exact": 0, "fuzzy": 0, "miss": 0}
+
+    # --- FAQ ---
+
+    def _reload_faq_if_needed(self):
+        """Recarrega o FAQ apenas quando o arquivo muda."""
+        try:
+            mtime = os.path.getmtime(self.faq_file)
+        except OSError:
+            self._faq, self._faq_mtime = [], None
+            return
+        if mtime == self._faq_mtime:
+            return
+        self._faq = [(normalize_text(q), a) for q, a in load_faq(self.faq_file)]
+        self._faq_mtime = mtime
+
+    def _match_faq(self, normalized):
+        best_answer, best_score = None, 0.0
+        for question, answer in self._faq:
+            if differs_in_codes(normalized, question):
+                continue
+            score = similarity(normalized, question)
+            if score > best_score:
+                best_answer, best_score = answer, score
+        if best_score >= self.similarity_threshold:
+            return best_answer
+        return None
+
+    # --- Cache ---
+
+    def lookup(self, message, fingerprint):
+        """Retorna (resposta, tipo_de_hit) ou (None, 'miss')."""
+        normalized = normalize_text(message)
+        if not normalized:
+            return None, "miss"
+
+        with self._lock:
+            self._reload_faq_if_needed()
+            answer = self._match_faq(normalized)
+            if answer:
+                return self._hit("faq", answer)
+
+            self._evict_expired()
+            entry = self._entries.get((fingerprint, normalized))
+            if entry:
+                self._entries.move_to_end((fingerprint, normalized))
+                return self._hit("exact", entry[0])
+
+            best_key, best_score = None, 0.0
+            for key in self._entries:
+                if key[0] != fingerprint:
+                    continue
+                score = fuzzy_score(normalized, key[1])
+                if score > best_score:
+                    best_key, best_score = key, score
+            if best_key and best_score >= self.similarity_threshold:
+                self._entries.move_to_end(best_key)
+                return self._hit("fuzzy", self._entries[best_key][0])
+
+            self._stats["miss"] += 1
+            return None, "miss"
+
+    def _hit(self, kind, answer):
+        self._stats[kind] += 1
+        return answer, kind
+
+    def store(self, message, fingerprint, answer):
+        normalized = normalize_text(message)
+        if not normalized or not answer:
+            return
+        with self._lock:
+            self._entries[(fingerprint, normalized)] = (answer, time.time())
+            self._entries.move_to_end((fingerprint, normalized))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _evict_expired(self):
+        cutoff = time.time() - self.ttl_seconds
+        expired = [k for k, (_, created) in self._entries.items() if created < cutoff]
+        for k in expired:
+            del self._entries[k]
+
+    def get_stats(self):
+        """Estatísticas de acerto para logs e Dashboard."""
+        with self._lock:
+            hits = self._stats["faq"] + self._stats["exact"] + self._stats["fuzzy"]
+            total = hits + self._stats["miss"]
+            return {
+                **self._stats,
+                "hits": hits,
+                "lookups": total,
+                "hit_rate": (hits / total * 100) if total else 0.0,
+                "entries": len(self._entries),
+            }
+
+
+def load_faq(faq_file=FAQ_FILE):
+    """Lê o FAQ como lista de (pergunta, resposta). Formato: [{"pergunta": ..., "resposta": ...}]."""
+    if not os.path.exists(faq_file):
+        return []
+    try:
+        with open(faq_file, "r", encoding="utf-8") as f:
+            items = json.load(f)
+    except Exception as e:
+        logging.error(f"Erro ao carregar FAQ do bot: {e}")
+        return []
+    return [
+        (item["pergunta"], item["resposta"])
+        for item in items
+        if isinstance(item, dict) and item.get("pergunta") and item.get("resposta")
+    ]
+
+
+def save_faq(items, faq_file=FAQ_FILE):
+    """Salva o FAQ a partir de uma lista de (pergunta, resposta)."""
+    data = [{"pergunta": q.strip(), "resposta": a.strip()} for q, a in items if q and a]
+    with open(faq_file, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=4, ensure_ascii=False)
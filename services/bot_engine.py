@@ -2,44 +2,125 @@ import time
 import json
 import logging
 import os
+import signal
 import sys
 import threading
 
-# Add parent directory to path to import database and services
+# Add parent directory to path to import database_config and services
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-import database
+# Persistência enxuta (SQLAlchemy Core): não carrega Streamlit, pandas nem models
+from services import chat_store
 from services.evolution_service import EvolutionService
 from services.bot_intelligence import BotIntelligence
+from services.chat_history_writer import ChatHistoryWriter
+from services.answer_cache import AnswerCache
+from services.message_coalescer import MessageCoalescer
+from services.pending_replies import PendingReplyQueue
+from services.bot_metrics import BotMetrics, MetricsPublisher
+from services.bot_logging import setup_bot_logging
+from services.bot_supervisor import write_heartbeat
+from services.leader_lease import LeaderLease, LeaderElector
+from services.poll_scheduler import AdaptivePollScheduler, ConnectionCheckSchedule
+from services.conversation_context import ConversationContext
+from services.outbound_queue import OutboundQueue
+from services.campaign_engine import CampaignRunner
+from services.bot_instances import instance_configs, find_instance
 
 # Configuration File Path
 CONFIG_FILE = "bot_config.json"
 LOG_FILE = "bot.log"
 
-# Configure logging to file and console
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(LOG_FILE, encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
+# Só mensagens dos últimos N segundos são processadas (a API devolve o histórico todo)
+WINDOW_SECONDS = 120
 
-def load_config():
-    if os.path.exists(CONFIG_FILE):
+def load_config(path=CONFIG_FILE):
+    if os.path.exists(path):
         try:
-            with open(CONFIG_FILE, 'r') as f:
+            with open(path, 'r') as f:
                 return json.load(f)
         except Exception as e:
             logging.error(f"Error loading config: {e}")
     return {}
 
+class ConfigWatcher:
+    """Mantém o bot_config.json em memória e só relê o arquivo quando o mtime muda."""
+
+    def __init__(self, path=CONFIG_FILE):
+        self.path = path
+        self._mtime = None
+        self._config = {}
+        self._lock = threading.Lock()  # compartilhado pelos runners de todas as instâncias
+
+    def get(self):
+        with self._lock:
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except FileNotFoundError:
+                self._mtime, self._config = None, {}
+                return self._config
+            if mtime != self._mtime:
+                self._config = load_config(self.path)
+                self._mtime = mtime
+            return self._config
+
+# Configure logging to file (com rotação) and console
+_log_config = load_config()
+setup_bot_logging(
+    LOG_FILE,
+    level=_log_config.get("log_level", "INFO"),
+    max_bytes=_log_config.get("log_max_bytes", 5 * 1024 * 1024),
+    backup_count=_log_config.get("log_backup_count", 3),
+    rotate_when=_log_config.get("log_rotate_when"),
+)
+
+class SharedResources:
+    """
+    Componentes que todas as instâncias do processo dividem: gravação do
+    chat_history (uma única thread), cache de respostas/FAQ, contexto do Gemini
+    e a leitura do bot_config.json. O pool de conexões é o do database_config.
+    """
+
+    def __init__(self, config=None):
+        config = load_config() if config is None else config
+
+        # Gravação write-behind do chat_history (lotes em vez de 1 commit por mensagem)
+        self.chat_writer = ChatHistoryWriter(
+            flush_interval_ms=config.get("chat_flush_interval_ms", 500),
+            max_batch_rows=config.get("chat_flush_max_rows", 50),
+        )
+
+        # Cache de respostas/FAQ: vive fora do runner para sobreviver à recriação do BotIntelligence
+        self.answer_cache = AnswerCache(
+            ttl_seconds=config.get("answer_cache_ttl_seconds", 86400),
+            similarity_threshold=config.get("answer_cache_similarity", 0.85),
+        )
+
+        # Contexto do Gemini: resumo por conversa + últimas mensagens, com orçamento de tokens
+        self.context = ConversationContext(
+            recent_messages=config.get("context_recent_messages", 10),
+            summarize_every=config.get("context_summarize_every", 10),
+            token_budget=config.get("context_token_budget", 1500),
+        )
+
+        self.config_watcher = ConfigWatcher()
+
+
 class BotRunner(threading.Thread):
-    def __init__(self):
-        super().__init__()
+    """
+    Poller de uma instância da Evolution API (um número de WhatsApp).
+
+    Sozinho (sem `instance_name`), atende a instância do bot_config.json como
+    sempre. Dentro do BotEngine, recebe o nome da instância e os
+    SharedResources; filas, lease, agendamento de polling e métricas continuam
+    por instância.
+    """
+
+    def __init__(self, instance_name=None, shared=None, primary=True):
+        super().__init__(name=f"BotRunner-{instance_name}" if instance_name else "BotRunner")
         self._stop_event = threading.Event()
-        self.daemon = True  # Daemon thread: morre quando o app morre
+        self.daemon = True  # Daemon thread: morre junto com o processo worker
+        self.last_loop_at = time.time()  # heartbeat: o supervisor reinicia se parar de avançar
 
         # Deduplicação em memória (mais rápida que o banco)
         # Guarda os últimos 500 IDs processados para evitar bater no DB a cada msg
@@ -52,6 +133,90 @@ class BotRunner(threading.Thread):
         self._last_message_per_phone = {}  # {(phone, texto): timestamp}
         self._SPAM_WINDOW_SECONDS = 30
 
+        # Recursos compartilhados entre instâncias (ou próprios, se o runner roda sozinho)
+        raw_config = load_config()
+        self._owns_shared = shared is None
+        self._shared = shared or SharedResources(raw_config)
+        self._chat_writer = self._shared.chat_writer
+        self._answer_cache = self._shared.answer_cache
+        self._context = self._shared.context
+        self._config_watcher = self._shared.config_watcher
+
+        # Instância atendida: None = modo de uma instância só (filas sem filtro)
+        self.instance_name = instance_name
+        config = self._instance_config(raw_config)
+        queue_scope = {"instance": instance_name, "include_unassigned": primary}
+
+        # Debounce por conversa: várias mensagens seguidas viram um único turno/resposta
+        self._coalescer = MessageCoalescer(
+            quiet_seconds=config.get("coalesce_quiet_seconds", 6),
+            max_wait_seconds=config.get("coalesce_max_wait_seconds", 20),
+        )
+
+        # Fila persistente de turnos adiados por falta de cota do Gemini
+        self._pending_replies = PendingReplyQueue(
+            max_age_seconds=config.get("deferred_reply_max_age_seconds", 3600),
+            **queue_scope,
+        )
+        self._has_deferred = True  # desconhecido no início: verifica a fila na primeira volta
+
+        # Polling adaptativo: rápido com conversa ativa, backoff exponencial quando ocioso.
+        # O teto fica abaixo da janela de mensagens recentes para nenhuma escapar.
+        self._poll_scheduler = AdaptivePollScheduler(
+            min_interval=config.get("poll_min_interval_seconds", 1.5),
+            max_interval=min(config.get("poll_max_interval_seconds", 30), WINDOW_SECONDS / 2),
+            active_window_seconds=config.get("poll_active_window_seconds", 120),
+        )
+        # Estado da instância só é conferido após falhas ou a cada N minutos
+        self._connection_check = ConnectionCheckSchedule(
+            every_seconds=config.get("connection_check_minutes", 5) * 60,
+        )
+
+        # Lease de liderança: com várias réplicas, só o líder faz polling e responde
+        self._leader = LeaderElector(LeaderLease(
+            name=f"bot:{config.get('evolution_instance_name', 'BotFeh')}",
+            ttl_seconds=config.get("leader_lease_ttl_seconds", 30),
+        ))
+
+        # Contadores/latências publicados no banco para o Dashboard (em vez de ler o bot.log)
+        self._metrics = BotMetrics()
+        self._metrics_publisher = MetricsPublisher(
+            self._metrics,
+            runner_key=config.get("evolution_instance_name", "BotFeh"),
+            interval_seconds=config.get("metrics_publish_interval_seconds", 10),
+        )
+
+        # Envio pelo WhatsApp desacoplado do processamento: fila persistente com ritmo e retry
+        self._outbox = OutboundQueue(
+            min_interval_seconds=config.get("send_min_interval_seconds", 1.0),
+            max_attempts=config.get("send_max_attempts", 5),
+            max_age_seconds=config.get("send_max_age_seconds", 900),
+            metrics=self._metrics,
+            on_sent=self._on_reply_sent,
+            can_send=self._leader.is_leader,
+            **queue_scope,
+        )
+        self.evolution_service = None
+
+    def _instance_config(self, config):
+        """Config efetiva desta instância (chaves globais + sobrescritas da instância)."""
+        if self.instance_name is None:
+            return instance_configs(config)[0]
+        return find_instance(config, self.instance_name) or {"bot_active": False}
+
+    @property
+    def metrics(self):
+        return self._metrics
+
+    def is_leader(self):
+        return self._leader.is_leader()
+
+    def send_message(self, phone, text):
+        """Envio direto pela Evolution API desta instância (usado pelas campanhas)."""
+        if self.evolution_service is None:
+            return None
+        return self.evolution_service.send_message(phone, text)
+
     def _is_duplicate_in_memory(self, message_id):
         """Verifica deduplicação sem bater no banco."""
         if message_id in self._processed_ids:
@@ -82,32 +247,136 @@ class BotRunner(threading.Thread):
             }
         return False
 
+    def _generate_and_send(self, phone_number, remote_jid, text, evolution_service, bot_intelligence):
+        """Gera a resposta e a entrega à fila de envio. Retorna 'sent', 'deferred' (sem cota) ou 'skipped'."""
+        # 5. Generate Reply
+        if not bot_intelligence.api_key:
+            reply_text = "Erro: Chave Gemini não configurada no Dashboard."
+        else:
+            # Resumo acumulado + últimas mensagens (incluindo as ainda no buffer), dentro do orçamento
+            summary, context_history = self._context.build(
+                phone_number,
+                pending_messages=self._chat_writer.with_pending(phone_number, []),
+                summarizer=bot_intelligence.summarize_history,
+            )
+            reply_text = bot_intelligence.generate_response(text, context_history, summary=summary)
+            if reply_text is None and bot_intelligence.last_call_rate_limited:
+                return "deferred"
+
+        # 6. Send Reply (fila de saída; a gravação no histórico acontece após a entrega)
+        if reply_text:
+            logging.info(f"Queueing reply to {phone_number}: {reply_text[:50]}...")
+            self._outbox.enqueue(phone_number, remote_jid, reply_text)
+            return "sent"
+        return "skipped"
+
+    def _on_reply_sent(self, row):
+        """7. Save Bot Reply (write-behind), chamado pela fila depois da entrega."""
+        self._chat_writer.enqueue(row["phone_number"], "model", row["text"])
+
+    def _defer_turn(self, phone_number, remote_jid, text, message_ids):
+        self._pending_replies.enqueue(phone_number, remote_jid, text, message_ids)
+        self._has_deferred = True
+        self._metrics.inc("turns_deferred")
+        logging.info(f"⏸️ Resposta para {phone_number} adiada até a cota do Gemini liberar.")
+
+    def _reply_to_turn(self, turn, evolution_service, bot_intelligence):
+        """Gera e envia UMA resposta para o turno combinado de um número."""
+        phone_number = turn["phone_number"]
+        remote_jid = turn["remote_jid"]
+        self._metrics.inc("turns")
+        if len(turn["texts"]) > 1:
+            logging.info(f"🧩 {len(turn['texts'])} mensagens de {phone_number} combinadas em um turno.")
+
+        # Conversa já tem turno adiado: junta a ele para não responder fora de ordem
+        if self._has_deferred and self._pending_replies.has_pending(phone_number):
+            self._defer_turn(phone_number, remote_jid, turn["text"], turn["message_ids"])
+            return
+
+        status = self._generate_and_send(phone_number, remote_jid, turn["text"], evolution_service, bot_intelligence)
+        if status == "deferred":
+            self._defer_turn(phone_number, remote_jid, turn["text"], turn["message_ids"])
+
+    def _drain_deferred(self, evolution_service, bot_intelligence, batch_size=5):
+        """Responde turnos adiados (mais antigos primeiro) enquanto houver cota."""
+        if not self._has_deferred or not bot_intelligence.api_key:
+            return
+        batch = self._pending_replies.next_batch(limit=batch_size)
+        if not batch:
+            self._has_deferred = False
+            return
+        for item in batch:
+            if self._stop_event.is_set() or not self._leader.is_leader() or not bot_intelligence.has_quota():
+                break
+            status = self._generate_and_send(
+                item["phone_number"], item["remote_jid"], item["text"], evolution_service, bot_intelligence
+            )
+            if status == "deferred":
+                self._pending_replies.mark_retry(item["id"])
+                break
+            if status == "sent":
+                logging.info(f"▶️ Resposta adiada enviada para {item['phone_number']}.")
+                self._pending_replies.mark_done(item["id"])
+            else:
+                self._pending_replies.mark_failed(item["id"])
+
+    def _metric_gauges(self):
+        """Profundidade das filas internas no momento da publicação."""
+        cache = self._answer_cache.get_stats()
+        gauges = {
+            "chat_write_queue": self._chat_writer.pending_count(),
+            "open_turns": self._coalescer.pending_count(),
+            "cache_hit_rate": cache["hit_rate"],
+            "cache_entries": cache["entries"],
+        }
+        try:
+            gauges["outbound_queue"] = self._outbox.counts()["queued"]
+        except Exception as e:
+            logging.debug(f"Fila de envio indisponível para métricas: {e}")
+        return gauges
+
     def stop(self):
         self._stop_event.set()
-        logging.info("Stopping Bot Engine...")
+        logging.info(f"Stopping Bot Engine ({self.name})...")
+        # Garante que nenhuma mensagem bufferizada se perca no encerramento
+        if self._owns_shared:
+            self._chat_writer.stop()
 
     def run(self):
-        logging.info("Starting Bot Engine (Threaded)...")
-        
+        logging.info(f"Starting Bot Engine ({self.name})...")
+        if self._owns_shared:
+            self._chat_writer.start()
+        self._leader.start()
+        self._outbox.start()
+
         # Initialize Services (load config first to get keys)
-        config = load_config()
+        config = self._instance_config(load_config())
         evolution_api_url = config.get("evolution_api_url")
         evolution_api_token = config.get("evolution_api_token")
         evolution_instance_name = config.get("evolution_instance_name", "BotFeh")
         gemini_key = config.get("gemini_key")
         
         evolution_service = EvolutionService(evolution_api_url, evolution_api_token, instance_name=evolution_instance_name)
-        bot_intelligence = BotIntelligence(gemini_key)
+        bot_intelligence = BotIntelligence(gemini_key, answer_cache=self._answer_cache, metrics=self._metrics)
+        self._outbox.sender = evolution_service.send_message
+        self.evolution_service = evolution_service
 
         while not self._stop_event.is_set():
+            self.last_loop_at = time.time()
             try:
-                # Reload config every loop to check for changes
-                config = load_config()
+                # Config em memória; relida só quando o arquivo muda
+                config = self._instance_config(self._config_watcher.get())
                 is_active = config.get("bot_active", False)
                 
                 if not is_active:
-                    logging.info("Bot is inactive in config. Sleeping...")
-                    time.sleep(5)
+                    logging.debug("Bot is inactive in config. Sleeping...")
+                    self._stop_event.wait(5)
+                    continue
+
+                # Réplica em standby: aguarda o lease do líder expirar
+                if not self._leader.is_leader():
+                    logging.debug("Standby: outra réplica detém a liderança.")
+                    self._stop_event.wait(2)
                     continue
 
                 # Update service credentials if changed
@@ -119,20 +388,29 @@ class BotRunner(threading.Thread):
                    current_token != evolution_service.api_token or \
                    current_instance != evolution_service.instance_name:
                     evolution_service = EvolutionService(current_url, current_token, instance_name=current_instance)
+                    self._metrics_publisher.runner_key = current_instance
+                    self._connection_check.mark_failed()  # nova instância/credencial: confere já
+                    self._outbox.sender = evolution_service.send_message
+                    self.evolution_service = evolution_service
                 
                 if config.get("gemini_key") != bot_intelligence.api_key:
-                    bot_intelligence = BotIntelligence(config.get("gemini_key"))
+                    bot_intelligence = BotIntelligence(
+                        config.get("gemini_key"), answer_cache=self._answer_cache, metrics=self._metrics
+                    )
 
                 # --- 1. Self-Diagnostics ---
-                # Check instance connection
-                is_connected, conn_msg = evolution_service.check_connection()
-                if not is_connected:
-                    logging.info(f"⚠️ ATENCAO: Instancia '{evolution_service.instance_name}' NAO ESTA CONECTADA. {conn_msg}")
-                    # Try to derive the IP for the QR scan link
-                    server_ip = evolution_service.base_url.split('//')[-1].split(':')[0]
-                    logging.info(f"👉 Por favor, acesse http://{server_ip} e escaneie o QR Code.")
-                    time.sleep(10)
-                    continue
+                # Check instance connection (só após falha de poll ou a cada N minutos)
+                if self._connection_check.due():
+                    is_connected, conn_msg = evolution_service.check_connection()
+                    self._metrics.inc("connection_checks")
+                    if not is_connected:
+                        logging.info(f"⚠️ ATENCAO: Instancia '{evolution_service.instance_name}' NAO ESTA CONECTADA. {conn_msg}")
+                        # Try to derive the IP for the QR scan link
+                        server_ip = evolution_service.base_url.split('//')[-1].split(':')[0]
+                        logging.info(f"👉 Por favor, acesse http://{server_ip} e escaneie o QR Code.")
+                        self._stop_event.wait(10)
+                        continue
+                    self._connection_check.mark_ok()
 
                 # Check Gemini Key
                 if not bot_intelligence.api_key:
@@ -141,27 +419,30 @@ class BotRunner(threading.Thread):
 
                 # 2. Fetch recent messages
                 url_debug = f"{evolution_service.base_url}/chat/findMessages/{evolution_service.instance_name}"
-                logging.info(f"Polling URL: {url_debug}")
-                data = evolution_service.get_recent_messages(count=10)
-                
+                logging.debug(f"Polling URL: {url_debug}")
+                with self._metrics.timer("poll_latency_seconds"):
+                    data = evolution_service.get_recent_messages(count=10)
+                self._metrics.inc("polls")
+                if evolution_service.last_poll_failed:
+                    self._metrics.inc("poll_errors")
+                    self._connection_check.mark_failed()
+
                 if not data and not isinstance(data, (dict, list)):
                     logging.debug(f"Polled {url_debug} but got empty/null response")
-                
-                # DEBUG: Log the keys in the response to help diagnosis in Dashboard
-                if isinstance(data, dict):
-                    logging.info(f"Response keys: {list(data.keys())}")
-                    # Log first item of messages if present
-                    raw_msgs = data.get('messages', data.get('data', []))
-                    if isinstance(raw_msgs, list):
-                        logging.info(f"Total de mensagens brutas na resposta: {len(raw_msgs)}")
-                        if raw_msgs:
-                            import json as _json
-                            logging.info(f"Primeira mensagem (bruta): {_json.dumps(raw_msgs[0], default=str)[:500]}")
-                elif isinstance(data, list):
-                    logging.info(f"Response is a list of {len(data)} items.")
-                    if data:
-                        import json as _json
-                        logging.info(f"Primeiro item: {_json.dumps(data[0], default=str)[:500]}")
+
+                # Dumps de diagnóstico da resposta: só em nível DEBUG (log_level no bot_config.json)
+                if logging.getLogger().isEnabledFor(logging.DEBUG):
+                    if isinstance(data, dict):
+                        logging.debug(f"Response keys: {list(data.keys())}")
+                        raw_msgs = data.get('messages', data.get('data', []))
+                        if isinstance(raw_msgs, list):
+                            logging.debug(f"Total de mensagens brutas na resposta: {len(raw_msgs)}")
+                            if raw_msgs:
+                                logging.debug(f"Primeira mensagem (bruta): {json.dumps(raw_msgs[0], default=str)[:500]}")
+                    elif isinstance(data, list):
+                        logging.debug(f"Response is a list of {len(data)} items.")
+                        if data:
+                            logging.debug(f"Primeiro item: {json.dumps(data[0], default=str)[:500]}")
 
                 # Evolution API v2.3.0 real structure:
                 # {"messages": {"total": N, "pages": N, "currentPage": N, "records": [...]}}
@@ -170,7 +451,7 @@ class BotRunner(threading.Thread):
                     if isinstance(messages_val, dict):
                         # v2.3.0 paginado: records é a lista real
                         messages = messages_val.get("records") or messages_val.get("messages") or []
-                        logging.info(f"Estrutura paginada detectada. Total na API: {messages_val.get('total', '?')}, registros nesta pagina: {len(messages)}")
+                        logging.debug(f"Estrutura paginada detectada. Total na API: {messages_val.get('total', '?')}, registros nesta pagina: {len(messages)}")
                     elif isinstance(messages_val, list):
                         messages = messages_val
                     else:
@@ -187,9 +468,7 @@ class BotRunner(threading.Thread):
                 
                 # Filtrar apenas mensagens RECENTES (últimos 120 segundos)
                 # A API retorna histórico completo; sem filtro de tempo, reprocessa tudo
-                import time as _time
-                now_ts = _time.time()
-                WINDOW_SECONDS = 120  # só processa mensagens dos últimos 2 minutos
+                now_ts = time.time()
                 recent_messages = []
                 for m in messages:
                     msg_ts = m.get("messageTimestamp") or m.get("timestamp")
@@ -201,8 +480,9 @@ class BotRunner(threading.Thread):
                         except (ValueError, TypeError):
                             pass  # ignora mensagem sem timestamp válido
                 
-                logging.info(f"Mensagens válidas para processar: {len(recent_messages)} (de {len(messages)} recentes na página, janela={WINDOW_SECONDS}s)")
+                logging.debug(f"Mensagens válidas para processar: {len(recent_messages)} (de {len(messages)} recentes na página, janela={WINDOW_SECONDS}s)")
                 
+                new_messages = 0
                 for msg in recent_messages:
                     if self._stop_event.is_set(): break
 
@@ -215,15 +495,19 @@ class BotRunner(threading.Thread):
 
                     if from_me:
                         continue
+                    self._metrics.inc("messages_seen")
                     
                     # Deduplicação rápida em memória (sem bater no banco)
                     if message_id and self._is_duplicate_in_memory(message_id):
                         logging.debug(f"[MEM] Message {message_id} já processada. Skipping.")
+                        self._metrics.inc("dedup_memory_hits")
                         continue
 
-                    # Deduplicação persistente no banco (segunda camada)
-                    if message_id and database.check_message_exists(message_id):
+                    # Deduplicação persistente: buffer do writer + banco (segunda camada)
+                    if message_id and (self._chat_writer.is_pending(message_id) or
+                                       chat_store.check_message_exists(message_id)):
                         logging.debug(f"[DB] Message {message_id} já processada. Skipping.")
+                        self._metrics.inc("dedup_db_hits")
                         self._register_in_memory(message_id)  # atualiza cache
                         continue
 
@@ -243,99 +527,171 @@ class BotRunner(threading.Thread):
                     if self._is_spam(phone_number, text_content):
                         logging.info(f"[SPAM] Msg duplicada de {phone_number} em <{self._SPAM_WINDOW_SECONDS}s. Ignorando.")
                         self._register_in_memory(message_id)  # marca para não reprocessar
+                        self._metrics.inc("spam_filtered")
                         continue
 
                     logging.info(f"Processing message {message_id} from {phone_number}: {text_content[:50]}...")
 
                     try:
-                        # 4. Save User Message to DB
-                        database.save_chat_message(phone_number, "user", text_content, external_id=message_id)
+                        # 4. Save User Message (write-behind, não bloqueia)
+                        self._chat_writer.enqueue(phone_number, "user", text_content, external_id=message_id)
                         self._register_in_memory(message_id)  # registra no cache de memória
 
-                        # 5. Generate Reply
-                        if not bot_intelligence.api_key:
-                            reply_text = "Erro: Chave Gemini não configurada no Dashboard."
-                        else:
-                            context_history = database.get_chat_history(phone_number, limit=10)
-                            reply_text = bot_intelligence.generate_response(text_content, context_history)
-
-                        # 6. Send Reply
-                        if reply_text:
-                            logging.info(f"Sending reply to {phone_number}: {reply_text[:50]}...")
-                            result = evolution_service.send_message(remote_jid, reply_text)
-                            
-                            if result:
-                                # 7. Save Bot Reply to DB
-                                database.save_chat_message(phone_number, "model", reply_text)
-                            else:
-                                logging.error(f"Failed to send reply to {phone_number} via API.")
+                        # Aguarda a janela de debounce antes de responder
+                        msg_ts = int(msg.get("messageTimestamp") or msg.get("timestamp"))
+                        self._coalescer.add(phone_number, remote_jid, message_id, text_content, timestamp=msg_ts)
+                        self._metrics.inc("messages_processed")
+                        new_messages += 1
                     except Exception as loop_e:
                         logging.error(f"Error processing single message {message_id}: {loop_e}")
 
-                time.sleep(15)  # Poll a cada 15s (reduz consumo de API e cota Gemini)
+                # Turnos adiados por cota têm prioridade (mais antigos primeiro)
+                try:
+                    self._drain_deferred(evolution_service, bot_intelligence)
+                except Exception as drain_e:
+                    logging.error(f"Error draining deferred replies: {drain_e}")
+
+                # Responde os turnos cujo cliente parou de digitar (ou esperou demais)
+                for turn in self._coalescer.pop_ready():
+                    if self._stop_event.is_set() or not self._leader.is_leader(): break
+                    try:
+                        self._reply_to_turn(turn, evolution_service, bot_intelligence)
+                    except Exception as turn_e:
+                        logging.error(f"Error replying to {turn['phone_number']}: {turn_e}")
+
+                self._metrics_publisher.maybe_publish(self._metric_gauges())
+
+                # Próximo poll: 1-2s com conversa ativa, backoff quando ocioso, ou antes se há turno para fechar
+                wait = self._poll_scheduler.next_interval(had_activity=new_messages > 0)
+                next_ready = self._coalescer.seconds_until_next_ready()
+                if next_ready is not None:
+                    wait = min(wait, max(next_ready, 1))
+                self._stop_event.wait(wait)
 
             except Exception as e:
                 logging.error(f"Error in main loop: {e}")
-                time.sleep(10)
-        
-        logging.info("Bot Engine Stopped.")
-
-# --- Singleton thread-safe ---
-# Garante que apenas UMA instância de BotRunner existe por vez.
-_runner_lock = threading.Lock()
-_current_runner: "BotRunner | None" = None
-
-def _kill_all_runners():
-    """Varre threading.enumerate() e para TODAS as threads BotRunner ativas.
-    Necessário para eliminar runners 'zumbis' de deploys/reloads anteriores."""
-    victims = [t for t in threading.enumerate() if isinstance(t, BotRunner) and t.is_alive()]
-    for t in victims:
-        t.stop()
-    for t in victims:
-        t.join(timeout=3)
-    if victims:
-        logging.info(f"🧹 {len(victims)} thread(s) BotRunner encerrada(s).")
-
-def get_bot_runner():
-    """Retorna o runner ativo ou None."""
-    global _current_runner
-    with _runner_lock:
-        # Prefere _current_runner, mas busca qualquer thread viva como fallback
-        if _current_runner is not None and _current_runner.is_alive():
-            return _current_runner
-        # Busca em todas as threads (captura runners de sessões anteriores)
-        for t in threading.enumerate():
-            if isinstance(t, BotRunner) and t.is_alive():
-                _current_runner = t
-                return t
-        _current_runner = None
-        return None
-
-def start_bot_runner():
-    """Para TODOS os runners existentes e inicia um novo. Thread-safe."""
-    global _current_runner
-    with _runner_lock:
-        _kill_all_runners()  # garante que nenhuma thread zumbi sobrevive
-        new_runner = BotRunner()
-        new_runner.start()
-        _current_runner = new_runner
-        logging.info(f"✅ Novo BotRunner iniciado (Thread ID: {new_runner.ident})")
-        return new_runner
-
-def stop_bot_runner():
-    """Para TODOS os runners ativos."""
-    global _current_runner
-    with _runner_lock:
-        _kill_all_runners()
-        _current_runner = None
+                self._metrics.inc("loop_errors")
+                self._stop_event.wait(10)
+
+        self._outbox.stop()  # não enviadas ficam persistidas para a próxima execução
+        if self._owns_shared:
+            self._chat_writer.stop()
+        if self._leader.is_leader():
+            self._metrics_publisher.publish(self._metric_gauges())
+        self._leader.stop()
+        logging.info(f"Bot Engine Stopped ({self.name}).")
+
+
+class BotEngine:
+    """
+    Motor multi-instância: um BotRunner por número de WhatsApp do
+    bot_config.json, todos no mesmo processo, dividindo os SharedResources,
+    o pool do banco e o envio de campanhas. Instâncias adicionadas ou
+    removidas do arquivo são iniciadas/paradas em `sync()`, sem reiniciar o
+    worker; pausar uma instância (`"active": false`) não afeta as outras.
+    """
+
+    def __init__(self):
+        config = load_config()
+        self.shared = SharedResources(config)
+        self.runners = {}
+        self._primary = None
+
+        # Campanhas para clientes com opt-in: saem pela instância principal (a primeira), só no líder
+        self._campaigns = CampaignRunner(
+            batch_size=config.get("campaign_batch_size", 50),
+            max_per_day=config.get("campaign_max_per_day", 1000),
+            sender=self._send_campaign_message,
+            on_sent=self._on_campaign_sent,
+            can_send=self._campaign_ready,
+        )
+
+    def _primary_runner(self):
+        return self.runners.get(self._primary)
+
+    def _campaign_ready(self):
+        runner = self._primary_runner()
+        return runner is not None and runner.is_leader() and runner.evolution_service is not None
+
+    def _send_campaign_message(self, phone, text):
+        runner = self._primary_runner()
+        return runner.send_message(phone, text) if runner else None
+
+    def _on_campaign_sent(self, phone_number, text):
+        """Mensagem de campanha entra no histórico: se o cliente responder, o bot tem o contexto."""
+        self.shared.chat_writer.enqueue(phone_number, "model", text)
+
+    def sync(self):
+        """Inicia runners de instâncias novas e para os de instâncias removidas do arquivo."""
+        names = [item["evolution_instance_name"] for item in instance_configs(self.shared.config_watcher.get())]
+        for name in [n for n in self.runners if n not in names]:
+            logging.info(f"Instância '{name}' removida da configuração. Parando...")
+            runner = self.runners.pop(name)
+            runner.stop()
+            runner.join(timeout=15)
+        for name in names:
+            if name not in self.runners:
+                logging.info(f"Iniciando instância '{name}'...")
+                runner = BotRunner(instance_name=name, shared=self.shared, primary=name == names[0])
+                self.runners[name] = runner
+                runner.start()
+        if self._primary != names[0]:
+            self._primary = names[0]
+            self._campaigns.metrics = self.runners[names[0]].metrics
+
+    @property
+    def last_loop_at(self):
+        """Volta mais antiga entre as instâncias: o heartbeat fica velho se qualquer uma travar."""
+        return min((runner.last_loop_at for runner in self.runners.values()), default=time.time())
+
+    def crashed(self):
+        return any(not runner.is_alive() for runner in self.runners.values())
+
+    def start(self):
+        self.shared.chat_writer.start()
+        self.sync()
+        self._campaigns.start()
+
+    def stop(self, timeout=15):
+        self._campaigns.stop()  # cursor gravado: a campanha continua na próxima execução
+        for runner in self.runners.values():
+            runner.stop()
+        for runner in self.runners.values():
+            runner.join(timeout)
+        self.shared.chat_writer.stop()  # depois dos runners: grava as últimas respostas entregues
+
+
+def run_worker(heartbeat_interval=5):
+    """
+    Ponto de entrada do processo worker (iniciado pelo bot_supervisor).
+
+    Roda o BotEngine (um BotRunner por instância) e grava o heartbeat até
+    receber SIGTERM/Ctrl+C. Sai com código 1 se algum runner morrer sozinho,
+    para o supervisor reiniciar o processo.
+    """
+    stop_requested = threading.Event()
+
+    def _request_stop(signum, frame):
+        stop_requested.set()
+
+    signal.signal(signal.SIGTERM, _request_stop)
+    signal.signal(signal.SIGINT, _request_stop)
+
+    engine = BotEngine()
+    engine.start()
+    logging.info(f"✅ Worker do bot rodando (PID {os.getpid()}, instâncias: {', '.join(engine.runners)})")
+    while not stop_requested.is_set() and not engine.crashed():
+        write_heartbeat(engine.last_loop_at)
+        stop_requested.wait(heartbeat_interval)
+        try:
+            engine.sync()
+        except Exception as e:
+            logging.error(f"Erro ao sincronizar instâncias: {e}")
+
+    crashed = engine.crashed()
+    engine.stop()
+    return 1 if crashed else 0
 
 
 if __name__ == "__main__":
-    runner = BotRunner()
-    runner.start()
-    try:
-        while True:
-            time.sleep(1)
-    except KeyboardInterrupt:
-        runner.stop()
-        runner.join()
+    sys.exit(run_worker())
@@ -0,0 +1,54 @@
+"""
+Instâncias da Evolution API (números de WhatsApp) atendidas pelo motor do bot.
+
+Sem a chave `instances` no bot_config.json, as chaves globais descrevem a
+única instância (comportamento de sempre). Com ela, cada item sobrescreve as
+chaves globais para aquele número, por exemplo:
+
+    "instances": [
+        {"evolution_instance_name": "Loja", "active": true},
+        {"evolution_instance_name": "Suporte", "evolution_api_token": "...", "poll_max_interval_seconds": 10}
+    ]
+
+Não importa nada do motor, então o Dashboard pode usá-lo sem efeitos colaterais.
+"""
+
+DEFAULT_INSTANCE_NAME = "BotFeh"
+
+
+def instance_configs(config):
+    """Configuração efetiva de cada instância, na ordem do arquivo (a primeira é a principal)."""
+    base = {key: value for key, value in config.items() if key != "instances"}
+    result, seen = [], set()
+    for entry in config.get("instances") or [{}]:
+        merged = {**base, **entry}
+        name = (merged.get("evolution_instance_name") or DEFAULT_INSTANCE_NAME).strip()
+        if name in seen:
+            continue
+        seen.add(name)
+        merged["evolution_instance_name"] = name
+        # Pausar um número não desliga os outros; o toggle global desliga todos
+        merged["bot_active"] = bool(config.get("bot_active", False)) and entry.get("active", True)
+        result.append(merged)
+    return result
+
+
+def instance_names(config):
+    return [item["evolution_instance_name"] for item in instance_configs(config)]
+
+
+def find_instance(config, name):
+    """Configuração efetiva de uma instância, ou None se ela saiu do arquivo."""
+    return next((item for item in instance_configs(config) if item["evolution_instance_name"] == name), None)
+
+
+def set_instance_active(config, name, active):
+    """Pausa/retoma um número (altera `config` no lugar; quem chama grava o arquivo)."""
+    entries = config.get("instances")
+    if not entries:
+        entries = config["instances"] = [{"evolution_instance_name": instance_names(config)[0]}]
+    for entry in entries:
+        if (entry.get("evolution_instance_name") or DEFAULT_INSTANCE_NAME).strip() == name:
+            entry["active"] = bool(active)
+            return True
+    return False
@@ -3,8 +3,13 @@ import logging
 import os
 import time
 import re
-import datetime
-from collections import deque
+
+from services.answer_cache import AnswerCache, context_fingerprint
+from services.rate_limiter import (
+    GEMINI_MAX_CALLS_PER_DAY, GEMINI_MAX_CALLS_PER_MINUTE, SharedRateLimiter, gemini_bucket,
+)
+from services.bot_metrics import BotMetrics
+from services.conversation_context import estimate_tokens
 
 class BotIntelligence:
     """
@@ -14,23 +19,46 @@ class BotIntelligence:
 
     # Limites do plano GRATUITO do Google AI (gemini-2.0-flash)
     # Limite real: 15 RPM e 1.500 RPD — ficamos um pouco abaixo para segurança
-    MAX_CALLS_PER_MINUTE = 13   # limite real: 15/min
-    MAX_CALLS_PER_DAY = 1400    # limite real: 1.500/dia
+    MAX_CALLS_PER_MINUTE = GEMINI_MAX_CALLS_PER_MINUTE
+    MAX_CALLS_PER_DAY = GEMINI_MAX_CALLS_PER_DAY
+
+    SYSTEM_PROMPT = """
+        Você é um assistente virtual presencial (recepcionista) da empresa.
+        Seu tom é profissional, acolhedor e eficiente.
 
-    def __init__(self, api_key=None):
+        Diretrizes:
+        1. Responda apenas o que for perguntado ou necessário para o atendimento.
+        2. Se não souber a resposta, peça para o cliente aguardar um atendente humano.
+        3. Não invente informações sobre produtos ou preços que não estão no contexto.
+        4. Mantenha as respostas curtas e objetivas, adequadas para WhatsApp.
+
+        Contexto da conversa anterior:
+        """
+
+    def __init__(self, api_key=None, answer_cache=None, rate_limiter=None, metrics=None):
         self.api_key = api_key or os.getenv("GEMINI_API_KEY")
         self.model = None
 
-        # Rate limit: controle por minuto (janela deslizante)
-        self._calls_timestamps = deque()  # timestamps das últimas chamadas
+        # Métricas estruturadas (o BotRunner passa as suas para publicar no Dashboard)
+        self.metrics = metrics or BotMetrics()
 
-        # Rate limit: controle por dia
-        self._daily_count = 0
-        self._daily_reset_date = datetime.date.today()
+        # Cache de respostas (compartilhado pelo BotRunner para sobreviver a trocas de chave)
+        self.answer_cache = answer_cache or AnswerCache()
+
+        # Rate limit por minuto/dia compartilhado entre runners e processos (via banco)
+        self.rate_limiter = rate_limiter or SharedRateLimiter(
+            bucket=gemini_bucket(self.api_key),
+            per_minute=self.MAX_CALLS_PER_MINUTE,
+            per_day=self.MAX_CALLS_PER_DAY,
+        )
 
         # Cooldown após 429 da API
         self._rate_limited_until = 0
 
+        # True quando a última generate_response devolveu None por falta de cota
+        # (o BotRunner usa isso para adiar o turno em vez de descartá-lo)
+        self.last_call_rate_limited = False
+
         self.configure_model()
 
     # Modelos em ordem de preferência (fallback automático)
@@ -57,133 +85,183 @@ class BotIntelligence:
             return True
         return False  # sem mais fallbacks
 
-    def _reset_daily_if_needed(self):
-        """Reseta contador diário à meia-noite."""
-        today = datetime.date.today()
-        if today != self._daily_reset_date:
-            self._daily_count = 0
-            self._daily_reset_date = today
-            logging.info(f"🔄 Contador diário do Gemini resetado. Nova data: {today}")
-
     def _can_call_api(self):
         """
-        Verifica limites antes de chamar a API.
+        Verifica limites antes de chamar a API (sem consumir cota).
         Retorna (pode_chamar: bool, motivo: str)
         """
-        # 1. Cooldown ativo (erro 429 recente)
+        # 1. Cooldown local (evita ir ao banco logo após um 429)
         wait_remaining = self._rate_limited_until - time.time()
         if wait_remaining > 0:
             return False, f"cooldown ativo por mais {wait_remaining:.0f}s"
 
-        # 2. Limite diário
-        self._reset_daily_if_needed()
-        if self._daily_count >= self.MAX_CALLS_PER_DAY:
-            return False, f"limite diário atingido ({self._daily_count}/{self.MAX_CALLS_PER_DAY} chamadas)"
+        # 2. Cooldown, limite diário e por minuto globais
+        return self.rate_limiter.check()
 
-        # 3. Limite por minuto (janela deslizante de 60s)
-        now = time.time()
-        # Remove timestamps com mais de 60 segundos
-        while self._calls_timestamps and (now - self._calls_timestamps[0]) > 60:
-            self._calls_timestamps.popleft()
+    def _acquire_call(self):
+        """Como _can_call_api, mas reserva a chamada no limitador compartilhado."""
+        wait_remaining = self._rate_limited_until - time.time()
+        if wait_remaining > 0:
+            return False, f"cooldown ativo por mais {wait_remaining:.0f}s"
+        return self.rate_limiter.try_acquire()
 
-        if len(self._calls_timestamps) >= self.MAX_CALLS_PER_MINUTE:
-            oldest = self._calls_timestamps[0]
-            wait = 60 - (now - oldest)
-            return False, f"limite por minuto atingido ({len(self._calls_timestamps)}/{self.MAX_CALLS_PER_MINUTE}), aguardar {wait:.0f}s"
+    def has_quota(self):
+        """True se uma chamada ao Gemini seria permitida agora."""
+        return self._can_call_api()[0]
 
-        return True, "ok"
+    def _set_cooldown(self, seconds):
+        """Aplica cooldown local e global (todos os processos param de chamar)."""
+        self._rate_limited_until = time.time() + seconds
+        self.rate_limiter.set_cooldown(self._rate_limited_until)
 
     def _register_call(self):
-        """Registra uma chamada bem-sucedida nos contadores."""
-        self._calls_timestamps.append(time.time())
-        self._daily_count += 1
+        """Loga o uso após uma chamada bem-sucedida."""
+        stats = self.get_usage_stats()
         logging.info(
-            f"📊 Gemini: {len(self._calls_timestamps)} calls/min | "
-            f"{self._daily_count}/{self.MAX_CALLS_PER_DAY} calls/dia"
+            f"📊 Gemini: {stats['calls_per_minute']} calls/min | "
+            f"{stats['calls_today']}/{stats['max_per_day']} calls/dia"
         )
 
     def get_usage_stats(self):
-        """Retorna estatísticas de uso para o Dashboard."""
-        self._reset_daily_if_needed()
-        now = time.time()
-        while self._calls_timestamps and (now - self._calls_timestamps[0]) > 60:
-            self._calls_timestamps.popleft()
+        """Retorna estatísticas de uso (globais) para o Dashboard."""
+        remaining = self.rate_limiter.remaining()
         return {
-            "calls_per_minute": len(self._calls_timestamps),
-            "max_per_minute": self.MAX_CALLS_PER_MINUTE,
-            "calls_today": self._daily_count,
-            "max_per_day": self.MAX_CALLS_PER_DAY,
-            "cooldown_remaining": max(0, self._rate_limited_until - now),
+            "calls_per_minute": remaining["max_per_minute"] - remaining["available_now"],
+            "max_per_minute": remaining["max_per_minute"],
+            "available_now": remaining["available_now"],
+            "calls_today": remaining["calls_today"],
+            "remaining_today": remaining["remaining_today"],
+            "max_per_day": remaining["max_per_day"],
+            "cooldown_remaining": max(remaining["cooldown_remaining"], self._rate_limited_until - time.time(), 0),
         }
 
+    SUMMARY_PROMPT = (
+        "Atualize o resumo de uma conversa de atendimento por WhatsApp. Mantenha nome do cliente, "
+        "pedidos, produtos, valores, datas e pendências; descarte cumprimentos. "
+        "Responda só com o resumo, em no máximo 8 linhas.\n\n"
+    )
+
     def format_history_for_context(self, chat_history_list):
         """Formata histórico do chat para contexto do modelo."""
-        formatted = ""
+        lines = []
         for msg in chat_history_list:
             role = "Cliente" if msg.get("role") == "user" else "Assistente"
             parts = msg.get("parts", [])
             content = " ".join(parts) if isinstance(parts, list) else str(parts)
-            formatted += f"{role}: {content}\n"
-        return formatted
+            lines.append(f"{role}: {content}\n")
+        return "".join(lines)
+
+    def build_prompt(self, user_message, chat_history_list=None, summary=None):
+        """Monta o prompt final: instruções + resumo (se houver) + últimas mensagens + pergunta."""
+        parts = [self.SYSTEM_PROMPT]
+        if summary:
+            parts.append(f"\nResumo da conversa até aqui:\n{summary}\n")
+        parts.append("\n")
+        parts.append(self.format_history_for_context(chat_history_list or []))
+        parts.append(f"\n\nCliente: {user_message}\nAssistente:")
+        return "".join(parts)
+
+    def summarize_history(self, previous_summary, messages):
+        """
+        Incorpora `messages` ao resumo anterior usando o Gemini. Retorna None se
+        não houver modelo ou cota (o resumo é tentado de novo na próxima resposta).
+        """
+        if not self.model or not self._acquire_call()[0]:
+            return None
+        prompt = "".join([
+            self.SUMMARY_PROMPT,
+            f"Resumo anterior:\n{previous_summary}\n\n" if previous_summary else "",
+            "Mensagens novas:\n",
+            self.format_history_for_context(messages),
+        ])
+        try:
+            with self.metrics.timer("gemini_latency_seconds"):
+                response = self.model.generate_content(prompt)
+            self.metrics.inc("gemini_calls")
+            self.metrics.inc("summaries")
+            return response.text.strip()
+        except Exception as e:
+            logging.error(f"Erro ao resumir conversa: {e}")
+            self.metrics.inc("gemini_errors")
+            return None
+
+    def generate_response(self, user_message, chat_history_list=None, summary=None):
+        self.last_call_rate_limited = False
+
+        # Cache/FAQ primeiro: resposta imediata sem gastar cota
+        fingerprint = context_fingerprint(self.SYSTEM_PROMPT, chat_history_list, summary=summary)
+        cached, hit_kind = self.answer_cache.lookup(user_message, fingerprint)
+        self.metrics.inc(f"cache_{hit_kind}")
+        if cached:
+            stats = self.answer_cache.get_stats()
+            logging.info(
+                f"💾 Cache de respostas ({hit_kind}): {stats['hits']}/{stats['lookups']} hits "
+                f"({stats['hit_rate']:.1f}%)"
+            )
+            return cached
 
-    def generate_response(self, user_message, chat_history_list=None):
         if not self.model:
             if self.api_key:
                 self.configure_model()
             if not self.model:
                 return "Erro: Chave API do Gemini não configurada ou inválida."
 
-        # Verifica limites antes de chamar
-        can_call, reason = self._can_call_api()
+        # Verifica limites e reserva a chamada antes de chamar
+        can_call, reason = self._acquire_call()
         if not can_call:
-            logging.warning(f"⚠️ Gemini bloqueado: {reason}. Mensagem ignorada.")
-            return None  # None = não responde ao cliente (evita spam)
-
-        context_str = self.format_history_for_context(chat_history_list or [])
-
-        system_prompt = """
-        Você é um assistente virtual presencial (recepcionista) da empresa.
-        Seu tom é profissional, acolhedor e eficiente.
-
-        Diretrizes:
-        1. Responda apenas o que for perguntado ou necessário para o atendimento.
-        2. Se não souber a resposta, peça para o cliente aguardar um atendente humano.
-        3. Não invente informações sobre produtos ou preços que não estão no contexto.
-        4. Mantenha as respostas curtas e objetivas, adequadas para WhatsApp.
-
-        Contexto da conversa anterior:
-        """
-
-        prompt = f"{system_prompt}\n{context_str}\n\nCliente: {user_message}\nAssistente:"
+            logging.warning(f"⚠️ Gemini bloqueado: {reason}. Resposta adiada.")
+            self.metrics.inc("gemini_blocked")
+            self.last_call_rate_limited = True
+            return None  # None = não responde agora (o turno vai para a fila de adiados)
+
+        prompt = self.build_prompt(user_message, chat_history_list, summary)
+
+        # Tamanho do prompt (estimado) para acompanhar custo/latência no Dashboard
+        prompt_tokens = estimate_tokens(prompt)
+        self.metrics.inc("prompts")
+        self.metrics.inc("prompt_tokens", prompt_tokens)
+        self.metrics.set_gauge("last_prompt_tokens", prompt_tokens)
+        logging.debug(
+            f"📏 Prompt: ~{prompt_tokens} tokens ({len(chat_history_list or [])} mensagens, "
+            f"resumo {'sim' if summary else 'não'})"
+        )
 
         try:
-            response = self.model.generate_content(prompt)
+            with self.metrics.timer("gemini_latency_seconds"):
+                response = self.model.generate_content(prompt)
+            self.metrics.inc("gemini_calls")
             self._register_call()
-            return response.text.strip()
+            reply = response.text.strip()
+            self.answer_cache.store(user_message, fingerprint, reply)
+            return reply
         except Exception as e:
             error_str = str(e)
             logging.error(f"Erro na geração de resposta IA: {e}")
+            self.metrics.inc("gemini_errors")
 
             # Rate limit da API (429 / RESOURCE_EXHAUSTED) → aplica cooldown ou troca de modelo
             if "429" in error_str or "quota" in error_str.lower() or "RESOURCE_EXHAUSTED" in error_str:
+                self.metrics.inc("gemini_rate_limited")
                 # "limit: 0" = free tier zerado para este modelo → tenta o próximo
                 if "limit: 0" in error_str:
                     if self._try_next_model():
                         logging.warning("🔄 Modelo com limit:0 — trocando automaticamente para fallback.")
-                        return self.generate_response(user_message, chat_history_list)  # retry com novo modelo
+                        return self.generate_response(user_message, chat_history_list, summary)  # retry com novo modelo
                     else:
                         logging.error("❌ Todos os modelos com limit:0. Aguardando reset diário.")
-                        self._rate_limited_until = time.time() + 3600  # pausa 1h
+                        self._set_cooldown(3600)  # pausa 1h
+                        self.last_call_rate_limited = True
                         return None
 
                 match = re.search(r'retry_delay\s*\{\s*seconds:\s*(\d+)', error_str)
                 wait_seconds = int(match.group(1)) if match else 60
                 wait_seconds = max(wait_seconds, 60)
-                self._rate_limited_until = time.time() + wait_seconds
+                self._set_cooldown(wait_seconds)
                 logging.warning(
                     f"🚫 Rate limit da API! Cooldown de {wait_seconds}s "
                     f"(até {time.strftime('%H:%M:%S', time.localtime(self._rate_limited_until))})"
                 )
+                self.last_call_rate_limited = True
                 return None  # Não manda mensagem de erro ao cliente
 
 
@@ -0,0 +1,50 @@
+import logging
+import os
+from logging.handlers import RotatingFileHandler, TimedRotatingFileHandler
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+
+def setup_bot_logging(log_file, level="INFO", max_bytes=5 * 1024 * 1024, backup_count=3, rotate_when=None):
+    """
+    Configura o log do bot em arquivo com rotação + console.
+
+    Por padrão rotaciona por tamanho (`max_bytes`); com `rotate_when` (ex.:
+    "midnight") rotaciona por tempo. Só age se o logger raiz ainda não tem
+    handlers, como o logging.basicConfig.
+    """
+    if rotate_when:
+        file_handler = TimedRotatingFileHandler(log_file, when=rotate_when, backupCount=backup_count, encoding='utf-8')
+    else:
+        file_handler = RotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+    logging.basicConfig(
+        level=getattr(logging, str(level).upper(), logging.INFO),
+        format=LOG_FORMAT,
+        handlers=[file_handler, logging.StreamHandler()],
+    )
+
+
+def tail_lines(path, n=20, block_size=8192):
+    """
+    Últimas `n` linhas do arquivo, lendo blocos a partir do fim.
+
+    O custo depende só de `n` e do tamanho das linhas, não do tamanho do
+    arquivo. Retorna [] se o arquivo não existe.
+    """
+    if n <= 0:
+        return []
+    try:
+        with open(path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            pos = f.tell()
+            data = b""
+            # n+1 quebras garantem n linhas completas (a última pode não ter \n)
+            while pos > 0 and data.count(b"\n") <= n:
+                step = min(block_size, pos)
+                pos -= step
+                f.seek(pos)
+                data = f.read(step) + data
+    except FileNotFoundError:
+        return []
+    lines = data.decode("utf-8", errors="replace").splitlines()
+    return lines[-n:]
@@ -0,0 +1,144 @@
+import bisect
+import datetime
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import select, insert, update
+
+from services.bot_tables import bot_metrics, ensure_tables
+
+# Limites superiores (segundos) dos buckets dos histogramas de latência
+LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30]
+
+
+class BotMetrics:
+    """
+    Métricas estruturadas do motor do bot: contadores, gauges e histogramas.
+
+    Tudo fica em memória (thread-safe) e é publicado periodicamente como um
+    snapshot JSON numa linha de `bot_metrics`, que o Dashboard lê por chave.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self.started_at = time.time()
+
+    def inc(self, name, amount=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def set_gauge(self, name, value):
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name, seconds):
+        with self._lock:
+            hist = self._histograms.get(name)
+            if hist is None:
+                hist = {"buckets": [0] * (len(LATENCY_BUCKETS) + 1), "count": 0, "sum": 0.0, "max": 0.0}
+                self._histograms[name] = hist
+            hist["buckets"][bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            hist["count"] += 1
+            hist["sum"] += seconds
+            hist["max"] = max(hist["max"], seconds)
+
+    @contextmanager
+    def timer(self, name):
+        """Mede a duração do bloco no histograma `name`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "started_at": self.started_at,
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "histograms": {k: {**v, "buckets": list(v["buckets"])} for k, v in self._histograms.items()},
+            }
+
+
+def histogram_quantile(hist, q):
+    """Estimativa do quantil `q` (0..1): limite superior do bucket que o contém."""
+    if not hist or not hist.get("count"):
+        return None
+    target = q * hist["count"]
+    acc = 0
+    for i, n in enumerate(hist["buckets"]):
+        acc += n
+        if acc >= target:
+            return LATENCY_BUCKETS[i] if i < len(LATENCY_BUCKETS) else hist["max"]
+    return hist["max"]
+
+
+class MetricsPublisher:
+    """Grava o snapshot das métricas no banco a cada `interval_seconds` (no máximo)."""
+
+    def __init__(self, metrics, runner_key, engine=None, interval_seconds=10):
+        self.metrics = metrics
+        self.runner_key = runner_key
+        self.interval_seconds = interval_seconds
+        self._engine = engine
+        self._table_ready = False
+        self._last_publish = 0.0
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            import database_config
+            self._engine = database_config.engine
+        if not self._table_ready:
+            ensure_tables(self._engine, [bot_metrics])
+            self._table_ready = True
+        return self._engine
+
+    def maybe_publish(self, extra_gauges=None):
+        if time.time() - self._last_publish >= self.interval_seconds:
+            self.publish(extra_gauges)
+
+    def publish(self, extra_gauges=None):
+        for name, value in (extra_gauges or {}).items():
+            self.metrics.set_gauge(name, value)
+        payload = json.dumps(self.metrics.snapshot(), default=str)
+        now = datetime.datetime.now()
+        try:
+            with self.engine.begin() as conn:
+                result = conn.execute(
+                    update(bot_metrics).where(bot_metrics.c.runner_key == self.runner_key)
+                    .values(updated_at=now, payload=payload)
+                )
+                if result.rowcount == 0:
+                    conn.execute(insert(bot_metrics).values(runner_key=self.runner_key, updated_at=now, payload=payload))
+            self._last_publish = time.time()
+        except Exception as e:
+            logging.error(f"Erro ao publicar métricas do bot: {e}")
+
+
+def load_metrics(runner_key, engine=None):
+    """Lê o último snapshot publicado (ou None). Uma consulta por chave primária."""
+    if engine is None:
+        import database_config
+        engine = database_config.engine
+    try:
+        with engine.connect() as conn:
+            row = conn.execute(
+                select(bot_metrics.c.updated_at, bot_metrics.c.payload).where(bot_metrics.c.runner_key == runner_key)
+            ).first()
+    except Exception as e:
+        # Tabela ainda não criada (bot nunca publicou) ou banco indisponível
+        logging.debug(f"Métricas do bot indisponíveis: {e}")
+        return None
+    if row is None:
+        return None
+    data = json.loads(row.payload)
+    data["updated_at"] = row.updated_at
+    return data
@@ -0,0 +1,287 @@
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Arquivos de controle (relativos ao diretório de trabalho, como bot_config.json e bot.log)
+LOCK_FILE = "bot_supervisor.lock"
+STATUS_FILE = "bot_supervisor.json"
+CONTROL_FILE = "bot_control.json"
+HEARTBEAT_FILE = "bot_heartbeat.json"
+SUPERVISOR_LOG_FILE = "bot_supervisor.log"
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bot_engine.py")
+
+COMMANDS = ("start", "stop", "restart", "shutdown")
+
+
+def _write_json(path, data):
+    """Grava JSON de forma atômica (quem lê nunca vê arquivo pela metade)."""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def _read_json(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+# --- Lado do worker ---
+
+def write_heartbeat(last_loop_at, path=HEARTBEAT_FILE):
+    """Chamado pelo worker: prova de vida + horário da última volta do loop."""
+    _write_json(path, {"pid": os.getpid(), "heartbeat": time.time(), "last_loop_at": last_loop_at})
+
+
+# --- Lado do Dashboard (canal de controle) ---
+
+def send_command(command, path=CONTROL_FILE):
+    """Envia um comando ao supervisor: start, stop, restart ou shutdown."""
+    if command not in COMMANDS:
+        raise ValueError(f"Comando inválido: {command}")
+    _write_json(path, {"command": command, "sent_at": time.time()})
+
+
+def read_status(path=STATUS_FILE, stale_seconds=15):
+    """Último status publicado pelo supervisor, com `alive` indicando se ele está respondendo."""
+    status = _read_json(path) or {}
+    status["alive"] = bool(status) and status.get("state") != "exited" and \
+        time.time() - status.get("heartbeat", 0) < stale_seconds
+    return status
+
+
+def launch_supervisor():
+    """Inicia o supervisor desacoplado do Streamlit. Se já houver um rodando, o novo sai sozinho."""
+    kwargs = {"stdin": subprocess.DEVNULL, "stdout": subprocess.DEVNULL, "stderr": subprocess.DEVNULL}
+    if os.name == "nt":
+        kwargs["creationflags"] = subprocess.CREATE_NEW_PROCESS_GROUP | subprocess.DETACHED_PROCESS
+    else:
+        kwargs["start_new_session"] = True
+    return subprocess.Popen([sys.executable, os.path.abspath(__file__)], **kwargs)
+
+
+# --- Supervisor ---
+
+class ProcessLock:
+    """Lock de instância única no arquivo. O SO o libera se o processo morrer."""
+
+    def __init__(self, path=LOCK_FILE):
+        self.path = path
+        self._file = None
+
+    def acquire(self):
+        f = open(self.path, "a+")
+        try:
+            if fcntl:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            f.close()
+            return False
+        f.seek(0)
+        f.truncate()
+        f.write(str(os.getpid()))
+        f.flush()
+        self._file = f
+        return True
+
+    def release(self):
+        if self._file is None:
+            return
+        try:
+            if fcntl:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            else:
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self._file.close()
+            self._file = None
+
+
+class BotSupervisor:
+    """
+    Mantém o motor do bot rodando num processo separado do Streamlit.
+
+    Reinicia o worker se ele cair (com backoff exponencial) ou se o heartbeat
+    parar de avançar (loop travado), e atende comandos do Dashboard pelo
+    arquivo de controle. O estado é publicado em STATUS_FILE.
+    """
+
+    def __init__(self, worker_cmd=None, heartbeat_timeout=180, initial_backoff=1, max_backoff=60, stable_seconds=300,
+                 stop_timeout=15, poll_interval=1.0,
+                 lock_file=LOCK_FILE, status_file=STATUS_FILE, control_file=CONTROL_FILE,
+                 heartbeat_file=HEARTBEAT_FILE):
+        self.worker_cmd = worker_cmd or [sys.executable, WORKER_SCRIPT]
+        self.heartbeat_timeout = heartbeat_timeout
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.stable_seconds = stable_seconds
+        self.stop_timeout = stop_timeout
+        self.poll_interval = poll_interval
+        self.lock = ProcessLock(lock_file)
+        self.status_file = status_file
+        self.control_file = control_file
+        self.heartbeat_file = heartbeat_file
+
+        self.desired = "running"
+        self.worker = None
+        self.worker_started_at = None
+        self.restarts = 0
+        self.last_exit_code = None
+        self.last_command = None
+        self._backoff = initial_backoff
+        self._next_start_at = 0.0
+        self._shutdown = False
+
+    # --- Worker ---
+
+    def _start_worker(self):
+        if os.path.exists(self.heartbeat_file):
+            os.remove(self.heartbeat_file)
+        self.worker = subprocess.Popen(self.worker_cmd)
+        self.worker_started_at = time.time()
+        logging.info(f"▶️ Worker do bot iniciado (PID {self.worker.pid}).")
+
+    def _stop_worker(self):
+        if self.worker is None:
+            return
+        if self.worker.poll() is None:
+            self.worker.terminate()  # o worker trata SIGTERM e grava o que estiver pendente
+            try:
+                self.worker.wait(timeout=self.stop_timeout)
+            except subprocess.TimeoutExpired:
+                logging.warning(f"Worker {self.worker.pid} não encerrou em {self.stop_timeout}s. Forçando.")
+                self.worker.kill()
+                self.worker.wait()
+        self.last_exit_code = self.worker.returncode
+        self.worker = None
+
+    def _heartbeat_stale(self):
+        """True se o loop do worker não avança há mais de heartbeat_timeout."""
+        now = time.time()
+        if now - self.worker_started_at < self.heartbeat_timeout:
+            return False
+        beat = _read_json(self.heartbeat_file) or {}
+        if beat.get("pid") != self.worker.pid:
+            return True
+        return now - (beat.get("last_loop_at") or 0) > self.heartbeat_timeout
+
+    def _schedule_restart(self):
+        """Agenda novo start com backoff; zera o backoff se o worker ficou estável."""
+        if time.time() - self.worker_started_at >= self.stable_seconds:
+            self._backoff = self.initial_backoff
+        self._next_start_at = time.time() + self._backoff
+        logging.warning(f"🔁 Reiniciando worker em {self._backoff:g}s (saída: {self.last_exit_code}).")
+        self._backoff = min(self._backoff * 2, self.max_backoff)
+        self.restarts += 1
+
+    def _check_worker(self):
+        if self.desired != "running":
+            return
+        if self.worker is None:
+            if time.time() >= self._next_start_at:
+                self._start_worker()
+            return
+        exit_code = self.worker.poll()
+        if exit_code is not None:
+            self.last_exit_code = exit_code
+            logging.error(f"💥 Worker do bot encerrou inesperadamente (código {exit_code}).")
+            self.worker = None
+            self._schedule_restart()
+        elif self._heartbeat_stale():
+            logging.error(f"⏱️ Heartbeat do worker parado há mais de {self.heartbeat_timeout}s. Reiniciando.")
+            self._stop_worker()
+            self._schedule_restart()
+
+    # --- Canal de controle ---
+
+    def _read_command(self):
+        data = _read_json(self.control_file)
+        if data is None:
+            return None
+        try:
+            os.remove(self.control_file)
+        except FileNotFoundError:
+            pass
+        return data.get("command")
+
+    def _handle_command(self, command):
+        if command not in COMMANDS:
+            logging.warning(f"Comando desconhecido ignorado: {command}")
+            return
+        logging.info(f"📨 Comando recebido: {command}")
+        self.last_command = {"command": command, "at": time.time()}
+        if command == "stop":
+            self.desired = "stopped"
+            self._stop_worker()
+        elif command == "start":
+            self.desired = "running"
+            self._next_start_at = 0.0
+            self._backoff = self.initial_backoff
+        elif command == "restart":
+            self._stop_worker()
+            self.desired = "running"
+            self._next_start_at = 0.0
+            self._backoff = self.initial_backoff
+        elif command == "shutdown":
+            self._shutdown = True
+
+    def _publish_status(self, state=None):
+        beat = _read_json(self.heartbeat_file) or {}
+        _write_json(self.status_file, {
+            "pid": os.getpid(),
+            "state": state or ("restarting" if self.desired == "running" and self.worker is None else self.desired),
+            "heartbeat": time.time(),
+            "worker_pid": self.worker.pid if self.worker else None,
+            "worker_started_at": self.worker_started_at if self.worker else None,
+            "worker_last_loop_at": beat.get("last_loop_at") if self.worker else None,
+            "restarts": self.restarts,
+            "last_exit_code": self.last_exit_code,
+            "last_command": self.last_command,
+        })
+
+    def run(self):
+        if not self.lock.acquire():
+            logging.info("Outro supervisor do bot já está rodando. Saindo.")
+            return 1
+        logging.info(f"🛡️ Supervisor do bot iniciado (PID {os.getpid()}).")
+        self._read_command()  # descarta comando antigo deixado no arquivo
+        try:
+            while not self._shutdown:
+                command = self._read_command()
+                if command:
+                    self._handle_command(command)
+                self._check_worker()
+                self._publish_status()
+                time.sleep(self.poll_interval)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._stop_worker()
+            self._publish_status(state="exited")
+            self.lock.release()
+            logging.info("Supervisor do bot encerrado.")
+        return 0
+
+
+if __name__ == "__main__":
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from services.bot_logging import setup_bot_logging
+    setup_bot_logging(SUPERVISOR_LOG_FILE)
+    sys.exit(BotSupervisor().run())
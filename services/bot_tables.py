@@ -0,0 +1,191 @@
+"""
+Definições SQLAlchemy Core das tabelas usadas pelo motor do bot.
+
+Não dependem de models.py (que importa Streamlit e roda create_all no import),
+então o bot e os testes podem usá-las com qualquer engine.
+"""
+import logging
+import threading
+
+from sqlalchemy import MetaData, Table, Column, Integer, String, Text, DateTime, Float, Boolean, UniqueConstraint
+from sqlalchemy import inspect, text, true
+
+metadata = MetaData()
+
+# Espelha models_src.ChatHistory (mesmo nome de tabela e colunas)
+chat_history = Table(
+    "chat_history", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("phone_number", String, nullable=False, index=True),
+    Column("role", String, nullable=False),
+    Column("content", String, nullable=False),
+    Column("timestamp", DateTime, nullable=False),
+    Column("is_read", Integer, nullable=False, default=0),
+    Column("external_id", String, nullable=True, index=True),
+)
+
+# Resumo acumulado de cada conversa (cobre o chat_history até covered_until_id)
+chat_summaries = Table(
+    "chat_summaries", metadata,
+    Column("phone_number", String, primary_key=True),
+    Column("summary", Text, nullable=False),
+    Column("covered_until_id", Integer, nullable=False),  # último chat_history.id incluído no resumo
+    Column("covered_messages", Integer, nullable=False, default=0),
+    Column("updated_at", DateTime, nullable=False),
+)
+
+# Turnos que ficaram sem resposta por limite de cota do Gemini (um por conversa)
+pending_replies = Table(
+    "pending_replies", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("phone_number", String, nullable=False, index=True),
+    Column("remote_jid", String, nullable=False),
+    Column("text", Text, nullable=False),
+    Column("message_ids", Text, nullable=True),  # IDs externos separados por vírgula
+    Column("instance", String, nullable=True),   # instância da Evolution API (NULL = principal)
+    Column("status", String, nullable=False, default="pending", index=True),  # pending | done | expired | failed
+    Column("attempts", Integer, nullable=False, default=0),
+    Column("created_at", DateTime, nullable=False),
+    Column("updated_at", DateTime, nullable=False),
+)
+
+# Fila persistente de mensagens de saída (WhatsApp), enviada com ritmo e retry
+outbound_messages = Table(
+    "outbound_messages", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("phone_number", String, nullable=False),
+    Column("remote_jid", String, nullable=False),
+    Column("text", Text, nullable=False),
+    Column("status", String, nullable=False, default="queued", index=True),  # queued | sent | failed | expired
+    Column("attempts", Integer, nullable=False, default=0),
+    Column("next_attempt_at", Float, nullable=False, default=0),  # epoch (s)
+    Column("last_error", String, nullable=True),
+    Column("created_at", DateTime, nullable=False),
+    Column("sent_at", DateTime, nullable=True),
+    Column("instance", String, nullable=True),  # instância da Evolution API que envia (NULL = principal)
+)
+
+# Token bucket + contador diário compartilhados por todos os runners/processos
+rate_limits = Table(
+    "bot_rate_limits", metadata,
+    Column("bucket", String, primary_key=True),
+    Column("tokens", Float, nullable=False),
+    Column("refilled_at", Float, nullable=False),     # epoch (s) do último reabastecimento
+    Column("day", String, nullable=False),            # YYYY-MM-DD do contador diário
+    Column("day_count", Integer, nullable=False, default=0),
+    Column("cooldown_until", Float, nullable=False, default=0),  # epoch (s) do fim do cooldown (429)
+    Column("version", Integer, nullable=False, default=0),       # controle otimista de concorrência
+)
+
+# Último snapshot de métricas de cada runner (uma linha por chave, lida em O(1) pelo Dashboard)
+bot_metrics = Table(
+    "bot_metrics", metadata,
+    Column("runner_key", String, primary_key=True),
+    Column("updated_at", DateTime, nullable=False),
+    Column("payload", Text, nullable=False),  # JSON de BotMetrics.snapshot()
+)
+
+# Lease de liderança: só o runner que detém a linha (e não expirou) faz polling e responde
+bot_leases = Table(
+    "bot_leases", metadata,
+    Column("name", String, primary_key=True),
+    Column("holder", String, nullable=True),                 # host:pid:sufixo do líder atual
+    Column("term", Integer, nullable=False, default=0),      # incrementa a cada troca de líder
+    Column("acquired_at", Float, nullable=False, default=0),  # epoch (s)
+    Column("expires_at", Float, nullable=False, default=0),   # epoch (s); expirado = livre
+)
+
+# Campanhas de divulgação para clientes com receber_atualizacoes (disparadas pelo worker do bot)
+campaigns = Table(
+    "campaigns", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("template", Text, nullable=False),
+    Column("status", String, nullable=False, default="draft", index=True),  # draft | running | paused | done | cancelled
+    Column("cursor_cliente_id", Integer, nullable=False, default=0),  # checkpoint do keyset (último cliente concluído)
+    Column("total", Integer, nullable=True),                           # destinatários elegíveis no início
+    Column("sent", Integer, nullable=False, default=0),
+    Column("failed", Integer, nullable=False, default=0),
+    Column("rate_per_minute", Integer, nullable=False, default=20),
+    Column("concurrency", Integer, nullable=False, default=2),
+    Column("active_seconds", Float, nullable=False, default=0),        # tempo efetivo de envio (sem pausas)
+    Column("last_error", String, nullable=True),
+    Column("created_at", DateTime, nullable=False),
+    Column("started_at", DateTime, nullable=True),
+    Column("finished_at", DateTime, nullable=True),
+    Column("updated_at", DateTime, nullable=False),
+)
+
+# Um registro por destinatário processado: evita reenvio ao retomar depois de uma queda
+campaign_deliveries = Table(
+    "campaign_deliveries", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("campaign_id", Integer, nullable=False, index=True),
+    Column("cliente_id", Integer, nullable=False),
+    Column("phone_number", String, nullable=True),
+    Column("status", String, nullable=False),  # sent | failed
+    Column("error", String, nullable=True),
+    Column("created_at", DateTime, nullable=False),
+    UniqueConstraint("campaign_id", "cliente_id", name="uq_campaign_deliveries_cliente"),
+)
+
+# Espelho somente-leitura de clientes/contatos (models_src), só com as colunas que o bot lê.
+# Fica em outro MetaData para ensure_tables nunca criá-las: o schema é do app.
+customer_metadata = MetaData()
+
+clientes = Table(
+    "clientes", customer_metadata,
+    Column("id", Integer, primary_key=True),
+    Column("nome_completo", String, nullable=False),
+    Column("receber_atualizacoes", Boolean, nullable=False, default=False),
+)
+
+contatos = Table(
+    "contatos", customer_metadata,
+    Column("id", Integer, primary_key=True),
+    Column("cliente_id", Integer, nullable=False),
+    Column("nome_contato", String, nullable=True),
+    Column("telefone", String, nullable=True),
+    Column("tipo_contato", String, nullable=True),
+)
+
+
+# Vários runners (um por instância) criam as mesmas tabelas ao mesmo tempo no início
+_ensure_lock = threading.Lock()
+
+
+def ensure_tables(engine, tables=None):
+    """Cria as tabelas do bot que ainda não existirem (checkfirst) e as colunas anuláveis novas."""
+    with _ensure_lock:
+        metadata.create_all(engine, tables=tables, checkfirst=True)
+        _add_missing_columns(engine, tables or metadata.sorted_tables)
+
+
+def _add_missing_columns(engine, tables):
+    """ALTER TABLE para colunas anuláveis adicionadas depois que a tabela já existia no banco."""
+    inspector = inspect(engine)
+    for table in tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing or not column.nullable:
+                continue
+            try:
+                with engine.begin() as conn:
+                    conn.execute(text(
+                        f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(engine.dialect)}"
+                    ))
+                logging.info(f"Coluna {table.name}.{column.name} adicionada.")
+            except Exception as e:  # outro processo pode ter adicionado ao mesmo tempo
+                logging.warning(f"Não foi possível adicionar {table.name}.{column.name}: {e}")
+
+
+def instance_clause(column, instance, include_unassigned=False):
+    """
+    Filtro das filas por instância da Evolution API. `instance=None` não filtra
+    (uma instância só); `include_unassigned` inclui linhas antigas sem instância.
+    """
+    if instance is None:
+        return true()
+    if include_unassigned:
+        return column.is_(None) | (column == instance)
+    return column == instance
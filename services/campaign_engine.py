@@ -0,0 +1,442 @@
+"""
+Campanhas de divulgação pelo WhatsApp para clientes que marcaram
+`receber_atualizacoes` no cadastro.
+
+O Dashboard só cria campanhas e muda o status (running/paused/cancelled) no
+banco; quem envia é o CampaignRunner, uma thread do worker do bot (apenas no
+líder). Os destinatários são lidos em lotes por keyset (`clientes.id > cursor`),
+sem carregar a base inteira, e o cursor é gravado a cada lote: uma campanha de
+50 mil clientes pode ser pausada, ou o worker reiniciado, e ela continua de onde
+parou sem reenviar para ninguém.
+"""
+import concurrent.futures
+import datetime
+import logging
+import re
+import string
+import threading
+import time
+
+from sqlalchemy import select, insert, update, func, and_
+from sqlalchemy.exc import IntegrityError
+
+from services.bot_metrics import BotMetrics
+from services.bot_tables import campaigns, campaign_deliveries, clientes, contatos, ensure_tables
+from services.rate_limiter import SharedRateLimiter
+
+# Bucket do SharedRateLimiter: o teto vale para todas as campanhas e réplicas juntas
+CAMPAIGN_BUCKET = "whatsapp:campaigns"
+
+# Campos aceitos no texto da campanha, ex.: "Olá {nome}, temos novidades!"
+TEMPLATE_FIELDS = ("nome", "nome_completo", "contato")
+
+_ready_engines = set()
+
+
+def _engine(engine=None):
+    if engine is None:
+        import database_config
+        engine = database_config.engine
+    if engine not in _ready_engines:
+        ensure_tables(engine, [campaigns, campaign_deliveries])
+        _ready_engines.add(engine)
+    return engine
+
+
+# --- Texto e destinatários ---
+
+class _Fields(dict):
+    def __missing__(self, key):
+        return "{" + key + "}"
+
+
+def validate_template(template):
+    """Levanta ValueError se o texto estiver vazio, malformado ou usar campos desconhecidos."""
+    if not template or not template.strip():
+        raise ValueError("O texto da campanha está vazio.")
+    try:
+        fields = {field for _, field, _, _ in string.Formatter().parse(template) if field is not None}
+    except ValueError as e:
+        raise ValueError(f"Texto da campanha malformado: {e}")
+    unknown = sorted(fields - set(TEMPLATE_FIELDS))
+    if unknown:
+        allowed = ", ".join("{" + f + "}" for f in TEMPLATE_FIELDS)
+        raise ValueError(f"Campos desconhecidos no texto: {', '.join(unknown) or '{}'}. Use apenas {allowed}.")
+
+
+def render_template(template, recipient):
+    """Texto da campanha personalizado para um destinatário (dict de iter_recipients)."""
+    nome_completo = (recipient.get("nome_completo") or "").strip()
+    nome = nome_completo.split(" ")[0].title() if nome_completo else ""
+    fields = {
+        "nome": nome,
+        "nome_completo": nome_completo,
+        "contato": (recipient.get("nome_contato") or "").strip() or nome,
+    }
+    return template.format_map(_Fields(fields))
+
+
+def whatsapp_number(telefone):
+    """Número no formato da Evolution API (55 + DDD + número) ou None se inválido."""
+    digits = re.sub(r"[^0-9]", "", telefone or "")
+    if len(digits) in (10, 11):
+        return f"55{digits}"
+    if len(digits) in (12, 13) and digits.startswith("55"):
+        return digits
+    return None
+
+
+def _recipients_query():
+    return (
+        select(clientes.c.id, clientes.c.nome_completo, contatos.c.nome_contato, contatos.c.telefone)
+        .join(contatos, and_(contatos.c.cliente_id == clientes.c.id, contatos.c.tipo_contato == "Principal"))
+        .where(clientes.c.receber_atualizacoes.is_(True),
+               contatos.c.telefone.is_not(None), contatos.c.telefone != "")
+    )
+
+
+def iter_recipients(after_id=0, batch_size=500, engine=None):
+    """
+    Gera lotes de destinatários (cliente com opt-in + telefone do contato
+    Principal) em ordem de `clientes.id`, a partir de `after_id`.
+
+    Cada lote é uma consulta curta por keyset; nenhuma conexão fica aberta
+    entre um lote e outro.
+    """
+    engine = _engine(engine)
+    while True:
+        with engine.connect() as conn:
+            rows = conn.execute(
+                _recipients_query()
+                .where(clientes.c.id > after_id)
+                .order_by(clientes.c.id, contatos.c.id)
+                .limit(batch_size)
+            ).all()
+        if not rows:
+            return
+        batch, seen = [], set()
+        for row in rows:
+            if row.id in seen:  # mais de um contato Principal: usa o primeiro
+                continue
+            seen.add(row.id)
+            batch.append({"cliente_id": row.id, "nome_completo": row.nome_completo,
+                          "nome_contato": row.nome_contato, "telefone": row.telefone})
+        yield batch
+        after_id = rows[-1].id
+
+
+def count_recipients(engine=None):
+    """Quantos clientes receberiam uma campanha agora."""
+    query = _recipients_query().with_only_columns(func.count(func.distinct(clientes.c.id)))
+    with _engine(engine).connect() as conn:
+        return conn.execute(query).scalar() or 0
+
+
+# --- Campanhas (usado pelo Dashboard) ---
+
+# Transições permitidas: status novo -> status de origem aceitos
+_TRANSITIONS = {
+    "running": ("draft", "paused"),
+    "paused": ("running",),
+    "cancelled": ("draft", "running", "paused"),
+}
+
+
+def create_campaign(name, template, rate_per_minute=20, concurrency=2, engine=None):
+    """Cria a campanha como rascunho e retorna o id. Levanta ValueError se o texto for inválido."""
+    validate_template(template)
+    now = datetime.datetime.now()
+    with _engine(engine).begin() as conn:
+        result = conn.execute(insert(campaigns).values(
+            name=name.strip() or "Campanha", template=template, status="draft", cursor_cliente_id=0,
+            sent=0, failed=0, rate_per_minute=max(int(rate_per_minute), 1),
+            concurrency=max(int(concurrency), 1), active_seconds=0, created_at=now, updated_at=now,
+        ))
+    return result.inserted_primary_key[0]
+
+
+def set_campaign_status(campaign_id, status, engine=None):
+    """Inicia/pausa/retoma/cancela. Retorna False se a transição não se aplica ao status atual."""
+    values = {"status": status, "updated_at": datetime.datetime.now()}
+    if status == "running":
+        values["last_error"] = None
+    with _engine(engine).begin() as conn:
+        result = conn.execute(
+            update(campaigns)
+            .where(campaigns.c.id == campaign_id, campaigns.c.status.in_(_TRANSITIONS[status]))
+            .values(**values)
+        )
+    return result.rowcount > 0
+
+
+def list_campaigns(limit=20, engine=None):
+    """Campanhas mais recentes com progresso, vazão (msgs/min) e previsão de término."""
+    with _engine(engine).connect() as conn:
+        rows = conn.execute(select(campaigns).order_by(campaigns.c.id.desc()).limit(limit)).mappings().all()
+    result = []
+    for row in rows:
+        item = dict(row)
+        processed = item["sent"] + item["failed"]
+        item["processed"] = processed
+        item["throughput_per_minute"] = processed / item["active_seconds"] * 60 if item["active_seconds"] else 0.0
+        item["progress"] = min(processed / item["total"], 1.0) if item["total"] else 0.0
+        remaining = (item["total"] or 0) - processed
+        item["eta_seconds"] = (remaining / item["throughput_per_minute"] * 60
+                               if item["throughput_per_minute"] and remaining > 0 else None)
+        result.append(item)
+    return result
+
+
+# --- Envio (worker do bot) ---
+
+class CampaignRunner(threading.Thread):
+    """
+    Envia as campanhas em status `running`, uma de cada vez, na ordem de criação.
+
+    O ritmo é o `rate_per_minute` da campanha: intervalo mínimo entre envios
+    neste processo e um SharedRateLimiter (por minuto e por dia) que vale para
+    todas as réplicas. Até `concurrency` envios HTTP ficam em andamento ao mesmo
+    tempo, para a latência da Evolution API não derrubar a vazão. O status é
+    relido a cada `status_check_seconds`, então pausar pelo Dashboard tem efeito
+    em segundos. Os contadores (enviadas, falhas, tempo ativo) sobem a cada
+    entrega, junto com o registro dela; o cursor é gravado a cada lote.
+    """
+
+    def __init__(self, engine=None, sender=None, batch_size=50, max_per_day=1000,
+                 status_check_seconds=5.0, max_consecutive_failures=10,
+                 metrics=None, on_sent=None, can_send=None):
+        super().__init__(name="CampaignRunner")
+        self.daemon = True
+        self._engine = engine
+        self.sender = sender  # sender(number, text) -> resposta | None (EvolutionService.send_message)
+        self.batch_size = batch_size
+        self.max_per_day = max_per_day
+        self.status_check_seconds = status_check_seconds
+        self.max_consecutive_failures = max_consecutive_failures
+        self.metrics = metrics or BotMetrics()
+        self.on_sent = on_sent      # on_sent(number, text) após entrega (ex.: gravar no chat_history)
+        self.can_send = can_send    # can_send() -> bool (ex.: só o líder envia)
+        self._last_send_at = 0.0
+        self._status_cache = (None, 0.0, None)  # (campaign_id, verificado_em, status)
+        self._failures_lock = threading.Lock()
+        self._consecutive_failures = 0
+        self._progress_lock = threading.Lock()
+        self._progress_mark = time.time()  # até quando o tempo ativo já foi somado à campanha
+        self._stop_event = threading.Event()
+
+    @property
+    def engine(self):
+        return _engine(self._engine)
+
+    def _ready(self):
+        return self.sender is not None and (self.can_send is None or self.can_send())
+
+    def _status(self, campaign_id):
+        with self.engine.connect() as conn:
+            return conn.execute(select(campaigns.c.status).where(campaigns.c.id == campaign_id)).scalar()
+
+    def _still_running(self, campaign_id, force=False):
+        """False se a campanha foi pausada/cancelada, a thread parou ou a réplica perdeu a liderança."""
+        if self._stop_event.is_set() or not self._ready():
+            return False
+        cached_id, checked_at, status = self._status_cache
+        now = time.time()
+        if force or cached_id != campaign_id or now - checked_at >= self.status_check_seconds:
+            status = self._status(campaign_id)
+            self._status_cache = (campaign_id, now, status)
+        return status == "running"
+
+    def _update(self, campaign_id, **values):
+        values["updated_at"] = datetime.datetime.now()
+        with self.engine.begin() as conn:
+            conn.execute(update(campaigns).where(campaigns.c.id == campaign_id).values(**values))
+
+    def _counts(self, campaign_id):
+        """(enviadas, falhas) a partir dos registros de entrega: corrige contadores após uma queda."""
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                select(campaign_deliveries.c.status, func.count())
+                .where(campaign_deliveries.c.campaign_id == campaign_id)
+                .group_by(campaign_deliveries.c.status)
+            ).all()
+        counts = dict(rows)
+        return counts.get("sent", 0), counts.get("failed", 0)
+
+    def _already_processed(self, campaign_id, cliente_ids):
+        with self.engine.connect() as conn:
+            return set(conn.execute(
+                select(campaign_deliveries.c.cliente_id).where(
+                    campaign_deliveries.c.campaign_id == campaign_id,
+                    campaign_deliveries.c.cliente_id.in_(cliente_ids),
+                )
+            ).scalars())
+
+    def _record(self, campaign_id, cliente_id, number, status, error=None):
+        """Registra a entrega e, na mesma transação, soma ao contador e ao tempo ativo da campanha."""
+        with self._progress_lock:
+            now = time.time()
+            elapsed, self._progress_mark = now - self._progress_mark, now
+        counter = campaigns.c.sent if status == "sent" else campaigns.c.failed
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(insert(campaign_deliveries).values(
+                    campaign_id=campaign_id, cliente_id=cliente_id, phone_number=number,
+                    status=status, error=error, created_at=datetime.datetime.now(),
+                ))
+                conn.execute(
+                    update(campaigns).where(campaigns.c.id == campaign_id)
+                    .values({counter: counter + 1, campaigns.c.active_seconds: campaigns.c.active_seconds + elapsed})
+                )
+        except IntegrityError:
+            pass  # já registrado (outra réplica ou retomada); não conta em dobro
+
+    def _deliver(self, campaign_id, recipient, number, text):
+        """Roda no pool: um envio HTTP + registro da entrega. Retorna 'sent' ou 'failed'."""
+        self.metrics.inc("campaign_attempts")
+        try:
+            with self.metrics.timer("campaign_send_latency_seconds"):
+                result = self.sender(number, text)
+        except Exception as e:
+            result, error = None, str(e)
+        else:
+            error = None if result else "envio recusado ou sem resposta da Evolution API"
+
+        status = "sent" if result else "failed"
+        self._record(campaign_id, recipient["cliente_id"], number, status, error)
+        with self._failures_lock:
+            self._consecutive_failures = 0 if result else self._consecutive_failures + 1
+        if result:
+            self.metrics.inc("campaign_sent")
+            if self.on_sent:
+                try:
+                    self.on_sent(number, text)
+                except Exception as e:
+                    logging.error(f"Erro ao registrar envio de campanha para {number}: {e}")
+        else:
+            self.metrics.inc("campaign_failed")
+            logging.warning(f"Falha ao enviar campanha para {number}: {error}")
+        return status
+
+    def _wait_turn(self, campaign_id, interval, limiter):
+        """Aguarda o intervalo mínimo e uma vaga no limitador global. False se for para parar."""
+        wait = self._last_send_at + interval - time.time()
+        if wait > 0 and self._stop_event.wait(wait):
+            return False
+        while True:
+            if not self._still_running(campaign_id):
+                return False
+            ok, reason = limiter.try_acquire()
+            if ok:
+                self._last_send_at = time.time()
+                return True
+            logging.debug(f"Campanha {campaign_id} aguardando cota de envio: {reason}")
+            if self._stop_event.wait(min(max(interval, 1.0), 30.0)):
+                return False
+
+    def _start(self, campaign):
+        """Na primeira execução grava o total de destinatários; na retomada recalcula os contadores."""
+        if campaign["total"] is None:
+            total = count_recipients(self.engine)
+            self._update(campaign["id"], total=total, started_at=datetime.datetime.now())
+            logging.info(f"📣 Campanha '{campaign['name']}' iniciada para {total} clientes.")
+            return 0, 0
+        sent, failed = self._counts(campaign["id"])
+        self._update(campaign["id"], sent=sent, failed=failed)
+        logging.info(f"📣 Retomando campanha '{campaign['name']}' ({sent + failed}/{campaign['total']} processados).")
+        return sent, failed
+
+    def run_campaign(self, campaign):
+        """
+        Envia a campanha até terminar, ser pausada/cancelada ou a thread parar.
+        Retorna o status final ('done', 'paused', 'cancelled' ou 'running' se interrompida).
+        """
+        campaign_id = campaign["id"]
+        interval = 60.0 / max(campaign["rate_per_minute"], 1)
+        limiter = SharedRateLimiter(self.engine, bucket=CAMPAIGN_BUCKET,
+                                    per_minute=campaign["rate_per_minute"], per_day=self.max_per_day)
+        inflight = threading.BoundedSemaphore(campaign["concurrency"])
+        sent, failed = self._start(campaign)
+        self._consecutive_failures = 0
+        self._progress_mark = time.time()  # tempo pausado não conta como ativo
+        interrupted = False
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=campaign["concurrency"],
+                                                   thread_name_prefix="campaign") as pool:
+            for batch in iter_recipients(campaign["cursor_cliente_id"], self.batch_size, self.engine):
+                processed = self._already_processed(campaign_id, [r["cliente_id"] for r in batch])
+                futures, cursor = [], None
+
+                for recipient in batch:
+                    if recipient["cliente_id"] in processed:
+                        cursor = recipient["cliente_id"]
+                        continue
+                    if self._consecutive_failures >= self.max_consecutive_failures:
+                        interrupted = True
+                        break
+                    number = whatsapp_number(recipient["telefone"])
+                    if number is None:
+                        self._record(campaign_id, recipient["cliente_id"], recipient["telefone"],
+                                     "failed", "telefone inválido")
+                        failed += 1
+                        cursor = recipient["cliente_id"]
+                        continue
+                    if not self._wait_turn(campaign_id, interval, limiter):
+                        interrupted = True
+                        break
+                    inflight.acquire()
+                    future = pool.submit(self._deliver, campaign_id, recipient, number,
+                                         render_template(campaign["template"], recipient))
+                    future.add_done_callback(lambda _: inflight.release())
+                    futures.append(future)
+                    cursor = recipient["cliente_id"]
+
+                # Checkpoint: só avança o cursor depois que todos os envios do lote terminaram
+                for future in futures:
+                    if future.result() == "sent":
+                        sent += 1
+                    else:
+                        failed += 1
+                if cursor is not None:
+                    self._update(campaign_id, cursor_cliente_id=cursor)
+                if interrupted:
+                    break
+
+        if self._consecutive_failures >= self.max_consecutive_failures:
+            error = f"Pausada após {self._consecutive_failures} falhas seguidas de envio"
+            logging.error(f"❌ Campanha {campaign_id}: {error.lower()}.")
+            self._update(campaign_id, status="paused", last_error=error)
+            return "paused"
+        if not interrupted:
+            # Terminou a lista: só marca como concluída se ninguém pausou/cancelou nesse meio tempo
+            with self.engine.begin() as conn:
+                conn.execute(update(campaigns).where(campaigns.c.id == campaign_id, campaigns.c.status == "running")
+                             .values(status="done", finished_at=datetime.datetime.now(),
+                                     updated_at=datetime.datetime.now()))
+            logging.info(f"✅ Campanha {campaign_id} concluída: {sent} enviadas, {failed} falhas.")
+        return self._status(campaign_id)
+
+    def _next_campaign(self):
+        with self.engine.connect() as conn:
+            return conn.execute(
+                select(campaigns).where(campaigns.c.status == "running").order_by(campaigns.c.id).limit(1)
+            ).mappings().first()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            wait = 5.0
+            try:
+                if self._ready():
+                    campaign = self._next_campaign()
+                    if campaign:
+                        self.run_campaign(campaign)
+                        wait = 0.5
+            except Exception as e:
+                logging.error(f"Erro no envio de campanhas: {e}")
+                wait = 30.0
+            self._stop_event.wait(wait)
+
+    def stop(self, timeout=15):
+        """Para após os envios em andamento; o cursor já gravado permite retomar depois."""
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout)
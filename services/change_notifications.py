@@ -0,0 +1,303 @@
+"""
+Aviso de mudanças nos dados para invalidar caches entre sessões e processos.
+
+Triggers no banco registram toda escrita em `clientes`, `contatos`,
+`enderecos` e `chat_history` — venha ela do app, do bot ou de uma
+restauração de backup:
+
+- Postgres: `pg_notify` no canal CHANNEL; o ChangeListener faz LISTEN numa
+  conexão dedicada (Session Mode ou direta: LISTEN não funciona pelo pooler em
+  Transaction Mode) e recebe os avisos na hora.
+- SQLite (testes/dev): não há NOTIFY; os triggers gravam em `app_changes`
+  e o ChangeListener consulta essa tabela a cada `poll_seconds`.
+
+Cada aviso vira (entidade, id): o id do cliente para clientes/contatos/
+enderecos e o telefone para chat_history; id None significa "tudo" (TRUNCATE
+ou reconexão, quando avisos podem ter sido perdidos).
+
+Os caches só usam TTL longo (`cache_ttl`) depois que um aviso de teste, emitido
+pelo engine normal do app, chegou de volta na conexão de escuta.
+"""
+import json
+import logging
+import select
+import threading
+import time
+import uuid
+
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.pool import NullPool
+
+CHANNEL = "app_changes"
+
+# Entidade do aviso de teste (ida e volta); não é repassado aos assinantes
+PING_ENTITY = "_ping"
+
+# Tabela observada -> coluna que identifica o que mudou
+WATCHED_TABLES = {
+    "clientes": "id",
+    "contatos": "cliente_id",
+    "enderecos": "cliente_id",
+    "chat_history": "phone_number",
+}
+
+# Entidades que pertencem a um cliente (invalidam o cache daquele cliente)
+CUSTOMER_ENTITIES = ("clientes", "contatos", "enderecos")
+
+_PG_FUNCTION = f"""
+CREATE OR REPLACE FUNCTION notify_app_change() RETURNS trigger AS $$
+DECLARE
+    row_data jsonb;
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        PERFORM pg_notify('{CHANNEL}', json_build_object('entity', TG_TABLE_NAME, 'id', NULL)::text);
+        RETURN NULL;
+    ELSIF TG_OP = 'DELETE' THEN
+        row_data := to_jsonb(OLD);
+    ELSE
+        row_data := to_jsonb(NEW);
+    END IF;
+    PERFORM pg_notify('{CHANNEL}', json_build_object('entity', TG_TABLE_NAME, 'id', row_data ->> TG_ARGV[0])::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+
+def ensure_change_triggers(engine):
+    """Instala (ou atualiza) os triggers de aviso nas tabelas observadas que existem. Idempotente."""
+    existing = set(inspect(engine).get_table_names())
+    tables = {table: key for table, key in WATCHED_TABLES.items() if table in existing}
+
+    with engine.begin() as conn:
+        if engine.dialect.name == "postgresql":
+            conn.execute(text(_PG_FUNCTION))
+            for table, key in tables.items():
+                conn.execute(text(
+                    f"CREATE OR REPLACE TRIGGER app_changes_notify AFTER INSERT OR UPDATE OR DELETE ON {table} "
+                    f"FOR EACH ROW EXECUTE FUNCTION notify_app_change('{key}')"
+                ))
+                conn.execute(text(
+                    f"CREATE OR REPLACE TRIGGER app_changes_truncate AFTER TRUNCATE ON {table} "
+                    f"FOR EACH STATEMENT EXECUTE FUNCTION notify_app_change('{key}')"
+                ))
+            return
+
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS app_changes (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                entity VARCHAR(50) NOT NULL,
+                entity_id VARCHAR(255),
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """))
+        for table, key in tables.items():
+            for operation, row in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")):
+                conn.execute(text(
+                    f"CREATE TRIGGER IF NOT EXISTS app_changes_{table}_{operation.lower()} "
+                    f"AFTER {operation} ON {table} BEGIN "
+                    f"INSERT INTO app_changes (entity, entity_id) VALUES ('{table}', {row}.{key}); END"
+                ))
+
+
+def _parse_id(entity, value):
+    if value is None or entity not in CUSTOMER_ENTITIES:
+        return value
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return value
+
+
+class ChangeListener(threading.Thread):
+    """
+    Thread por processo que recebe os avisos de mudança e chama os assinantes
+    com a lista de (entidade, id) — sem repetição — de cada rodada.
+    """
+
+    # Linhas de app_changes (SQLite) mais antigas que isso são apagadas
+    KEEP_SECONDS = 3600
+    # Prazo para o aviso de teste voltar antes de logar que a escuta não funciona
+    CONFIRM_SECONDS = 10
+
+    def __init__(self, engine=None, poll_seconds=1.0, reconnect_seconds=5.0, listen_url=None):
+        super().__init__(name="ChangeListener")
+        self.daemon = True
+        self._engine = engine
+        self.listen_url = listen_url
+        self._listen_engine = None
+        self.poll_seconds = poll_seconds
+        self.reconnect_seconds = reconnect_seconds
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._last_change_id = None
+        self._last_purge_at = 0.0
+        self.connected = threading.Event()
+        # Ida e volta de um aviso confirmada nesta conexão: só então os caches podem usar TTL longo
+        self.confirmed = threading.Event()
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            import database_config
+            self._engine = database_config.engine
+        return self._engine
+
+    @property
+    def listen_engine(self):
+        """Engine da conexão de LISTEN: `listen_url`, ou LISTEN_DATABASE_URL quando o engine é o padrão."""
+        if self._listen_engine is None:
+            url = self.listen_url
+            if url is None and self._engine is None:
+                import database_config
+                url = database_config.LISTEN_DATABASE_URL
+            self._listen_engine = create_engine(url, poolclass=NullPool) if url else self.engine
+        return self._listen_engine
+
+    def cache_ttl(self, short_seconds, long_seconds):
+        """TTL para os caches: longo só enquanto os avisos comprovadamente chegam."""
+        return long_seconds if self.confirmed.is_set() else short_seconds
+
+    def subscribe(self, key, callback):
+        """
+        Registra `callback(changes)`; `key` identifica o assinante, então chamar
+        de novo (ex.: a cada rerun da página) só substitui o callback anterior.
+        """
+        with self._lock:
+            self._subscribers[key] = callback
+
+    def unsubscribe(self, key):
+        with self._lock:
+            self._subscribers.pop(key, None)
+
+    def dispatch(self, changes):
+        changes = list(dict.fromkeys(changes))
+        if not changes:
+            return
+        with self._lock:
+            callbacks = list(self._subscribers.items())
+        for key, callback in callbacks:
+            try:
+                callback(changes)
+            except Exception as e:
+                logging.error(f"Erro ao invalidar cache '{key}': {e}")
+
+    # --- Postgres: LISTEN/NOTIFY ---
+
+    def _send_ping(self):
+        """Emite um aviso de teste pelo engine do app (o mesmo caminho das escritas). Retorna o token."""
+        token = uuid.uuid4().hex
+        with self.engine.begin() as conn:
+            conn.execute(text("SELECT pg_notify(:channel, :payload)"),
+                         {"channel": CHANNEL, "payload": json.dumps({"entity": PING_ENTITY, "id": token})})
+        return token
+
+    def _listen_postgres(self):
+        raw = self.listen_engine.raw_connection()
+        try:
+            connection = raw.driver_connection
+            connection.autocommit = True
+            with connection.cursor() as cursor:
+                cursor.execute(f"LISTEN {CHANNEL}")
+            # Avisos perdidos enquanto estava desconectado: invalida tudo
+            self.dispatch([(None, None)])
+            self.connected.set()
+            ping_token, ping_deadline = self._send_ping(), time.monotonic() + self.CONFIRM_SECONDS
+            while not self._stop_event.is_set():
+                if ping_token and time.monotonic() > ping_deadline:
+                    logging.warning(
+                        "Aviso de teste não voltou pela conexão de escuta (pooler em Transaction Mode?). "
+                        "Os caches seguem com TTL curto."
+                    )
+                    ping_token = None
+                if select.select([connection], [], [], self.poll_seconds) == ([], [], []):
+                    continue
+                connection.poll()
+                changes = []
+                while connection.notifies:
+                    notify = connection.notifies.pop(0)
+                    try:
+                        payload = json.loads(notify.payload)
+                    except ValueError:
+                        changes.append((None, None))
+                        continue
+                    entity = payload.get("entity")
+                    if entity == PING_ENTITY:
+                        if payload.get("id") == ping_token:
+                            ping_token = None
+                            self.confirmed.set()
+                        continue
+                    changes.append((entity, _parse_id(entity, payload.get("id"))))
+                self.dispatch(changes)
+        finally:
+            self.connected.clear()
+            self.confirmed.clear()
+            raw.invalidate()
+
+    # --- SQLite: consulta periódica de app_changes ---
+
+    def poll_once(self):
+        """Lê os avisos novos de app_changes e chama os assinantes (usado pela thread e nos testes)."""
+        with self.engine.connect() as conn:
+            if self._last_change_id is None:
+                self._last_change_id = conn.execute(text("SELECT COALESCE(MAX(id), 0) FROM app_changes")).scalar()
+                return []
+            rows = conn.execute(text(
+                "SELECT id, entity, entity_id FROM app_changes WHERE id > :last ORDER BY id LIMIT 1000"
+            ), {"last": self._last_change_id}).fetchall()
+        if rows:
+            self._last_change_id = rows[-1].id
+        changes = [(row.entity, _parse_id(row.entity, row.entity_id)) for row in rows]
+        self.dispatch(changes)
+
+        if time.monotonic() - self._last_purge_at > 60:
+            self._last_purge_at = time.monotonic()
+            with self.engine.begin() as conn:
+                conn.execute(text(
+                    f"DELETE FROM app_changes WHERE created_at < datetime('now', '-{self.KEEP_SECONDS} seconds')"
+                ))
+        return changes
+
+    def _poll_sqlite(self):
+        try:
+            self.poll_once()
+            # O polling lê a própria tabela que os triggers gravam: funcionando a leitura, os avisos chegam
+            self.connected.set()
+            self.confirmed.set()
+            while not self._stop_event.wait(self.poll_seconds):
+                self.poll_once()
+        finally:
+            self.connected.clear()
+            self.confirmed.clear()
+
+    def run(self):
+        # Os triggers são instalados na inicialização dos models (ensure_change_triggers)
+        while not self._stop_event.is_set():
+            try:
+                if self.engine.dialect.name == "postgresql":
+                    self._listen_postgres()
+                else:
+                    self._poll_sqlite()
+            except Exception as e:
+                logging.warning(f"Escuta de mudanças interrompida, reconectando: {e}")
+            self._stop_event.wait(self.reconnect_seconds)
+
+    def stop(self, timeout=5):
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout)
+
+
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def get_change_listener(engine=None):
+    """ChangeListener do processo, iniciado na primeira chamada."""
+    global _listener
+    with _listener_lock:
+        if _listener is None or not _listener.is_alive():
+            _listener = ChangeListener(engine)
+            _listener.start()
+        return _listener
@@ -0,0 +1,176 @@
+import datetime
+import logging
+import threading
+
+from sqlalchemy import insert, select
+
+from services.bot_tables import chat_history
+
+
+class ChatHistoryWriter(threading.Thread):
+    """
+    Persistência write-behind da tabela chat_history.
+
+    As mensagens entram num buffer em memória e são gravadas em lote
+    (um INSERT multi-linha por flush) a cada `flush_interval_ms` ou quando o
+    buffer atinge `max_batch_rows`. Assim o envio da resposta não espera o banco.
+    """
+
+    # Limite de segurança: se o banco ficar fora do ar, não cresce indefinidamente
+    MAX_BUFFERED_ROWS = 5000
+
+    def __init__(self, engine=None, flush_interval_ms=500, max_batch_rows=50):
+        super().__init__(name="ChatHistoryWriter")
+        self.daemon = True
+        self._engine = engine
+        self.flush_interval = max(flush_interval_ms, 10) / 1000.0
+        self.max_batch_rows = max(int(max_batch_rows), 1)
+
+        self._lock = threading.Lock()        # protege _buffer/_inflight
+        self._flush_lock = threading.Lock()  # serializa flushes
+        self._buffer = []    # linhas aguardando flush
+        self._inflight = []  # linhas sendo gravadas no flush atual
+        self._wake = threading.Event()
+        self._stop_event = threading.Event()
+        self._closed = False
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            import database_config
+            self._engine = database_config.engine
+        return self._engine
+
+    # --- API usada pelo BotRunner ---
+
+    def enqueue(self, phone_number, role, content, external_id=None):
+        """
+        Agenda a gravação de uma mensagem. Retorna False se uma mensagem com o
+        mesmo external_id já estiver pendente (deduplicação no buffer).
+        """
+        row = {
+            "phone_number": phone_number,
+            "role": role,
+            "content": content,
+            "timestamp": datetime.datetime.now(),
+            "is_read": 0,
+            "external_id": external_id,
+        }
+        with self._lock:
+            if external_id and self._is_pending_locked(external_id):
+                return False
+            if not self._closed:
+                self._buffer.append(row)
+                if len(self._buffer) >= self.max_batch_rows:
+                    self._wake.set()
+                return True
+
+        # Writer já encerrado: grava de forma síncrona para não perder a mensagem
+        self._write_rows([row])
+        return True
+
+    def is_pending(self, external_id):
+        """True se a mensagem está no buffer ou sendo gravada (ainda não visível no banco)."""
+        if not external_id:
+            return False
+        with self._lock:
+            return self._is_pending_locked(external_id)
+
+    def _is_pending_locked(self, external_id):
+        return any(r["external_id"] == external_id for r in self._inflight) or \
+            any(r["external_id"] == external_id for r in self._buffer)
+
+    def with_pending(self, phone_number, history, limit=None):
+        """
+        Completa o histórico lido do banco com as mensagens ainda não gravadas
+        deste número, no mesmo formato de chat_store.get_chat_history.
+        """
+        with self._lock:
+            pending = [r for r in self._inflight + self._buffer if r["phone_number"] == phone_number]
+        merged = list(history) + [{"role": r["role"], "parts": [r["content"]]} for r in pending]
+        if limit:
+            merged = merged[-limit:]
+        return merged
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._buffer) + len(self._inflight)
+
+    # --- Flush ---
+
+    def flush(self):
+        """Grava todas as linhas pendentes. Em caso de erro, devolve-as ao buffer."""
+        with self._flush_lock:
+            with self._lock:
+                if not self._buffer:
+                    return 0
+                self._inflight = self._buffer
+                self._buffer = []
+            rows = self._inflight
+            try:
+                written = self._write_rows(rows, raise_errors=True)
+            except Exception as e:
+                logging.error(f"Erro ao gravar lote de {len(rows)} mensagem(ns) do chat: {e}")
+                with self._lock:
+                    self._buffer = rows + self._buffer
+                    self._inflight = []
+                    overflow = len(self._buffer) - self.MAX_BUFFERED_ROWS
+                    if overflow > 0:
+                        logging.error(f"Buffer do chat cheio. Descartando {overflow} mensagem(ns) mais antiga(s).")
+                        del self._buffer[:overflow]
+                return 0
+            with self._lock:
+                self._inflight = []
+            return written
+
+    def _write_rows(self, rows, raise_errors=False):
+        """INSERT multi-linha, ignorando external_ids que já estão no banco."""
+        try:
+            with self.engine.begin() as conn:
+                ids = {r["external_id"] for r in rows if r["external_id"]}
+                existing = set()
+                if ids:
+                    existing = set(conn.execute(
+                        select(chat_history.c.external_id).where(chat_history.c.external_id.in_(ids))
+                    ).scalars())
+
+                to_insert, seen = [], set()
+                for r in rows:
+                    eid = r["external_id"]
+                    if eid and (eid in existing or eid in seen):
+                        continue
+                    if eid:
+                        seen.add(eid)
+                    to_insert.append(r)
+
+                if to_insert:
+                    conn.execute(insert(chat_history).values(to_insert))
+                return len(to_insert)
+        except Exception as e:
+            if raise_errors:
+                raise
+            logging.error(f"Erro ao salvar mensagem de chat: {e}")
+            return 0
+
+    # --- Ciclo de vida ---
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+        self.flush()
+
+    def stop(self, timeout=10):
+        """Encerra o writer garantindo o flush final do buffer."""
+        with self._lock:
+            self._closed = True
+        self._stop_event.set()
+        self._wake.set()
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join(timeout=timeout)
+        # Cobre writer nunca iniciado ou join expirado
+        self.flush()
+        remaining = self.pending_count()
+        if remaining:
+            logging.error(f"⚠️ {remaining} mensagem(ns) do chat não puderam ser gravadas no encerramento.")
@@ -0,0 +1,73 @@
+"""
+Acesso ao chat_history só com SQLAlchemy Core.
+
+Usado pelo processo do bot no lugar de `database`, que importa Streamlit,
+pandas, backup_manager e models (que roda create_all no import). Aqui não
+há nenhum efeito colateral de import além do próprio SQLAlchemy.
+"""
+import datetime
+import logging
+
+from sqlalchemy import select, insert
+
+from services.bot_tables import chat_history
+
+
+def _engine(engine=None):
+    if engine is None:
+        import database_config
+        engine = database_config.engine
+    return engine
+
+
+def save_chat_message(phone_number, role, content, external_id=None, engine=None):
+    """Grava uma mensagem no histórico (síncrono; o bot usa o ChatHistoryWriter)."""
+    try:
+        with _engine(engine).begin() as conn:
+            conn.execute(insert(chat_history).values(
+                phone_number=phone_number, role=role, content=content,
+                timestamp=datetime.datetime.now(), is_read=0, external_id=external_id,
+            ))
+    except Exception as e:
+        logging.error(f"Erro ao salvar mensagem de chat: {e}")
+
+
+def check_message_exists(external_id, engine=None):
+    """Verifica se uma mensagem com este ID externo já foi processada."""
+    if not external_id:
+        return False
+    try:
+        with _engine(engine).connect() as conn:
+            return conn.execute(
+                select(chat_history.c.id).where(chat_history.c.external_id == external_id).limit(1)
+            ).first() is not None
+    except Exception as e:
+        logging.error(f"Erro ao verificar existência de mensagem: {e}")
+        return False
+
+
+def get_chat_history(phone_number, limit=20, engine=None):
+    """Últimas mensagens com o número, em ordem cronológica, no formato do contexto do Gemini."""
+    try:
+        with _engine(engine).connect() as conn:
+            rows = conn.execute(
+                select(chat_history.c.role, chat_history.c.content)
+                .where(chat_history.c.phone_number == phone_number)
+                .order_by(chat_history.c.timestamp.desc(), chat_history.c.id.desc())
+                .limit(limit)
+            ).all()
+    except Exception as e:
+        logging.error(f"Erro ao recuperar histórico de chat: {e}")
+        return []
+    return [{"role": r.role, "parts": [r.content]} for r in reversed(rows)]
+
+
+def get_recent_chats(limit=50, engine=None):
+    """Últimas mensagens trocadas (qualquer número), mais recentes primeiro."""
+    with _engine(engine).connect() as conn:
+        rows = conn.execute(
+            select(chat_history.c.phone_number, chat_history.c.role, chat_history.c.content, chat_history.c.timestamp)
+            .order_by(chat_history.c.timestamp.desc())
+            .limit(limit)
+        ).mappings().all()
+    return [dict(r) for r in rows]
@@ -0,0 +1,70 @@
+"""
+Flags de completude por cliente (`clientes.missing_email/phone/cep`).
+
+Os flags são mantidos pelo próprio app: qualquer INSERT/UPDATE/DELETE de um
+contato ou endereço recalcula os flags do cliente dono (eventos do ORM em
+models_src), e um índice parcial cobre só os clientes incompletos. Assim o
+relatório de incompletos não precisa refazer o LEFT JOIN triplo com CASE.
+"""
+import logging
+
+from sqlalchemy import inspect, text
+
+COMPLETENESS_FIELDS = ("email", "phone", "cep")
+INCOMPLETE_CONDITION = "(missing_email OR missing_phone OR missing_cep)"
+
+_REFRESH_SQL = """
+    UPDATE clientes SET
+        missing_email = NOT EXISTS (
+            SELECT 1 FROM contatos co
+            WHERE co.cliente_id = clientes.id AND co.tipo_contato = 'Principal'
+              AND co.email_contato IS NOT NULL AND co.email_contato != ''
+        ),
+        missing_phone = NOT EXISTS (
+            SELECT 1 FROM contatos co
+            WHERE co.cliente_id = clientes.id AND co.tipo_contato = 'Principal'
+              AND co.telefone IS NOT NULL AND co.telefone != ''
+        ),
+        missing_cep = NOT EXISTS (
+            SELECT 1 FROM enderecos en
+            WHERE en.cliente_id = clientes.id AND en.tipo_endereco = 'Principal'
+              AND en.cep IS NOT NULL AND en.cep != ''
+        )
+"""
+
+
+def missing_filter(missing=None):
+    """WHERE dos incompletos; `missing` restringe a quem falta algum dos campos escolhidos."""
+    fields = [field for field in (missing or ()) if field in COMPLETENESS_FIELDS]
+    if not fields:
+        return INCOMPLETE_CONDITION
+    # A condição completa continua presente para o planner usar o índice parcial
+    return f"{INCOMPLETE_CONDITION} AND ({' OR '.join(f'missing_{field}' for field in fields)})"
+
+
+def refresh_completeness(connection, cliente_id=None):
+    """Recalcula os flags de um cliente (ou de todos, sem `cliente_id`)."""
+    if cliente_id is None:
+        connection.execute(text(_REFRESH_SQL))
+    else:
+        connection.execute(text(_REFRESH_SQL + " WHERE id = :cliente_id"), {"cliente_id": cliente_id})
+
+
+def ensure_completeness_flags(engine):
+    """Cria as colunas e o índice parcial em bancos antigos e preenche os flags. Idempotente."""
+    try:
+        columns = {column["name"] for column in inspect(engine).get_columns("clientes")}
+    except Exception as e:
+        logging.warning(f"Não foi possível inspecionar a tabela clientes: {e}")
+        return
+
+    missing_columns = [f"missing_{field}" for field in COMPLETENESS_FIELDS if f"missing_{field}" not in columns]
+    with engine.begin() as conn:
+        for column in missing_columns:
+            conn.execute(text(f"ALTER TABLE clientes ADD COLUMN {column} BOOLEAN NOT NULL DEFAULT TRUE"))
+        if missing_columns:
+            refresh_completeness(conn)
+            logging.info("Flags de completude calculados para todos os clientes.")
+        conn.execute(text(
+            f"CREATE INDEX IF NOT EXISTS ix_clientes_incompletos ON clientes (id) WHERE {INCOMPLETE_CONDITION}"
+        ))
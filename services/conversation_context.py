@@ -0,0 +1,113 @@
+import datetime
+import logging
+
+from sqlalchemy import select, insert, update
+
+from services.bot_tables import chat_history, chat_summaries, ensure_tables
+
+
+def estimate_tokens(text):
+    """Estimativa barata de tokens (~4 caracteres por token em português)."""
+    return (len(text or "") + 3) // 4
+
+
+def message_tokens(message):
+    return estimate_tokens(" ".join(message.get("parts", []))) + 2  # + rótulo "Cliente:"/"Assistente:"
+
+
+def fit_to_budget(summary, history, token_budget):
+    """
+    Corta o contexto para caber em `token_budget`: descarta as mensagens mais
+    antigas primeiro (mantendo sempre a última) e, se ainda não couber, trunca o resumo.
+    """
+    history = list(history)
+    used = estimate_tokens(summary) + sum(message_tokens(m) for m in history)
+    while used > token_budget and len(history) > 1:
+        used -= message_tokens(history.pop(0))
+    if summary and used > token_budget:
+        room = max(token_budget - (used - estimate_tokens(summary)), 0)
+        summary = summary[-room * 4:] if room else ""
+    return summary, history
+
+
+class ConversationContext:
+    """
+    Contexto enviado ao Gemini: resumo acumulado da conversa + últimas mensagens.
+
+    O resumo fica em `chat_summaries`, ao lado do chat_history, e marca até
+    qual id já foi resumido. Só é recalculado (preguiçosamente, na hora de
+    responder) quando há `summarize_every` mensagens novas além das
+    `recent_messages` mais recentes, que sempre vão na íntegra.
+    """
+
+    def __init__(self, engine=None, recent_messages=8, summarize_every=10, token_budget=1500):
+        self._engine = engine
+        self.recent_messages = recent_messages
+        self.summarize_every = summarize_every
+        self.token_budget = token_budget
+        self._table_ready = False
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            import database_config
+            self._engine = database_config.engine
+        if not self._table_ready:
+            ensure_tables(self._engine, [chat_summaries])
+            self._table_ready = True
+        return self._engine
+
+    def _load(self, phone_number):
+        """(resumo, covered_until_id, covered_messages, mensagens não resumidas em ordem cronológica)."""
+        with self.engine.connect() as conn:
+            row = conn.execute(
+                select(chat_summaries.c.summary, chat_summaries.c.covered_until_id, chat_summaries.c.covered_messages)
+                .where(chat_summaries.c.phone_number == phone_number)
+            ).first()
+            summary, covered_id, covered_count = (row.summary, row.covered_until_id, row.covered_messages) if row else ("", 0, 0)
+            # Busca limitada: se o resumo ficar muito atrasado, o excedente mais antigo é ignorado
+            rows = conn.execute(
+                select(chat_history.c.id, chat_history.c.role, chat_history.c.content)
+                .where(chat_history.c.phone_number == phone_number, chat_history.c.id > covered_id)
+                .order_by(chat_history.c.id.desc())
+                .limit(self.recent_messages + 3 * self.summarize_every)
+            ).all()
+        return summary, covered_id, covered_count, list(reversed(rows))
+
+    def _save(self, phone_number, summary, covered_until_id, covered_messages):
+        values = {"summary": summary, "covered_until_id": covered_until_id,
+                  "covered_messages": covered_messages, "updated_at": datetime.datetime.now()}
+        with self.engine.begin() as conn:
+            result = conn.execute(
+                update(chat_summaries).where(chat_summaries.c.phone_number == phone_number).values(**values)
+            )
+            if result.rowcount == 0:
+                conn.execute(insert(chat_summaries).values(phone_number=phone_number, **values))
+
+    def build(self, phone_number, pending_messages=(), summarizer=None):
+        """
+        Retorna (resumo, histórico recente) já dentro do orçamento de tokens.
+
+        `pending_messages` são as mensagens ainda no buffer do ChatHistoryWriter;
+        `summarizer(resumo_anterior, mensagens) -> str | None` é chamado quando
+        há mensagens antigas suficientes para atualizar o resumo.
+        """
+        try:
+            summary, covered_id, covered_count, rows = self._load(phone_number)
+        except Exception as e:
+            logging.error(f"Erro ao carregar contexto da conversa {phone_number}: {e}")
+            return fit_to_budget("", list(pending_messages), self.token_budget)
+
+        older = rows[:-self.recent_messages] if len(rows) > self.recent_messages else []
+        if summarizer and len(older) >= self.summarize_every:
+            new_summary = summarizer(summary, [{"role": r.role, "parts": [r.content]} for r in older])
+            if new_summary:
+                try:
+                    self._save(phone_number, new_summary, older[-1].id, covered_count + len(older))
+                    summary, rows = new_summary, rows[len(older):]
+                    logging.info(f"📝 Resumo da conversa {phone_number} atualizado (+{len(older)} mensagens).")
+                except Exception as e:
+                    logging.error(f"Erro ao salvar resumo da conversa {phone_number}: {e}")
+
+        history = [{"role": r.role, "parts": [r.content]} for r in rows] + list(pending_messages)
+        return fit_to_budget(summary, history, self.token_budget)
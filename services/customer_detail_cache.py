@@ -0,0 +1,132 @@
+"""
+Cache de detalhes de clientes por sessão do Streamlit.
+
+A página do Banco de Dados guarda uma instância em `st.session_state` e, a
+cada página do grid exibida, pede o prefetch dos ids visíveis (e da próxima
+página) em segundo plano. Abrir um cliente vira leitura do dicionário; edições
+e exclusões invalidam a entrada correspondente — inclusive nas outras sessões,
+via `invalidate_all` chamado pelo aviso de mudanças (change_notifications).
+"""
+import logging
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Compartilhado entre as sessões: o trabalho é só I/O no banco
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="detail-prefetch")
+
+# Caches vivos do processo (somem junto com a sessão que os criou)
+_instances = weakref.WeakSet()
+_instances_lock = threading.Lock()
+
+
+def invalidate_all(customer_id=None):
+    """Invalida um cliente (ou tudo, sem id) no cache de todas as sessões do processo."""
+    with _instances_lock:
+        caches = list(_instances)
+    for cache in caches:
+        cache.invalidate(customer_id)
+
+
+class CustomerDetailCache:
+    """LRU de detalhes por id, preenchido em lote por `loader(ids) -> {id: detalhes}`."""
+
+    def __init__(self, loader, max_entries=500, ttl_seconds=300):
+        self.loader = loader
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # id -> (detalhes, carregado_em)
+        self._pending = {}  # id -> Future do prefetch que vai trazê-lo
+        # Invalidações durante uma leitura descartam o resultado dela
+        self._generation = 0
+        self._versions = {}
+        self._lock = threading.Lock()
+        with _instances_lock:
+            _instances.add(self)
+
+    def _fresh(self, customer_id):
+        entry = self._entries.get(customer_id)
+        if entry and time.monotonic() - entry[1] < self.ttl_seconds:
+            self._entries.move_to_end(customer_id)
+            return entry[0]
+        return None
+
+    def _load(self, ids):
+        with self._lock:
+            generation = self._generation
+            versions = {customer_id: self._versions.get(customer_id, 0) for customer_id in ids}
+        loaded_at = time.monotonic()
+        details_by_id = self.loader(ids)
+        with self._lock:
+            if generation == self._generation:
+                for customer_id, details in details_by_id.items():
+                    if self._versions.get(customer_id, 0) == versions.get(customer_id):
+                        self._entries[customer_id] = (details, loaded_at)
+                        self._entries.move_to_end(customer_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return details_by_id
+
+    def prefetch(self, ids):
+        """
+        Carrega em segundo plano os clientes que ainda não estão no cache.
+        `ids` pode ser uma função, chamada já na thread (ex.: ids da próxima página).
+        """
+        def job():
+            try:
+                wanted = ids() if callable(ids) else ids
+                with self._lock:
+                    missing = [customer_id for customer_id in wanted if self._fresh(customer_id) is None]
+                if missing:
+                    self._load(missing)
+            except Exception as e:
+                logging.warning(f"Falha no prefetch de detalhes de clientes: {e}")
+                raise
+
+        future = _executor.submit(job)
+        if not callable(ids):
+            # get() de um desses ids espera este lote em vez de ir ao banco de novo
+            with self._lock:
+                for customer_id in ids:
+                    self._pending.setdefault(customer_id, future)
+        future.add_done_callback(self._forget)
+        return future
+
+    def _forget(self, future):
+        with self._lock:
+            for customer_id in [i for i, pending in self._pending.items() if pending is future]:
+                del self._pending[customer_id]
+
+    def get(self, customer_id, timeout=10):
+        """Detalhes do cliente: do cache, do prefetch em andamento ou do banco."""
+        with self._lock:
+            details = self._fresh(customer_id)
+            future = self._pending.get(customer_id)
+        if details is not None:
+            return details
+        if future is not None:
+            try:
+                future.result(timeout=timeout)
+            except Exception:
+                pass
+            with self._lock:
+                details = self._fresh(customer_id)
+            if details is not None:
+                return details
+        return self._load([customer_id]).get(customer_id)
+
+    def invalidate(self, customer_id=None):
+        """Remove um cliente (ou todos, sem id) do cache."""
+        with self._lock:
+            if customer_id is None:
+                self._generation += 1
+                self._entries.clear()
+            else:
+                self._versions[customer_id] = self._versions.get(customer_id, 0) + 1
+                self._entries.pop(customer_id, None)
+
+    def __contains__(self, customer_id):
+        with self._lock:
+            return self._fresh(customer_id) is not None
@@ -3,6 +3,7 @@ from sqlmodel import Session, select
 from models import Cliente, Contato, Endereco
 from repositories.customer_repository import CustomerRepository
 from database_config import engine
+from services import geo_search
 import validators
 import integration_services as services
 import logging
@@ -174,8 +175,32 @@ class CustomerService:
                 raise validators.ValidationError("O campo 'CNPJ' é obrigatório.")
             validators.is_valid_cnpj(data['cnpj'])
 
-    def get_customer_grid_data(self, search_query: str = None, state_filter: str = None, page: int = 1, page_size: int = 10) -> List[dict]:
+    # Formatação aplicada só às colunas do grid que foram pedidas
+    GRID_FORMATTERS = {
+        "cpf": validators.format_cpf,
+        "cnpj": validators.format_cnpj,
+        "telefone1": validators.format_whatsapp,
+        "link_wpp_1": validators.get_whatsapp_url,
+    }
+
+    def get_customer_grid_data(self, search_query: str = None, state_filter: str = None, page: int = 1, page_size: int = 10,
+                               columns: Optional[List[str]] = None) -> List[dict]:
+        """
+        Linhas do grid. Com `columns`, o banco devolve só essas colunas (e o id),
+        fazendo apenas os JOINs necessários; sem elas, o registro completo
+        (usado pelo backup e pelos scripts).
+        """
         offset = (page - 1) * page_size
+        if columns is not None:
+            with self.get_session() as session:
+                rows = CustomerRepository(session).list_customer_rows(columns, search_query, state_filter, offset, page_size)
+            formatters = [(name, fmt) for name, fmt in self.GRID_FORMATTERS.items() if name in columns]
+            for row in rows:
+                for name, fmt in formatters:
+                    if row.get(name):
+                        row[name] = fmt(row[name])
+            return rows
+
         with self.get_session() as session:
             repo = CustomerRepository(session)
             customers = repo.list_customers(search_query, state_filter, offset, page_size)
@@ -251,39 +276,47 @@ class CustomerService:
             customer = repo.get(customer_id)
             if not customer:
                 return None
+            return self._customer_details(customer)
+
+    def get_customer_details_batch(self, customer_ids: List[int]) -> dict:
+        """Detalhes de vários clientes com as mesmas três consultas de um só ({id: detalhes})."""
+        with self.get_session() as session:
+            repo = CustomerRepository(session)
+            return {customer.id: self._customer_details(customer) for customer in repo.get_many(customer_ids)}
+
+    def _customer_details(self, customer: Cliente) -> dict:
+        # Flatten data for UI compatibility
+        data = customer.model_dump()
+        
+        # Formatação
+        if data.get('cpf'): data['cpf'] = validators.format_cpf(data['cpf'])
+        if data.get('cnpj'): data['cnpj'] = validators.format_cnpj(data['cnpj'])
+        
+        # Contatos
+        contato1 = next((c for c in customer.contatos if c.tipo_contato == 'Principal'), None)
+        if contato1:
+            data.update({
+                "contato1": contato1.nome_contato,
+                "telefone1": validators.format_whatsapp(contato1.telefone),
+                "email": contato1.email_contato,
+                "cargo": contato1.cargo_contato
+            })
+        
+        contato2 = next((c for c in customer.contatos if c.tipo_contato == 'Secundário'), None)
+        if contato2:
+            data.update({
+                "contato2": contato2.nome_contato,
+                "telefone2": validators.format_whatsapp(contato2.telefone)
+            })
+
+        # Endereço
+        endereco = next((e for e in customer.enderecos if e.tipo_endereco == 'Principal'), None)
+        if endereco:
+            data.update(endereco.model_dump(exclude={'id', 'cliente_id'}))
+            # Renomeia logradouro para endereco para compatibilidade
+            data['endereco'] = data.get('logradouro')
             
-            # Flatten data for UI compatibility
-            data = customer.model_dump()
-            
-            # Formatação
-            if data.get('cpf'): data['cpf'] = validators.format_cpf(data['cpf'])
-            if data.get('cnpj'): data['cnpj'] = validators.format_cnpj(data['cnpj'])
-            
-            # Contatos
-            contato1 = next((c for c in customer.contatos if c.tipo_contato == 'Principal'), None)
-            if contato1:
-                data.update({
-                    "contato1": contato1.nome_contato,
-                    "telefone1": validators.format_whatsapp(contato1.telefone),
-                    "email": contato1.email_contato,
-                    "cargo": contato1.cargo_contato
-                })
-            
-            contato2 = next((c for c in customer.contatos if c.tipo_contato == 'Secundário'), None)
-            if contato2:
-                data.update({
-                    "contato2": contato2.nome_contato,
-                    "telefone2": validators.format_whatsapp(contato2.telefone)
-                })
-
-            # Endereço
-            endereco = next((e for e in customer.enderecos if e.tipo_endereco == 'Principal'), None)
-            if endereco:
-                data.update(endereco.model_dump(exclude={'id', 'cliente_id'}))
-                # Renomeia logradouro para endereco para compatibilidade
-                data['endereco'] = data.get('logradouro')
-                
-            return data
+        return data
 
     # Analytical methods for Dashboard
     def get_new_customers_timeseries(self, start_date, end_date, period='M'):
@@ -292,19 +325,89 @@ class CustomerService:
             repo = CustomerRepository(session)
             return repo.get_new_customers_timeseries(start_date, end_date, period)
 
+    def get_dashboard_snapshot(self, start_date, end_date, granularity='M') -> dict:
+        """Total, novos no período, completude e série temporal em uma ida ao banco."""
+        with self.get_session() as session:
+            repo = CustomerRepository(session)
+            return repo.get_dashboard_snapshot(start_date, end_date, granularity)
+
     def get_customer_locations(self):
         import pandas as pd
         with self.get_session() as session:
             repo = CustomerRepository(session)
             return repo.get_customer_locations()
 
+    @staticmethod
+    def grid_size_for_zoom(zoom: float) -> float:
+        """Tamanho da célula (graus) para o zoom do mapa: ~1/8 de um tile, no máximo 5°."""
+        return min(360.0 / (2 ** zoom) / 8, 5.0)
+
+    def get_map_clusters(self, zoom: float = 4, start_date=None, end_date=None):
+        """Centróides com contagem por célula da grade, prontos para Heatmap/Scatterplot."""
+        with self.get_session() as session:
+            repo = CustomerRepository(session)
+            return repo.get_location_clusters(self.grid_size_for_zoom(zoom), start_date, end_date)
+
+    def get_customers_per_state(self, start_date=None, end_date=None):
+        with self.get_session() as session:
+            repo = CustomerRepository(session)
+            return repo.get_customers_per_state(start_date, end_date)
+
+    def find_customers_near(self, lat: float, lon: float, radius_km: Optional[float] = 20, limit: Optional[int] = 10):
+        """
+        Clientes a até `radius_km` do ponto, do mais próximo ao mais distante,
+        com a coluna `distancia_km`. Sem raio, busca os `limit` mais próximos
+        dobrando o raio a partir de 10 km até achá-los (ou cobrir o país).
+        """
+        if radius_km is not None:
+            return self._customers_within(lat, lon, radius_km, limit)
+
+        radius = 10.0
+        while True:
+            found = self._customers_within(lat, lon, radius, limit)
+            if (limit and len(found) >= limit) or radius >= 5000:
+                return found
+            radius *= 2
+
+    def _customers_within(self, lat, lon, radius_km, limit):
+        box = geo_search.bounding_box(lat, lon, radius_km)
+        with self.get_session() as session:
+            repo = CustomerRepository(session)
+            candidates = repo.get_customers_in_box(box, geo_search.cell_ranges(box))
+
+        # A caixa tem cantos fora do círculo: o haversine decide quem fica
+        candidates['distancia_km'] = geo_search.haversine_km(lat, lon, candidates['latitude'], candidates['longitude'])
+        result = candidates[candidates['distancia_km'] <= radius_km].sort_values('distancia_km', kind='stable')
+        if limit:
+            result = result.head(limit)
+        return result.reset_index(drop=True)
+
     def get_data_health_summary(self) -> dict:
         with self.get_session() as session:
             repo = CustomerRepository(session)
             return repo.get_data_health_summary()
 
-    def get_incomplete_customers(self):
-        import pandas as pd
+    def get_incomplete_customers(self, missing=None, after_id=None, limit=50):
         with self.get_session() as session:
             repo = CustomerRepository(session)
-            return repo.get_incomplete_customers()
+            return repo.get_incomplete_customers(missing, after_id, limit)
+
+    def count_incomplete_customers(self, missing=None) -> int:
+        with self.get_session() as session:
+            repo = CustomerRepository(session)
+            return repo.count_incomplete_customers(missing)
+
+    def iter_incomplete_customers_csv(self, missing=None, batch_size=1000):
+        """CSV dos clientes incompletos em pedaços, lendo um lote (keyset) por vez."""
+        after_id, header = None, True
+        while True:
+            page = self.get_incomplete_customers(missing, after_id, batch_size)
+            if page.empty:
+                if header:
+                    yield page.to_csv(index=False)
+                return
+            yield page.to_csv(index=False, header=header)
+            header = False
+            if len(page) < batch_size:
+                return
+            after_id = int(page['id'].iloc[-1])
@@ -15,6 +15,10 @@ class EvolutionService:
             "apikey": self.api_token,
             "Content-Type": "application/json"
         }
+        # Conexão HTTP reaproveitada entre polls (keep-alive)
+        self.session = requests.Session()
+        # True se o último get_recent_messages falhou (o runner usa para reconferir a conexão)
+        self.last_poll_failed = False
 
     def is_configured(self):
         """Checks if the service has necessary configuration."""
@@ -75,15 +79,18 @@ class EvolutionService:
         }
         try:
             # Evolution API often uses POST for findMessages to pass options
-            response = requests.post(url, json=payload, headers=self.headers, timeout=10)
+            response = self.session.post(url, json=payload, headers=self.headers, timeout=10)
             
             if response.status_code == 404:
                  # Instance might not exist or endpoint unavailable
                  logging.warning("Evolution API findMessages endpoint not found (404).")
+                 self.last_poll_failed = True
                  return []
             
             response.raise_for_status()
+            self.last_poll_failed = False
             return response.json() # Returns list of messages objects
         except Exception as e:
             logging.error(f"Error fetching messages: {e}")
+            self.last_poll_failed = True
             return []
@@ -0,0 +1,115 @@
+"""
+Busca de clientes por proximidade.
+
+Cada endereço geocodificado recebe uma célula inteira numa grade de
+GRID_CELL_DEGREES graus (coluna indexada `enderecos.geo_cell`). A célula é
+numerada linha a linha, então as células de uma faixa de latitude dentro da
+caixa de busca formam um intervalo contínuo: o pré-filtro vira alguns
+`BETWEEN` no índice, e só os candidatos da caixa passam pelo haversine exato.
+"""
+import logging
+import math
+
+import numpy as np
+from sqlalchemy import inspect, text
+
+GRID_CELL_DEGREES = 0.1  # ~11 km na latitude
+EARTH_RADIUS_KM = 6371.0088
+# Acima disso a lista de intervalos fica grande demais; usa só latitude/longitude
+MAX_CELL_ROWS = 60
+
+_GRID_COLUMNS = int(round(360 / GRID_CELL_DEGREES))
+
+
+def _grid_row(lat):
+    return int(math.floor((lat + 90) / GRID_CELL_DEGREES))
+
+
+def _grid_column(lon):
+    return min(int(math.floor((lon + 180) / GRID_CELL_DEGREES)), _GRID_COLUMNS - 1)
+
+
+def grid_cell(lat, lon):
+    """Célula da grade para uma coordenada, ou None se ela estiver incompleta/inválida."""
+    if lat is None or lon is None:
+        return None
+    try:
+        lat, lon = float(lat), float(lon)
+    except (TypeError, ValueError):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    return _grid_row(lat) * _GRID_COLUMNS + _grid_column(lon)
+
+
+def bounding_box(lat, lon, radius_km):
+    """(min_lat, max_lat, min_lon, max_lon) que contém o círculo de `radius_km`."""
+    delta_lat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    min_lat, max_lat = max(lat - delta_lat, -90.0), min(lat + delta_lat, 90.0)
+    cos_lat = math.cos(math.radians(max(abs(min_lat), abs(max_lat))))
+    if cos_lat < 1e-6 or radius_km >= math.pi * EARTH_RADIUS_KM / 2:
+        return min_lat, max_lat, -180.0, 180.0
+    delta_lon = math.degrees(radius_km / (EARTH_RADIUS_KM * cos_lat))
+    # Caixas que cruzam o antimeridiano viram a faixa inteira de longitude
+    if lon - delta_lon < -180 or lon + delta_lon > 180:
+        return min_lat, max_lat, -180.0, 180.0
+    return min_lat, max_lat, lon - delta_lon, lon + delta_lon
+
+
+def cell_ranges(box):
+    """Intervalos [início, fim] de geo_cell que cobrem a caixa, um por faixa de latitude."""
+    min_lat, max_lat, min_lon, max_lon = box
+    first_row, last_row = _grid_row(min_lat), _grid_row(max_lat)
+    if last_row - first_row + 1 > MAX_CELL_ROWS:
+        return None
+    first_col, last_col = _grid_column(min_lon), _grid_column(max_lon)
+    return [(row * _GRID_COLUMNS + first_col, row * _GRID_COLUMNS + last_col)
+            for row in range(first_row, last_row + 1)]
+
+
+def haversine_km(lat, lon, lats, lons):
+    """Distância (km) de um ponto até vários, vetorizada."""
+    lat1, lon1 = np.radians(lat), np.radians(lon)
+    lat2 = np.radians(np.asarray(lats, dtype=float))
+    lon2 = np.radians(np.asarray(lons, dtype=float))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def ensure_geo_cells(engine, batch_size=1000):
+    """
+    Cria a coluna/índice `geo_cell` em bancos antigos e preenche os endereços
+    geocodificados que ainda não têm célula. Idempotente.
+    """
+    try:
+        columns = {column["name"] for column in inspect(engine).get_columns("enderecos")}
+    except Exception as e:
+        logging.warning(f"Não foi possível inspecionar a tabela enderecos: {e}")
+        return 0
+
+    with engine.begin() as conn:
+        if "geo_cell" not in columns:
+            conn.execute(text("ALTER TABLE enderecos ADD COLUMN geo_cell INTEGER"))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_enderecos_geo_cell ON enderecos (geo_cell)"))
+
+    filled = 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(text("""
+                SELECT id, latitude, longitude FROM enderecos
+                WHERE geo_cell IS NULL AND latitude IS NOT NULL AND longitude IS NOT NULL
+                LIMIT :limit
+            """), {"limit": batch_size}).fetchall()
+            updates = [{"id": row.id, "cell": grid_cell(row.latitude, row.longitude)} for row in rows]
+            # Coordenadas inválidas ficam com -1 para não voltarem em todo lote
+            for update in updates:
+                if update["cell"] is None:
+                    update["cell"] = -1
+            if updates:
+                conn.execute(text("UPDATE enderecos SET geo_cell = :cell WHERE id = :id"), updates)
+        filled += len(updates)
+        if len(rows) < batch_size:
+            break
+    if filled:
+        logging.info(f"geo_cell preenchido para {filled} endereço(s).")
+    return filled
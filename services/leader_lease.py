@@ -0,0 +1,186 @@
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+
+from sqlalchemy import Float, select, insert, update, case
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+
+from services.bot_tables import bot_leases, ensure_tables
+
+
+class db_epoch(FunctionElement):
+    """Epoch (s) pelo relógio do banco: o mesmo para todas as réplicas, sem depender dos hosts."""
+    type = Float()
+    inherit_cache = True
+
+
+@compiles(db_epoch)
+def _db_epoch_default(element, compiler, **kw):
+    return "CAST(EXTRACT(EPOCH FROM CURRENT_TIMESTAMP) AS DOUBLE PRECISION)"
+
+
+@compiles(db_epoch, "sqlite")
+def _db_epoch_sqlite(element, compiler, **kw):
+    return "((julianday('now') - 2440587.5) * 86400.0)"
+
+
+def make_holder_id():
+    """Identificador único do candidato: host:pid:sufixo."""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+class LeaderLease:
+    """
+    Lease de liderança numa linha de `bot_leases`, renovado por heartbeat.
+
+    Adquirir e renovar são um único UPDATE condicional (holder = eu OU lease
+    expirado), então funciona atrás do pgbouncer em modo transação, onde
+    advisory locks de sessão não são confiáveis. Expiração e renovação usam o
+    relógio do banco, então a diferença de relógio entre réplicas não gera
+    dois líderes (nem nenhum). Localmente, o líder só se considera líder até
+    o prazo contado a partir de *antes* do UPDATE, para nunca agir depois
+    que outro candidato possa ter assumido.
+    """
+
+    def __init__(self, name="bot", holder_id=None, engine=None, ttl_seconds=30):
+        self._engine = engine
+        self.name = name
+        self.holder_id = holder_id or make_holder_id()
+        self.ttl_seconds = ttl_seconds
+        self._table_ready = False
+        self._row_ready = False
+        self._valid_until = 0.0
+        self.term = None
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            import database_config
+            self._engine = database_config.engine
+        if not self._table_ready:
+            ensure_tables(self._engine, [bot_leases])
+            self._table_ready = True
+        return self._engine
+
+    def _ensure_row(self):
+        if self._row_ready:
+            return
+        try:
+            with self.engine.begin() as conn:
+                exists = conn.execute(select(bot_leases.c.name).where(bot_leases.c.name == self.name)).first()
+                if exists is None:
+                    conn.execute(insert(bot_leases).values(name=self.name, holder=None, term=0,
+                                                           acquired_at=0, expires_at=0))
+        except IntegrityError:
+            pass  # outro candidato criou a linha ao mesmo tempo
+        self._row_ready = True
+
+    def try_acquire(self):
+        """Adquire ou renova o lease. Retorna True se este candidato é o líder."""
+        started_at = time.time()
+        now = db_epoch()
+        is_mine = bot_leases.c.holder == self.holder_id
+        try:
+            self._ensure_row()
+            with self.engine.begin() as conn:
+                row = conn.execute(
+                    update(bot_leases)
+                    .where(bot_leases.c.name == self.name, is_mine | (bot_leases.c.expires_at < now))
+                    .values(
+                        holder=self.holder_id,
+                        expires_at=now + self.ttl_seconds,
+                        term=case((is_mine, bot_leases.c.term), else_=bot_leases.c.term + 1),
+                        acquired_at=case((is_mine, bot_leases.c.acquired_at), else_=now),
+                    )
+                    .returning(bot_leases.c.term, bot_leases.c.expires_at, now.label("db_now"))
+                ).first()
+                if row is None:
+                    self._valid_until = 0.0
+                    return False
+        except Exception as e:
+            # Sem banco não há como provar a liderança: deixa de agir até renovar
+            logging.error(f"Erro ao renovar lease de liderança '{self.name}': {e}")
+            self._valid_until = 0.0
+            return False
+        self.term = row.term
+        # Duração gravada pelo banco, contada no relógio local a partir de antes do UPDATE
+        self._valid_until = started_at + min(self.ttl_seconds, row.expires_at - row.db_now)
+        return True
+
+    def is_leader(self):
+        return time.time() < self._valid_until
+
+    def release(self):
+        """Libera o lease (só se ainda for nosso) para um standby assumir na hora."""
+        self._valid_until = 0.0
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(
+                    update(bot_leases)
+                    .where(bot_leases.c.name == self.name, bot_leases.c.holder == self.holder_id)
+                    .values(expires_at=0)
+                )
+        except Exception as e:
+            logging.error(f"Erro ao liberar lease de liderança '{self.name}': {e}")
+
+
+def current_leader(name="bot", engine=None):
+    """Líder atual (holder, term, acquired_at, expires_at) ou None se o lease está livre."""
+    if engine is None:
+        import database_config
+        engine = database_config.engine
+    try:
+        with engine.connect() as conn:
+            row = conn.execute(
+                select(bot_leases, db_epoch().label("db_now")).where(bot_leases.c.name == name)
+            ).mappings().first()
+    except Exception as e:
+        logging.debug(f"Lease de liderança indisponível: {e}")
+        return None
+    if row is None or not row["holder"] or row["expires_at"] < row["db_now"]:
+        return None
+    lease = dict(row)
+    del lease["db_now"]
+    return lease
+
+
+class LeaderElector(threading.Thread):
+    """Renova o lease a cada `ttl/3` segundos em segundo plano e loga as trocas de papel."""
+
+    def __init__(self, lease):
+        super().__init__(name="LeaderElector")
+        self.daemon = True
+        self.lease = lease
+        self.renew_interval = max(lease.ttl_seconds / 3.0, 0.05)
+        self._stop_event = threading.Event()
+        self._was_leader = False
+
+    def is_leader(self):
+        return self.lease.is_leader()
+
+    def step(self):
+        leader = self.lease.try_acquire()
+        if leader and not self._was_leader:
+            logging.info(f"👑 Liderança '{self.lease.name}' assumida por {self.lease.holder_id} (term {self.lease.term}).")
+        elif not leader and self._was_leader:
+            logging.warning(f"Liderança '{self.lease.name}' perdida. Entrando em standby.")
+        self._was_leader = leader
+        return leader
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self.step()
+            self._stop_event.wait(self.renew_interval)
+        if self._was_leader:
+            self.lease.release()
+            logging.info(f"Liderança '{self.lease.name}' liberada.")
+
+    def stop(self, timeout=5):
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout)
@@ -0,0 +1,65 @@
+import threading
+import time
+
+
+class MessageCoalescer:
+    """
+    Janela de debounce por conversa: junta mensagens seguidas do mesmo número
+    num único turno, para gerar UMA resposta do Gemini em vez de uma por mensagem.
+
+    Um turno fica pronto quando o cliente para de digitar por `quiet_seconds`
+    ou quando a primeira mensagem já espera há `max_wait_seconds`.
+    """
+
+    def __init__(self, quiet_seconds=6, max_wait_seconds=20):
+        self.quiet_seconds = max(quiet_seconds, 0)
+        self.max_wait_seconds = max(max_wait_seconds, self.quiet_seconds)
+        self._lock = threading.Lock()
+        self._turns = {}  # {phone: turno}
+
+    def add(self, phone_number, remote_jid, message_id, text, timestamp=None):
+        """Adiciona uma mensagem ao turno em aberto do número (ou abre um novo)."""
+        ts = timestamp or time.time()
+        with self._lock:
+            turn = self._turns.get(phone_number)
+            if turn is None:
+                turn = {
+                    "phone_number": phone_number,
+                    "remote_jid": remote_jid,
+                    "message_ids": [],
+                    "texts": [],
+                    "first_ts": ts,
+                    "last_ts": ts,
+                }
+                self._turns[phone_number] = turn
+            turn["message_ids"].append(message_id)
+            turn["texts"].append(text)
+            turn["first_ts"] = min(turn["first_ts"], ts)
+            turn["last_ts"] = max(turn["last_ts"], ts)
+
+    def _ready_at(self, turn):
+        return min(turn["last_ts"] + self.quiet_seconds, turn["first_ts"] + self.max_wait_seconds)
+
+    def pop_ready(self, now=None):
+        """Remove e retorna os turnos prontos, mais antigos primeiro, com o texto combinado."""
+        now = now or time.time()
+        with self._lock:
+            ready = [t for t in self._turns.values() if self._ready_at(t) <= now]
+            for turn in ready:
+                del self._turns[turn["phone_number"]]
+        ready.sort(key=lambda t: t["first_ts"])
+        for turn in ready:
+            turn["text"] = "\n".join(turn["texts"])
+        return ready
+
+    def seconds_until_next_ready(self, now=None):
+        """Segundos até o próximo turno ficar pronto (None se não há turnos abertos)."""
+        now = now or time.time()
+        with self._lock:
+            if not self._turns:
+                return None
+            return max(0.0, min(self._ready_at(t) for t in self._turns.values()) - now)
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._turns)
@@ -0,0 +1,219 @@
+import datetime
+import logging
+import threading
+import time
+
+from sqlalchemy import select, insert, update, delete, func
+
+from services.bot_metrics import BotMetrics
+from services.bot_tables import outbound_messages, ensure_tables, instance_clause
+
+
+class OutboundQueue(threading.Thread):
+    """
+    Fila persistente de respostas a enviar pelo WhatsApp.
+
+    O BotRunner só enfileira (uma linha em `outbound_messages`) e segue
+    processando; esta thread envia em ordem, com intervalo mínimo entre envios,
+    e reagenda falhas com backoff exponencial até `max_attempts`. A ordem vale
+    por telefone: só a mensagem mais antiga de cada conversa é candidata, então
+    enquanto ela está em backoff as seguintes esperam. Mensagens não enviadas
+    sobrevivem a reinícios e são retomadas na próxima execução, salvo as mais
+    velhas que `max_age_seconds`, que expiram (resposta fora de hora, ex.: após
+    uma queda longa, confunde mais do que ajuda).
+
+    Com várias instâncias da Evolution API há uma fila por número (`instance`),
+    cada uma com seu ritmo, sobre a mesma tabela.
+    """
+
+    # Mensagens finalizadas (sent/failed) são apagadas após este prazo
+    KEEP_FINISHED_DAYS = 7
+
+    def __init__(self, engine=None, sender=None, min_interval_seconds=1.0, max_attempts=5,
+                 base_backoff_seconds=2.0, max_backoff_seconds=300.0, batch_size=20,
+                 max_age_seconds=900, metrics=None, on_sent=None, can_send=None, instance=None, include_unassigned=False):
+        super().__init__(name=f"OutboundQueue-{instance}" if instance else "OutboundQueue")
+        self.daemon = True
+        self._engine = engine
+        self._table_ready = False
+        self.sender = sender  # sender(remote_jid, text) -> resposta | None
+        self.min_interval_seconds = min_interval_seconds
+        self.max_attempts = max_attempts
+        self.base_backoff_seconds = base_backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.batch_size = batch_size
+        self.max_age_seconds = max_age_seconds
+        self.metrics = metrics or BotMetrics()
+        self.on_sent = on_sent      # on_sent(row) após entrega (ex.: gravar no chat_history)
+        self.can_send = can_send    # can_send() -> bool (ex.: só o líder envia)
+        self.instance = instance
+        self._scope = instance_clause(outbound_messages.c.instance, instance, include_unassigned)
+        self._last_send_at = 0.0
+        self._wake = threading.Event()
+        self._stop_event = threading.Event()
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            import database_config
+            self._engine = database_config.engine
+        if not self._table_ready:
+            ensure_tables(self._engine, [outbound_messages])
+            self._table_ready = True
+        return self._engine
+
+    # --- API usada pelo BotRunner ---
+
+    def enqueue(self, phone_number, remote_jid, text):
+        """Agenda o envio e retorna o id da mensagem na fila."""
+        with self.engine.begin() as conn:
+            result = conn.execute(insert(outbound_messages).values(
+                phone_number=phone_number, remote_jid=remote_jid, text=text, status="queued",
+                attempts=0, next_attempt_at=0, created_at=datetime.datetime.now(), instance=self.instance,
+            ))
+        self._wake.set()
+        return result.inserted_primary_key[0]
+
+    def counts(self):
+        """Mensagens por status (queued, sent, failed, expired) para o Dashboard."""
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                select(outbound_messages.c.status, func.count()).where(self._scope).group_by(outbound_messages.c.status)
+            ).all()
+        counts = {"queued": 0, "sent": 0, "failed": 0, "expired": 0}
+        counts.update({status: count for status, count in rows})
+        return counts
+
+    # --- Envio ---
+
+    def _heads(self):
+        """Mensagem mais antiga ainda na fila de cada telefone (só ela pode ser enviada)."""
+        return (
+            select(func.min(outbound_messages.c.id))
+            .where(outbound_messages.c.status == "queued", self._scope)
+            .group_by(outbound_messages.c.phone_number)
+        )
+
+    def _due(self, now):
+        with self.engine.connect() as conn:
+            return conn.execute(
+                select(outbound_messages)
+                .where(outbound_messages.c.id.in_(self._heads()), outbound_messages.c.next_attempt_at <= now)
+                .order_by(outbound_messages.c.id)
+                .limit(self.batch_size)
+            ).mappings().all()
+
+    def expire_old(self):
+        """Marca como expiradas as mensagens na fila há mais de max_age_seconds."""
+        cutoff = datetime.datetime.now() - datetime.timedelta(seconds=self.max_age_seconds)
+        with self.engine.begin() as conn:
+            result = conn.execute(
+                update(outbound_messages)
+                .where(outbound_messages.c.status == "queued", outbound_messages.c.created_at < cutoff, self._scope)
+                .values(status="expired")
+            )
+        if result.rowcount:
+            logging.warning(f"⌛ {result.rowcount} resposta(s) expiraram na fila sem serem enviadas.")
+            self.metrics.inc("replies_expired", result.rowcount)
+        return result.rowcount
+
+    def _update(self, message_id, **values):
+        with self.engine.begin() as conn:
+            conn.execute(update(outbound_messages).where(outbound_messages.c.id == message_id).values(**values))
+
+    def _pace(self):
+        """Respeita o intervalo mínimo entre envios. Retorna False se a fila foi parada."""
+        wait = self._last_send_at + self.min_interval_seconds - time.time()
+        if wait > 0 and self._stop_event.wait(wait):
+            return False
+        return True
+
+    def _send_one(self, row):
+        self.metrics.inc("send_attempts")
+        try:
+            with self.metrics.timer("send_latency_seconds"):
+                result = self.sender(row["remote_jid"], row["text"])
+        except Exception as e:
+            result, error = None, str(e)
+        else:
+            error = None if result else "envio recusado ou sem resposta da Evolution API"
+        self._last_send_at = time.time()
+        attempts = row["attempts"] + 1
+
+        if result:
+            now = datetime.datetime.now()
+            self._update(row["id"], status="sent", attempts=attempts, sent_at=now, last_error=None)
+            self.metrics.inc("replies_sent")
+            self.metrics.observe("delivery_latency_seconds", (now - row["created_at"]).total_seconds())
+            if self.on_sent:
+                self.on_sent(row)
+            return True
+
+        self.metrics.inc("send_errors")
+        if attempts >= self.max_attempts:
+            logging.error(f"❌ Desistindo de enviar para {row['phone_number']} após {attempts} tentativas: {error}")
+            self._update(row["id"], status="failed", attempts=attempts, last_error=error)
+        else:
+            delay = min(self.base_backoff_seconds * 2 ** (attempts - 1), self.max_backoff_seconds)
+            logging.warning(f"Falha ao enviar para {row['phone_number']} (tentativa {attempts}). Nova tentativa em {delay:.0f}s.")
+            self._update(row["id"], attempts=attempts, last_error=error, next_attempt_at=time.time() + delay)
+        return False
+
+    def _ready(self):
+        return self.sender is not None and (self.can_send is None or self.can_send())
+
+    def process_once(self):
+        """Envia as mensagens vencidas (em ordem por telefone). Retorna quantas foram entregues."""
+        if not self._ready():
+            return 0
+        self.expire_old()
+        sent = 0
+        while True:
+            # Cada rodada envia no máximo uma mensagem por telefone; a seguinte vira cabeça na próxima
+            delivered = 0
+            for row in self._due(time.time()):
+                if self._stop_event.is_set() or not self._ready() or not self._pace():
+                    return sent + delivered
+                delivered += self._send_one(row)
+            sent += delivered
+            if not delivered:
+                return sent
+
+    def _seconds_until_next_due(self):
+        with self.engine.connect() as conn:
+            next_at = conn.execute(
+                select(func.min(outbound_messages.c.next_attempt_at)).where(outbound_messages.c.id.in_(self._heads()))
+            ).scalar()
+        return None if next_at is None else max(next_at - time.time(), 0)
+
+    def purge_finished(self):
+        cutoff = datetime.datetime.now() - datetime.timedelta(days=self.KEEP_FINISHED_DAYS)
+        with self.engine.begin() as conn:
+            conn.execute(delete(outbound_messages).where(
+                outbound_messages.c.status != "queued", outbound_messages.c.created_at < cutoff
+            ))
+
+    def run(self):
+        try:
+            self.purge_finished()
+        except Exception as e:
+            logging.error(f"Erro ao limpar fila de envio: {e}")
+        while not self._stop_event.is_set():
+            wait = 5.0
+            try:
+                if self._ready():
+                    self.process_once()
+                    next_due = self._seconds_until_next_due()
+                    if next_due is not None:
+                        wait = min(max(next_due, 0.2), wait)
+            except Exception as e:
+                logging.error(f"Erro na fila de envio: {e}")
+            self._wake.wait(wait)
+            self._wake.clear()
+
+    def stop(self, timeout=10):
+        """Para a thread; mensagens não enviadas ficam na tabela para a próxima execução."""
+        self._stop_event.set()
+        self._wake.set()
+        if self.is_alive():
+            self.join(timeout)
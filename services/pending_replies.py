@@ -0,0 +1,132 @@
+import datetime
+import logging
+
+from sqlalchemy import select, update, insert, delete, func
+
+from services.bot_tables import pending_replies, ensure_tables, instance_clause
+
+
+class PendingReplyQueue:
+    """
+    Fila persistente de turnos que não puderam ser respondidos por falta de
+    cota do Gemini (limite local ou 429 da API).
+
+    Cada conversa tem no máximo um turno pendente: mensagens novas do mesmo
+    número são anexadas a ele. Os turnos são retomados do mais antigo para o
+    mais novo quando a cota libera, e expiram após `max_age_seconds`. Com
+    `instance`, a fila só enxerga os turnos daquele número da Evolution API.
+    """
+
+    # Turnos finalizados (done/expired/failed) são apagados após este prazo
+    KEEP_FINISHED_DAYS = 7
+
+    def __init__(self, engine=None, max_age_seconds=3600, instance=None, include_unassigned=False):
+        self._engine = engine
+        self.max_age_seconds = max_age_seconds
+        self.instance = instance
+        self._scope = instance_clause(pending_replies.c.instance, instance, include_unassigned)
+        self._table_ready = False
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            import database_config
+            self._engine = database_config.engine
+        if not self._table_ready:
+            ensure_tables(self._engine, [pending_replies])
+            self._table_ready = True
+        return self._engine
+
+    def enqueue(self, phone_number, remote_jid, text, message_ids=None):
+        """Adia um turno. Se já há um pendente para o número, junta o texto a ele."""
+        now = datetime.datetime.now()
+        ids = ",".join(i for i in (message_ids or []) if i)
+        with self.engine.begin() as conn:
+            existing = conn.execute(
+                select(pending_replies.c.id, pending_replies.c.text, pending_replies.c.message_ids)
+                .where(pending_replies.c.phone_number == phone_number, pending_replies.c.status == "pending", self._scope)
+            ).first()
+            if existing:
+                conn.execute(
+                    update(pending_replies).where(pending_replies.c.id == existing.id).values(
+                        text=f"{existing.text}\n{text}",
+                        message_ids=",".join(filter(None, [existing.message_ids, ids])),
+                        updated_at=now,
+                    )
+                )
+                return existing.id
+            result = conn.execute(insert(pending_replies).values(
+                phone_number=phone_number, remote_jid=remote_jid, text=text, message_ids=ids,
+                status="pending", attempts=0, created_at=now, updated_at=now, instance=self.instance,
+            ))
+            return result.inserted_primary_key[0]
+
+    def has_pending(self, phone_number):
+        with self.engine.connect() as conn:
+            return conn.execute(
+                select(pending_replies.c.id)
+                .where(pending_replies.c.phone_number == phone_number, pending_replies.c.status == "pending", self._scope)
+                .limit(1)
+            ).first() is not None
+
+    def expire_old(self):
+        """Marca como expirados os turnos mais velhos que max_age_seconds."""
+        cutoff = datetime.datetime.now() - datetime.timedelta(seconds=self.max_age_seconds)
+        with self.engine.begin() as conn:
+            result = conn.execute(
+                update(pending_replies)
+                .where(pending_replies.c.status == "pending", pending_replies.c.created_at < cutoff)
+                .values(status="expired", updated_at=datetime.datetime.now())
+            )
+            conn.execute(
+                delete(pending_replies).where(
+                    pending_replies.c.status != "pending",
+                    pending_replies.c.updated_at < datetime.datetime.now() - datetime.timedelta(days=self.KEEP_FINISHED_DAYS),
+                )
+            )
+        if result.rowcount:
+            logging.warning(f"⌛ {result.rowcount} resposta(s) adiada(s) expiraram sem envio.")
+        return result.rowcount
+
+    def next_batch(self, limit=5):
+        """Turnos pendentes mais antigos primeiro (um por conversa, pela própria fila)."""
+        self.expire_old()
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                select(pending_replies)
+                .where(pending_replies.c.status == "pending", self._scope)
+                .order_by(pending_replies.c.created_at, pending_replies.c.id)
+                .limit(limit)
+            ).mappings().all()
+        return [dict(r) for r in rows]
+
+    def _set_status(self, reply_id, status, count_attempt=False):
+        values = {"status": status, "updated_at": datetime.datetime.now()}
+        if count_attempt:
+            values["attempts"] = pending_replies.c.attempts + 1
+        with self.engine.begin() as conn:
+            conn.execute(update(pending_replies).where(pending_replies.c.id == reply_id).values(**values))
+
+    def mark_done(self, reply_id):
+        self._set_status(reply_id, "done", count_attempt=True)
+
+    def mark_failed(self, reply_id):
+        self._set_status(reply_id, "failed", count_attempt=True)
+
+    def mark_retry(self, reply_id):
+        """Continua pendente (cota acabou de novo), contando a tentativa."""
+        self._set_status(reply_id, "pending", count_attempt=True)
+
+    def counts(self):
+        """Contadores por status para o Dashboard, incluindo a idade do mais antigo pendente."""
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                select(pending_replies.c.status, func.count(), func.min(pending_replies.c.created_at))
+                .group_by(pending_replies.c.status)
+            ).all()
+        counts = {"pending": 0, "done": 0, "expired": 0, "failed": 0, "oldest_pending_seconds": 0}
+        for status, count, oldest in rows:
+            counts[status] = count
+            if status == "pending" and oldest:
+                counts["oldest_pending_seconds"] = (datetime.datetime.now() - oldest).total_seconds()
+        return counts
@@ -0,0 +1,56 @@
+import time
+
+
+class AdaptivePollScheduler:
+    """
+    Intervalo de polling adaptativo do BotRunner.
+
+    Enquanto há conversa ativa (atividade nos últimos `active_window_seconds`)
+    o intervalo fica em `min_interval`; depois disso dobra a cada poll vazio
+    até `max_interval`. Qualquer mensagem nova volta ao intervalo mínimo.
+    """
+
+    def __init__(self, min_interval=1.5, max_interval=30, active_window_seconds=120, backoff_factor=2.0):
+        self.min_interval = min_interval
+        self.max_interval = max(max_interval, min_interval)
+        self.active_window_seconds = active_window_seconds
+        self.backoff_factor = backoff_factor
+        self.interval = min_interval
+        self._last_activity = None
+
+    def record_activity(self, now=None):
+        self._last_activity = time.time() if now is None else now
+        self.interval = self.min_interval
+
+    def is_active(self, now=None):
+        now = time.time() if now is None else now
+        return self._last_activity is not None and now - self._last_activity < self.active_window_seconds
+
+    def next_interval(self, had_activity=False, now=None):
+        """Intervalo até o próximo poll, dado se este poll trouxe atividade."""
+        now = time.time() if now is None else now
+        if had_activity:
+            self.record_activity(now)
+        elif self.is_active(now):
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * self.backoff_factor, self.max_interval)
+        return self.interval
+
+
+class ConnectionCheckSchedule:
+    """Decide quando conferir o estado da instância: após falhas ou a cada `every_seconds`."""
+
+    def __init__(self, every_seconds=300):
+        self.every_seconds = every_seconds
+        self._next_check = 0.0
+
+    def due(self, now=None):
+        return (time.time() if now is None else now) >= self._next_check
+
+    def mark_ok(self, now=None):
+        self._next_check = (time.time() if now is None else now) + self.every_seconds
+
+    def mark_failed(self):
+        """Força nova verificação no próximo ciclo."""
+        self._next_check = 0.0
@@ -0,0 +1,203 @@
+import datetime
+import hashlib
+import logging
+import math
+import threading
+import time
+
+from sqlalchemy import select, insert, update
+from sqlalchemy.exc import IntegrityError
+
+from services.bot_tables import rate_limits, ensure_tables
+
+# Cota do Gemini usada pelo bot (um pouco abaixo do plano gratuito) e exibida no Dashboard
+GEMINI_MAX_CALLS_PER_MINUTE = 13   # limite real: 15/min
+GEMINI_MAX_CALLS_PER_DAY = 1400    # limite real: 1.500/dia
+
+
+def gemini_bucket(api_key):
+    """Nome do bucket de cota para uma chave do Gemini (a cota é por chave/projeto)."""
+    digest = hashlib.sha1((api_key or "").encode("utf-8")).hexdigest()[:10]
+    return f"gemini:{digest}"
+
+
+class SharedRateLimiter:
+    """
+    Limitador de chamadas compartilhado via banco: token bucket por minuto +
+    contador diário + cooldown após 429, numa linha de `bot_rate_limits`.
+
+    Todos os runners e processos que usam o mesmo bucket disputam a mesma
+    linha com controle otimista (coluna `version`), então o limite vale
+    globalmente e sobrevive a reinícios. Se o banco falhar, cai para um
+    estado em memória (mesmas regras) até o banco voltar.
+    """
+
+    MAX_CAS_RETRIES = 5
+
+    def __init__(self, engine=None, bucket="gemini", per_minute=13, per_day=1400):
+        self._engine = engine
+        self.bucket = bucket
+        self.per_minute = per_minute
+        self.per_day = per_day
+        self._table_ready = False
+        self._row_ready = False
+        self._local_lock = threading.Lock()
+        self._local_state = None  # fallback em memória
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            import database_config
+            self._engine = database_config.engine
+        if not self._table_ready:
+            ensure_tables(self._engine, [rate_limits])
+            self._table_ready = True
+        return self._engine
+
+    # --- Regras (funções puras sobre o estado) ---
+
+    def _initial_state(self, now):
+        return {
+            "tokens": float(self.per_minute),
+            "refilled_at": now,
+            "day": datetime.date.today().isoformat(),
+            "day_count": 0,
+            "cooldown_until": 0.0,
+            "version": 0,
+        }
+
+    def _refill(self, state, now):
+        """Reabastece tokens pelo tempo decorrido e zera o contador na virada do dia."""
+        state = dict(state)
+        elapsed = max(0.0, now - state["refilled_at"])
+        state["tokens"] = min(float(self.per_minute), state["tokens"] + elapsed * self.per_minute / 60.0)
+        state["refilled_at"] = now
+        today = datetime.date.today().isoformat()
+        if state["day"] != today:
+            state["day"] = today
+            state["day_count"] = 0
+        return state
+
+    def _evaluate(self, state, now):
+        """(pode_chamar, motivo) para um estado já reabastecido."""
+        wait = state["cooldown_until"] - now
+        if wait > 0:
+            return False, f"cooldown ativo por mais {wait:.0f}s"
+        if state["day_count"] >= self.per_day:
+            return False, f"limite diário atingido ({state['day_count']}/{self.per_day} chamadas)"
+        if state["tokens"] < 1:
+            wait = (1 - state["tokens"]) * 60.0 / self.per_minute
+            return False, f"limite por minuto atingido ({self.per_minute}/min), aguardar {wait:.0f}s"
+        return True, "ok"
+
+    # --- Persistência ---
+
+    def _ensure_row(self):
+        """Cria a linha do bucket na primeira utilização."""
+        if self._row_ready:
+            return
+        try:
+            with self.engine.begin() as conn:
+                exists = conn.execute(
+                    select(rate_limits.c.bucket).where(rate_limits.c.bucket == self.bucket)
+                ).first()
+                if exists is None:
+                    conn.execute(insert(rate_limits).values(bucket=self.bucket, **self._initial_state(time.time())))
+        except IntegrityError:
+            pass  # outro processo criou a linha ao mesmo tempo
+        self._row_ready = True
+
+    def _mutate(self, fn, on_conflict=None):
+        """
+        Aplica `fn(estado_reabastecido, now) -> (novo_estado | None, resultado)` com
+        compare-and-swap na versão. `None` como novo estado significa "não gravar".
+        """
+        try:
+            self._ensure_row()
+            for _ in range(self.MAX_CAS_RETRIES):
+                now = time.time()
+                with self.engine.begin() as conn:
+                    current = dict(conn.execute(
+                        select(rate_limits).where(rate_limits.c.bucket == self.bucket)
+                    ).mappings().one())
+                    new_state, result = fn(self._refill(current, now), now)
+                    if new_state is None:
+                        return result
+                    values = {k: new_state[k] for k in ("tokens", "refilled_at", "day", "day_count", "cooldown_until")}
+                    updated = conn.execute(
+                        update(rate_limits)
+                        .where(rate_limits.c.bucket == self.bucket, rate_limits.c.version == current["version"])
+                        .values(version=current["version"] + 1, **values)
+                    )
+                    if updated.rowcount == 1:
+                        return result
+            return on_conflict
+        except Exception as e:
+            logging.error(f"Limitador compartilhado indisponível, usando contagem local: {e}")
+            with self._local_lock:
+                now = time.time()
+                if self._local_state is None:
+                    self._local_state = self._initial_state(now)
+                refilled = self._refill(self._local_state, now)
+                new_state, result = fn(refilled, now)
+                self._local_state = new_state or refilled
+                return result
+
+    # --- API pública ---
+
+    def try_acquire(self):
+        """Consome uma chamada se houver cota. Retorna (ok, motivo)."""
+        def acquire(state, now):
+            ok, reason = self._evaluate(state, now)
+            if not ok:
+                return None, (False, reason)
+            state["tokens"] -= 1
+            state["day_count"] += 1
+            return state, (True, "ok")
+        return self._mutate(acquire, on_conflict=(False, "limitador ocupado, tente novamente"))
+
+    def check(self):
+        """Como try_acquire, mas sem consumir. Retorna (ok, motivo)."""
+        return self._mutate(lambda state, now: (None, self._evaluate(state, now)))
+
+    def set_cooldown(self, until):
+        """Bloqueia todas as chamadas (de todos os processos) até o epoch `until`."""
+        def cooldown(state, now):
+            state["cooldown_until"] = max(state["cooldown_until"], until)
+            return state, None
+        self._mutate(cooldown)
+
+    def _snapshot(self, state, now):
+        return {
+            "available_now": int(math.floor(state["tokens"])),
+            "max_per_minute": self.per_minute,
+            "calls_today": state["day_count"],
+            "remaining_today": max(0, self.per_day - state["day_count"]),
+            "max_per_day": self.per_day,
+            "cooldown_remaining": max(0.0, state["cooldown_until"] - now),
+        }
+
+    def remaining(self):
+        """Orçamento exato restante neste instante."""
+        return self._mutate(lambda state, now: (None, self._snapshot(state, now)))
+
+    def peek(self):
+        """
+        Como remaining(), mas só leitura (para o Dashboard): não cria tabela nem
+        linha e não cai para o estado em memória. None se o bucket ainda não
+        existe ou o banco não respondeu.
+        """
+        engine = self._engine
+        if engine is None:
+            import database_config
+            engine = database_config.engine
+        try:
+            with engine.connect() as conn:
+                row = conn.execute(select(rate_limits).where(rate_limits.c.bucket == self.bucket)).mappings().first()
+        except Exception as e:
+            logging.warning(f"Não foi possível ler a cota '{self.bucket}': {e}")
+            return None
+        if row is None:
+            return None
+        now = time.time()
+        return self._snapshot(self._refill(dict(row), now), now)
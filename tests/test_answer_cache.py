@@ -0,0 +1,96 @@
+import time
+
+from services.answer_cache import (
+    AnswerCache, normalize_text, similarity, fuzzy_score, save_faq, context_fingerprint,
+)
+
+
+def test_normalize_text():
+    assert normalize_text("  Qual o HORÁRIO?? ") == "qual o horario"
+    assert normalize_text(None) == ""
+
+
+def test_similarity_fuzzy_variants():
+    assert similarity("qual o horario", "qual o horario") == 1.0
+    assert similarity("qual o horario de funcionamento", "qual horario de funcionamento") >= 0.75
+    assert similarity("preco", "endereco da loja") < 0.5
+
+
+def test_fuzzy_score_rejects_different_models_and_numbers():
+    n = normalize_text
+    assert fuzzy_score(n("Qual o preço da caneca personalizada modelo A?"),
+                       n("Qual o preço da caneca personalizada modelo B?")) == 0.0
+    assert fuzzy_score(n("quanto custa 100 unidades da caneca"), n("quanto custa 500 unidades da caneca")) == 0.0
+    assert fuzzy_score(n("frete para o cep 01310100"), n("frete para o cep 01310200")) == 0.0
+    # Só stop words e plural diferentes: é a mesma pergunta
+    assert fuzzy_score(n("qual o preço das canecas personalizadas"), n("qual preço da caneca personalizada")) == 1.0
+
+
+class TestAnswerCache:
+    """Testes para o cache de respostas do bot."""
+
+    def test_exact_hit_after_store(self, tmp_path):
+        cache = AnswerCache(faq_file=str(tmp_path / "faq.json"))
+        fp = context_fingerprint("prompt")
+        assert cache.lookup("Qual o horário?", fp) == (None, "miss")
+
+        cache.store("Qual o horário?", fp, "Das 8h às 18h.")
+        assert cache.lookup("qual o horario", fp) == ("Das 8h às 18h.", "exact")
+
+    def test_fuzzy_hit_respects_fingerprint(self, tmp_path):
+        cache = AnswerCache(similarity_threshold=0.7, faq_file=str(tmp_path / "faq.json"))
+        novo = context_fingerprint("prompt", [])
+        cont = context_fingerprint("prompt", [{"role": "model", "parts": ["Olá!"]}])
+        cache.store("qual o horario de funcionamento", novo, "Das 8h às 18h.")
+
+        assert cache.lookup("qual horario de funcionamento?", novo) == ("Das 8h às 18h.", "fuzzy")
+        assert cache.lookup("qual horario de funcionamento?", cont) == (None, "miss")
+
+    def test_fuzzy_hit_never_crosses_models_or_quantities(self, tmp_path):
+        cache = AnswerCache(faq_file=str(tmp_path / "faq.json"))
+        fp = context_fingerprint("prompt")
+        cache.store("qual o preço da caneca personalizada modelo A", fp, "Modelo A: R$ 35.")
+        cache.store("quanto custa 100 unidades da caneca", fp, "100 unidades: R$ 2.500.")
+
+        assert cache.lookup("qual o preço da caneca personalizada modelo B", fp) == (None, "miss")
+        assert cache.lookup("quanto custa 500 unidades da caneca", fp) == (None, "miss")
+        assert cache.lookup("quanto custa as 100 unidades da caneca?", fp) == ("100 unidades: R$ 2.500.", "fuzzy")
+
+    def test_ongoing_conversations_do_not_share_entries(self, tmp_path):
+        cache = AnswerCache(faq_file=str(tmp_path / "faq.json"))
+        bolo = context_fingerprint("prompt", [
+            {"role": "user", "parts": ["Quero o bolo de chocolate"]},
+            {"role": "model", "parts": ["Bolo de chocolate por R$ 80. Confirma, Maria?"]},
+        ])
+        torta = context_fingerprint("prompt", [
+            {"role": "user", "parts": ["Quero a torta de limão"]},
+            {"role": "model", "parts": ["Torta de limão por R$ 60. Confirma, João?"]},
+        ])
+        cache.store("Sim", bolo, "Perfeito, Maria! Pedido do bolo de chocolate (R$ 80) confirmado.")
+
+        assert bolo != torta
+        assert cache.lookup("sim", torta) == (None, "miss")
+        assert cache.lookup("sim", bolo)[1] == "exact"
+        # Mesmo histórico com resumo diferente também é outro contexto
+        assert context_fingerprint("prompt", [], summary="Cliente Maria") != context_fingerprint("prompt", [], summary="Cliente João")
+
+    def test_ttl_expires_entries(self, tmp_path):
+        cache = AnswerCache(ttl_seconds=60, faq_file=str(tmp_path / "faq.json"))
+        cache.store("oi", "fp", "Olá!")
+        key = ("fp", "oi")
+        cache._entries[key] = ("Olá!", time.time() - 120)
+
+        assert cache.lookup("oi", "fp") == (None, "miss")
+
+    def test_faq_layer_and_stats(self, tmp_path):
+        faq_file = str(tmp_path / "faq.json")
+        save_faq([("Qual o endereço?", "Rua das Flores, 10.")], faq_file)
+        cache = AnswerCache(faq_file=faq_file)
+
+        assert cache.lookup("qual o endereco", "qualquer") == ("Rua das Flores, 10.", "faq")
+        assert cache.lookup("preço", "qualquer") == (None, "miss")
+
+        stats = cache.get_stats()
+        assert stats["faq"] == 1
+        assert stats["lookups"] == 2
+        assert stats["hit_rate"] == 50.0
@@ -0,0 +1,72 @@
+from sqlalchemy import create_engine, text
+
+from services.bot_instances import instance_configs, instance_names, find_instance, set_instance_active
+from services.bot_tables import outbound_messages, ensure_tables
+from services.outbound_queue import OutboundQueue
+
+
+class TestInstanceConfigs:
+    """Testes para a configuração de várias instâncias da Evolution API."""
+
+    def test_single_instance_without_list(self):
+        config = {"bot_active": True, "evolution_instance_name": "BotFeh", "evolution_api_url": "http://x"}
+        [only] = instance_configs(config)
+        assert only["evolution_instance_name"] == "BotFeh"
+        assert only["bot_active"] is True
+        assert instance_names({}) == ["BotFeh"]
+
+    def test_entries_override_global_keys_and_pause(self):
+        config = {
+            "bot_active": True, "evolution_api_url": "http://x", "poll_max_interval_seconds": 30,
+            "instances": [
+                {"evolution_instance_name": "Loja"},
+                {"evolution_instance_name": "Suporte", "poll_max_interval_seconds": 10, "active": False},
+                {"evolution_instance_name": "Loja"},  # duplicada: ignorada
+            ],
+        }
+        loja, suporte = instance_configs(config)
+        assert (loja["evolution_api_url"], loja["poll_max_interval_seconds"], loja["bot_active"]) == ("http://x", 30, True)
+        assert (suporte["poll_max_interval_seconds"], suporte["bot_active"]) == (10, False)
+        assert "instances" not in loja
+        assert find_instance(config, "Vendas") is None
+
+        config["bot_active"] = False  # toggle global desliga todas
+        assert not any(item["bot_active"] for item in instance_configs(config))
+
+    def test_set_instance_active_creates_list_when_needed(self):
+        config = {"bot_active": True, "evolution_instance_name": "BotFeh"}
+        assert set_instance_active(config, "BotFeh", False)
+        assert config["instances"] == [{"evolution_instance_name": "BotFeh", "active": False}]
+        assert not find_instance(config, "BotFeh")["bot_active"]
+        assert not set_instance_active(config, "Outra", True)
+
+
+def test_outbound_queues_are_scoped_per_instance(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'outbound.db'}")
+    # Tabela criada antes da coluna `instance` existir: ensure_tables a adiciona
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE outbound_messages (id INTEGER PRIMARY KEY, phone_number VARCHAR NOT NULL, "
+            "remote_jid VARCHAR NOT NULL, text TEXT NOT NULL, status VARCHAR NOT NULL, attempts INTEGER NOT NULL, "
+            "next_attempt_at FLOAT NOT NULL, last_error VARCHAR, created_at DATETIME NOT NULL, sent_at DATETIME)"
+        ))
+        conn.execute(text(
+            "INSERT INTO outbound_messages (phone_number, remote_jid, text, status, attempts, next_attempt_at, created_at) "
+            "VALUES ('000', '000@s', 'antiga', 'queued', 0, 0, datetime('now', 'localtime'))"
+        ))
+    ensure_tables(engine, [outbound_messages])
+
+    sent = {"Loja": [], "Suporte": []}
+    queues = {
+        name: OutboundQueue(engine, sender=lambda jid, t, name=name: sent[name].append(t) or {"ok": 1},
+                            min_interval_seconds=0, instance=name, include_unassigned=name == "Loja")
+        for name in sent
+    }
+    queues["Loja"].enqueue("111", "111@s", "da loja")
+    queues["Suporte"].enqueue("222", "222@s", "do suporte")
+
+    assert queues["Suporte"].process_once() == 1
+    assert queues["Loja"].process_once() == 2
+    assert sent == {"Loja": ["antiga", "da loja"], "Suporte": ["do suporte"]}
+    assert queues["Suporte"].counts()["sent"] == 1
+    engine.dispose()
@@ -0,0 +1,21 @@
+from services.bot_logging import tail_lines
+
+
+class TestTailLines:
+    """Testes para a leitura das últimas linhas do bot.log."""
+
+    def test_last_lines_across_blocks(self, tmp_path):
+        log = tmp_path / "bot.log"
+        log.write_text("".join(f"linha {i} ção\n" for i in range(1000)), encoding="utf-8")
+
+        assert tail_lines(log, 3, block_size=16) == ["linha 997 ção", "linha 998 ção", "linha 999 ção"]
+
+    def test_without_trailing_newline_and_short_file(self, tmp_path):
+        log = tmp_path / "bot.log"
+        log.write_text("a\nb\nc", encoding="utf-8")
+
+        assert tail_lines(log, 2) == ["b", "c"]
+        assert tail_lines(log, 20) == ["a", "b", "c"]
+
+    def test_missing_file(self, tmp_path):
+        assert tail_lines(tmp_path / "nao_existe.log") == []
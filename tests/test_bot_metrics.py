@@ -0,0 +1,68 @@
+import pytest
+from sqlalchemy import create_engine
+
+from services.bot_metrics import BotMetrics, MetricsPublisher, histogram_quantile, load_metrics
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'metrics.db'}")
+    yield engine
+    engine.dispose()
+
+
+class TestBotMetrics:
+    """Testes para as métricas estruturadas do motor do bot."""
+
+    def test_counters_and_gauges(self):
+        metrics = BotMetrics()
+        metrics.inc("polls")
+        metrics.inc("polls")
+        metrics.inc("messages_processed", 3)
+        metrics.set_gauge("chat_write_queue", 7)
+
+        snap = metrics.snapshot()
+        assert snap["counters"] == {"polls": 2, "messages_processed": 3}
+        assert snap["gauges"]["chat_write_queue"] == 7
+
+    def test_histogram_quantiles(self):
+        metrics = BotMetrics()
+        for _ in range(9):
+            metrics.observe("gemini_latency_seconds", 0.2)
+        metrics.observe("gemini_latency_seconds", 4.0)
+
+        hist = metrics.snapshot()["histograms"]["gemini_latency_seconds"]
+        assert hist["count"] == 10
+        assert hist["max"] == 4.0
+        assert histogram_quantile(hist, 0.5) == 0.25
+        assert histogram_quantile(hist, 0.99) == 5
+        assert histogram_quantile(None, 0.5) is None
+
+    def test_timer_records_even_on_error(self):
+        metrics = BotMetrics()
+        with pytest.raises(RuntimeError):
+            with metrics.timer("send_latency_seconds"):
+                raise RuntimeError("falha no envio")
+        assert metrics.snapshot()["histograms"]["send_latency_seconds"]["count"] == 1
+
+
+class TestMetricsPublisher:
+    def test_publish_and_load(self, engine):
+        metrics = BotMetrics()
+        publisher = MetricsPublisher(metrics, "BotFeh", engine=engine, interval_seconds=60)
+
+        metrics.inc("polls")
+        publisher.maybe_publish({"open_turns": 2})
+        metrics.inc("polls")
+        publisher.maybe_publish()  # dentro do intervalo: não grava
+        loaded = load_metrics("BotFeh", engine=engine)
+        assert loaded["counters"]["polls"] == 1
+        assert loaded["gauges"]["open_turns"] == 2
+        assert loaded["updated_at"] is not None
+
+        publisher.publish()  # atualiza a mesma linha
+        assert load_metrics("BotFeh", engine=engine)["counters"]["polls"] == 2
+        assert load_metrics("OutraInstancia", engine=engine) is None
+
+    def test_load_without_table_returns_none(self, engine):
+        assert load_metrics("BotFeh", engine=engine) is None
@@ -0,0 +1,82 @@
+import sys
+import threading
+import time
+
+import pytest
+
+from services.bot_supervisor import BotSupervisor, ProcessLock, read_status, send_command
+
+
+def _wait_for(condition, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+@pytest.fixture
+def make_supervisor(tmp_path):
+    running = []
+
+    def factory(worker_code, **kwargs):
+        supervisor = BotSupervisor(
+            worker_cmd=[sys.executable, "-c", worker_code],
+            initial_backoff=0.05, max_backoff=0.2, stop_timeout=5, poll_interval=0.05,
+            lock_file=str(tmp_path / "sup.lock"), status_file=str(tmp_path / "sup.json"),
+            control_file=str(tmp_path / "control.json"), heartbeat_file=str(tmp_path / "hb.json"),
+            **kwargs,
+        )
+        thread = threading.Thread(target=supervisor.run, daemon=True)
+        thread.start()
+        running.append((supervisor, thread))
+        return supervisor
+
+    yield factory
+    for supervisor, thread in running:
+        send_command("shutdown", path=supervisor.control_file)
+        thread.join(timeout=10)
+
+
+class TestBotSupervisor:
+    """Testes para o supervisor do processo worker do bot."""
+
+    def test_restarts_crashed_worker(self, make_supervisor):
+        supervisor = make_supervisor("import sys; sys.exit(3)")
+
+        assert _wait_for(lambda: supervisor.restarts >= 3)
+        assert supervisor.last_exit_code == 3
+
+    def test_restarts_worker_without_heartbeat(self, make_supervisor):
+        supervisor = make_supervisor("import time; time.sleep(60)", heartbeat_timeout=0.3)
+
+        assert _wait_for(lambda: supervisor.restarts >= 1)
+
+    def test_stop_and_start_commands(self, make_supervisor):
+        supervisor = make_supervisor("import time; time.sleep(60)")
+        assert _wait_for(lambda: read_status(supervisor.status_file).get("worker_pid"))
+
+        send_command("stop", path=supervisor.control_file)
+        assert _wait_for(lambda: read_status(supervisor.status_file).get("state") == "stopped")
+        status = read_status(supervisor.status_file)
+        assert status["alive"]
+        assert status["worker_pid"] is None
+        assert supervisor.restarts == 0
+
+        send_command("start", path=supervisor.control_file)
+        assert _wait_for(lambda: read_status(supervisor.status_file).get("worker_pid"))
+
+    def test_single_supervisor_per_lock(self, tmp_path):
+        first = ProcessLock(str(tmp_path / "sup.lock"))
+        second = ProcessLock(str(tmp_path / "sup.lock"))
+        assert first.acquire()
+        assert not second.acquire()
+
+        first.release()
+        assert second.acquire()
+        second.release()
+
+    def test_invalid_command(self, tmp_path):
+        with pytest.raises(ValueError):
+            send_command("reboot", path=str(tmp_path / "control.json"))
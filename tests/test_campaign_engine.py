@@ -0,0 +1,173 @@
+import threading
+
+import pytest
+from sqlalchemy import create_engine, insert, select
+
+from services.bot_tables import customer_metadata, clientes, contatos, campaigns, campaign_deliveries
+from services.campaign_engine import (
+    CampaignRunner, create_campaign, set_campaign_status, list_campaigns, iter_recipients,
+    count_recipients, render_template, validate_template, whatsapp_number,
+)
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'campaigns.db'}")
+    customer_metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+def add_customers(engine, count, opt_in=lambda i: True, phone=lambda i: f"(11) 9{i:04d}-0000"):
+    with engine.begin() as conn:
+        for i in range(1, count + 1):
+            conn.execute(insert(clientes).values(id=i, nome_completo=f"CLIENTE NUMERO {i}",
+                                                 receber_atualizacoes=opt_in(i)))
+            conn.execute(insert(contatos).values(cliente_id=i, telefone=phone(i), tipo_contato="Principal"))
+            conn.execute(insert(contatos).values(cliente_id=i, telefone="11999999999", tipo_contato="Secundário"))
+
+
+class FakeSender:
+    def __init__(self, fail_numbers=(), on_send=None):
+        self.fail_numbers = set(fail_numbers)
+        self.on_send = on_send
+        self.sent = []
+        self._lock = threading.Lock()
+
+    def __call__(self, number, text):
+        if self.on_send:
+            self.on_send(number)
+        if number in self.fail_numbers:
+            return None
+        with self._lock:
+            self.sent.append((number, text))
+        return {"key": {"id": "x"}}
+
+
+def make_runner(engine, sender, **kwargs):
+    kwargs.setdefault("batch_size", 3)
+    kwargs.setdefault("status_check_seconds", 0)
+    return CampaignRunner(engine, sender=sender, max_per_day=10_000, **kwargs)
+
+
+def get_campaign(engine, campaign_id):
+    with engine.connect() as conn:
+        return conn.execute(select(campaigns).where(campaigns.c.id == campaign_id)).mappings().first()
+
+
+class TestRecipients:
+    """Testes para a leitura dos destinatários e o texto das campanhas."""
+
+    def test_keyset_batches_only_opted_in_principal_phones(self, engine):
+        add_customers(engine, 7, opt_in=lambda i: i != 2, phone=lambda i: "" if i == 5 else f"1190000000{i}")
+
+        batches = list(iter_recipients(batch_size=2, engine=engine))
+        ids = [r["cliente_id"] for batch in batches for r in batch]
+        assert ids == [1, 3, 4, 6, 7]
+        assert all(len(batch) <= 2 for batch in batches)
+        assert batches[0][0]["telefone"] == "11900000001"
+        assert count_recipients(engine) == 5
+        assert [r["cliente_id"] for b in iter_recipients(after_id=4, engine=engine) for r in b] == [6, 7]
+
+    def test_template_and_phone_helpers(self):
+        recipient = {"nome_completo": "MARIA DA SILVA", "nome_contato": None}
+        assert render_template("Olá {nome}! ({nome_completo}) {contato}", recipient) == \
+            "Olá Maria! (MARIA DA SILVA) Maria"
+        validate_template("Olá {nome}")
+        with pytest.raises(ValueError):
+            validate_template("Olá {cpf}")
+        with pytest.raises(ValueError):
+            validate_template("Olá {nome")
+        assert whatsapp_number("(11) 98765-4321") == "5511987654321"
+        assert whatsapp_number("5511987654321") == "5511987654321"
+        assert whatsapp_number("123") is None
+
+
+class TestCampaignRunner:
+    """Testes para o envio com checkpoint, pausa e retomada."""
+
+    def test_sends_to_everyone_and_finishes(self, engine):
+        add_customers(engine, 5, phone=lambda i: "abc" if i == 4 else f"1190000000{i}")
+        sender = FakeSender(fail_numbers={"5511900000002"})
+        campaign_id = create_campaign("Promo", "Oi {nome}", rate_per_minute=6000, concurrency=2, engine=engine)
+        set_campaign_status(campaign_id, "running", engine=engine)
+        delivered = []
+        runner = make_runner(engine, sender, on_sent=lambda number, text: delivered.append(number))
+
+        assert runner.run_campaign(get_campaign(engine, campaign_id)) == "done"
+        assert sorted(sender.sent) == [(f"551190000000{i}", "Oi Cliente") for i in (1, 3, 5)]
+        assert sorted(delivered) == ["5511900000001", "5511900000003", "5511900000005"]
+
+        stats = list_campaigns(engine=engine)[0]
+        assert (stats["status"], stats["total"], stats["sent"], stats["failed"]) == ("done", 5, 3, 2)
+        assert stats["progress"] == 1.0
+        assert stats["cursor_cliente_id"] == 5
+
+    def test_pause_checkpoints_and_resume_does_not_resend(self, engine):
+        add_customers(engine, 8)
+        campaign_id = create_campaign("Promo", "Oi {nome}", rate_per_minute=6000, concurrency=1, engine=engine)
+        set_campaign_status(campaign_id, "running", engine=engine)
+
+        def pause_on_fourth_send(number):
+            if len(sender.sent) == 3:
+                set_campaign_status(campaign_id, "paused", engine=engine)
+
+        sender = FakeSender(on_send=pause_on_fourth_send)
+        assert make_runner(engine, sender).run_campaign(get_campaign(engine, campaign_id)) == "paused"
+        paused = get_campaign(engine, campaign_id)
+        assert paused["sent"] == len(sender.sent) == 4
+        assert paused["cursor_cliente_id"] == 4
+
+        assert set_campaign_status(campaign_id, "running", engine=engine)
+        resumed = FakeSender()
+        assert make_runner(engine, resumed).run_campaign(get_campaign(engine, campaign_id)) == "done"
+        assert len(resumed.sent) == 4
+        assert {n for n, _ in sender.sent}.isdisjoint(n for n, _ in resumed.sent)
+        assert get_campaign(engine, campaign_id)["sent"] == 8
+
+    def test_counters_are_live_within_a_batch(self, engine):
+        add_customers(engine, 3)
+        campaign_id = create_campaign("Promo", "Oi", rate_per_minute=6000, concurrency=1, engine=engine)
+        set_campaign_status(campaign_id, "running", engine=engine)
+        seen = []
+        sender = FakeSender(on_send=lambda number: seen.append(list_campaigns(engine=engine)[0]["sent"]))
+
+        make_runner(engine, sender, batch_size=50).run_campaign(get_campaign(engine, campaign_id))
+        assert seen == [0, 1, 2]  # cada envio já vê os anteriores, sem esperar o fim do lote
+        assert get_campaign(engine, campaign_id)["active_seconds"] > 0
+
+    def test_resume_after_crash_skips_recorded_deliveries(self, engine):
+        """Entregas gravadas depois do último checkpoint não são reenviadas."""
+        add_customers(engine, 3)
+        campaign_id = create_campaign("Promo", "Oi", rate_per_minute=6000, engine=engine)
+        set_campaign_status(campaign_id, "running", engine=engine)
+        make_runner(engine, FakeSender())._update(campaign_id, total=3)
+        with engine.begin() as conn:
+            conn.execute(insert(campaign_deliveries).values(
+                campaign_id=campaign_id, cliente_id=1, phone_number="5511900000001", status="sent",
+                created_at=get_campaign(engine, campaign_id)["created_at"],
+            ))
+
+        sender = FakeSender()
+        make_runner(engine, sender).run_campaign(get_campaign(engine, campaign_id))
+        assert [n for n, _ in sender.sent] == ["5511900020000", "5511900030000"]
+        assert get_campaign(engine, campaign_id)["sent"] == 3
+
+    def test_consecutive_failures_pause_campaign(self, engine):
+        add_customers(engine, 6)
+        campaign_id = create_campaign("Promo", "Oi", rate_per_minute=6000, concurrency=1, engine=engine)
+        set_campaign_status(campaign_id, "running", engine=engine)
+        sender = FakeSender(fail_numbers={f"55119{i:04d}0000" for i in range(1, 7)})
+
+        status = make_runner(engine, sender, max_consecutive_failures=3).run_campaign(get_campaign(engine, campaign_id))
+        campaign = get_campaign(engine, campaign_id)
+        assert status == "paused"
+        assert campaign["failed"] == 3
+        assert "falhas seguidas" in campaign["last_error"]
+
+    def test_status_transitions(self, engine):
+        campaign_id = create_campaign("Promo", "Oi", engine=engine)
+        assert not set_campaign_status(campaign_id, "paused", engine=engine)  # rascunho não pausa
+        assert set_campaign_status(campaign_id, "running", engine=engine)
+        assert set_campaign_status(campaign_id, "cancelled", engine=engine)
+        assert not set_campaign_status(campaign_id, "running", engine=engine)
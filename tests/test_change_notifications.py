@@ -0,0 +1,80 @@
+import threading
+
+from sqlalchemy import create_engine, text
+
+from services.change_notifications import ChangeListener, ensure_change_triggers
+
+
+def make_engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'changes.db'}")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE clientes (id INTEGER PRIMARY KEY, nome VARCHAR)"))
+        conn.execute(text("CREATE TABLE contatos (id INTEGER PRIMARY KEY, cliente_id INTEGER, telefone VARCHAR)"))
+        conn.execute(text("CREATE TABLE chat_history (id INTEGER PRIMARY KEY, phone_number VARCHAR, content VARCHAR)"))
+        conn.execute(text("INSERT INTO clientes (id, nome) VALUES (1, 'Ana'), (2, 'Bruno')"))
+    ensure_change_triggers(engine)
+    ensure_change_triggers(engine)  # idempotente
+    return engine
+
+
+class TestChangeNotifications:
+    """Testes para o aviso de mudanças (fallback por polling do SQLite)."""
+
+    def test_writes_are_reported_by_entity_and_id(self, tmp_path):
+        engine = make_engine(tmp_path)
+        listener = ChangeListener(engine)
+        received = []
+        listener.subscribe("test", received.append)
+
+        assert listener.poll_once() == []  # só marca o ponto de partida
+        with engine.begin() as conn:
+            conn.execute(text("UPDATE clientes SET nome = 'Ana Maria' WHERE id = 1"))
+            conn.execute(text("INSERT INTO contatos (cliente_id, telefone) VALUES (2, '1199'), (2, '1198')"))
+            conn.execute(text("DELETE FROM clientes WHERE id = 2"))
+            conn.execute(text("INSERT INTO chat_history (phone_number, content) VALUES ('5511999', 'oi')"))
+
+        listener.poll_once()
+        assert received == [[("clientes", 1), ("contatos", 2), ("clientes", 2), ("chat_history", "5511999")]]
+        assert listener.poll_once() == []
+        assert len(received) == 1
+        engine.dispose()
+
+    def test_subscribe_replaces_callback_and_errors_are_isolated(self, tmp_path):
+        engine = make_engine(tmp_path)
+        listener = ChangeListener(engine)
+        first, second = [], []
+        listener.subscribe("page", first.append)
+        listener.subscribe("page", second.append)
+        listener.subscribe("broken", lambda changes: 1 / 0)
+
+        listener.dispatch([("clientes", 1), ("clientes", 1)])
+        assert first == []
+        assert second == [[("clientes", 1)]]
+        engine.dispose()
+
+    def test_listen_url_gets_its_own_engine(self, tmp_path):
+        engine = make_engine(tmp_path)
+        listener = ChangeListener(engine, listen_url=f"sqlite:///{tmp_path / 'changes.db'}")
+        assert listener.listen_engine is not engine
+        assert str(listener.listen_engine.url).endswith("changes.db")
+        engine.dispose()
+
+    def test_thread_polls_in_background(self, tmp_path):
+        engine = make_engine(tmp_path)
+        listener = ChangeListener(engine, poll_seconds=0.05)
+        got_change = threading.Event()
+        listener.subscribe("test", lambda changes: got_change.set())
+        assert listener.listen_engine is engine  # engine explícito: sem URL de escuta à parte
+        assert listener.cache_ttl(60, 600) == 60
+        listener.start()
+        try:
+            assert listener.connected.wait(5)
+            assert listener.cache_ttl(60, 600) == 600
+            with engine.begin() as conn:
+                conn.execute(text("UPDATE clientes SET nome = 'Bia' WHERE id = 2"))
+            assert got_change.wait(5)
+        finally:
+            listener.stop()
+        assert not listener.is_alive()
+        assert listener.cache_ttl(60, 600) == 60  # sem escuta, volta ao TTL curto
+        engine.dispose()
@@ -0,0 +1,87 @@
+import pytest
+from sqlalchemy import create_engine, select, func
+
+from services.bot_tables import chat_history, ensure_tables
+from services.chat_history_writer import ChatHistoryWriter
+
+
+@pytest.fixture
+def engine(tmp_path):
+    """Banco SQLite em arquivo (compartilhável entre threads) com a tabela do chat."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'chat.db'}")
+    ensure_tables(engine)
+    yield engine
+    engine.dispose()
+
+
+def _count(engine):
+    with engine.connect() as conn:
+        return conn.execute(select(func.count()).select_from(chat_history)).scalar()
+
+
+class TestChatHistoryWriter:
+    """Testes para o writer write-behind do chat_history."""
+
+    def test_buffers_until_flush(self, engine):
+        """Mensagens ficam no buffer e são gravadas num único flush."""
+        writer = ChatHistoryWriter(engine, flush_interval_ms=60000, max_batch_rows=100)
+        writer.enqueue("5511999999999", "user", "oi", external_id="A1")
+        writer.enqueue("5511999999999", "model", "Olá!")
+
+        assert _count(engine) == 0
+        assert writer.is_pending("A1")
+
+        assert writer.flush() == 2
+        assert _count(engine) == 2
+        assert not writer.is_pending("A1")
+
+    def test_dedup_by_external_id(self, engine):
+        """external_id repetido não é gravado duas vezes (buffer e banco)."""
+        writer = ChatHistoryWriter(engine, flush_interval_ms=60000)
+        assert writer.enqueue("551100000000", "user", "oi", external_id="X")
+        assert not writer.enqueue("551100000000", "user", "oi", external_id="X")
+        writer.flush()
+
+        writer.enqueue("551100000000", "user", "oi", external_id="X")
+        writer.flush()
+        assert _count(engine) == 1
+
+    def test_with_pending_merges_history(self, engine):
+        """O histórico do banco é completado com as mensagens ainda no buffer."""
+        writer = ChatHistoryWriter(engine, flush_interval_ms=60000)
+        writer.enqueue("111", "user", "preço?")
+        writer.enqueue("222", "user", "outro número")
+
+        history = [{"role": "model", "parts": ["Bem-vindo"]}]
+        merged = writer.with_pending("111", history, limit=10)
+
+        assert merged == [
+            {"role": "model", "parts": ["Bem-vindo"]},
+            {"role": "user", "parts": ["preço?"]},
+        ]
+
+    def test_stop_flushes_buffer(self, engine):
+        """stop() grava o que estiver no buffer e mensagens tardias são gravadas na hora."""
+        writer = ChatHistoryWriter(engine, flush_interval_ms=60000, max_batch_rows=100)
+        writer.start()
+        writer.enqueue("111", "user", "a")
+        writer.enqueue("111", "user", "b")
+        writer.stop()
+
+        assert _count(engine) == 2
+        assert not writer.is_alive()
+
+        writer.enqueue("111", "model", "tardia")
+        assert _count(engine) == 3
+
+    def test_failed_flush_keeps_rows(self, tmp_path):
+        """Se o banco falhar, as linhas voltam ao buffer para a próxima tentativa."""
+        engine = create_engine(f"sqlite:///{tmp_path / 'sem_tabela.db'}")
+        writer = ChatHistoryWriter(engine, flush_interval_ms=60000)
+        writer.enqueue("111", "user", "a", external_id="E1")
+
+        assert writer.flush() == 0
+        assert writer.pending_count() == 1
+
+        ensure_tables(engine)
+        assert writer.flush() == 1
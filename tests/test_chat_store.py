@@ -0,0 +1,63 @@
+import datetime
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+from sqlalchemy import create_engine, insert
+
+from services import chat_store
+from services.bot_tables import chat_history, ensure_tables
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'chat.db'}")
+    ensure_tables(engine, [chat_history])
+    yield engine
+    engine.dispose()
+
+
+class TestChatStore:
+    """Testes para a persistência de chat usada pelo processo do bot."""
+
+    def test_history_is_chronological_and_limited(self, engine):
+        base = datetime.datetime(2026, 1, 1, 12, 0)
+        with engine.begin() as conn:
+            for i, role in enumerate(["user", "model", "user", "model"]):
+                conn.execute(insert(chat_history).values(
+                    phone_number="111", role=role, content=f"msg {i}",
+                    timestamp=base + datetime.timedelta(minutes=i), is_read=0,
+                ))
+
+        history = chat_store.get_chat_history("111", limit=3, engine=engine)
+        assert history == [
+            {"role": "model", "parts": ["msg 1"]},
+            {"role": "user", "parts": ["msg 2"]},
+            {"role": "model", "parts": ["msg 3"]},
+        ]
+        assert chat_store.get_chat_history("222", engine=engine) == []
+
+    def test_save_and_check_exists(self, engine):
+        chat_store.save_chat_message("111", "user", "oi", external_id="ext-1", engine=engine)
+
+        assert chat_store.check_message_exists("ext-1", engine=engine)
+        assert not chat_store.check_message_exists("ext-2", engine=engine)
+        assert not chat_store.check_message_exists(None, engine=engine)
+        assert chat_store.get_recent_chats(engine=engine)[0]["content"] == "oi"
+
+    def test_errors_do_not_raise(self):
+        broken = create_engine("sqlite:////caminho/inexistente/chat.db")
+        assert chat_store.get_chat_history("111", engine=broken) == []
+        assert not chat_store.check_message_exists("ext-1", engine=broken)
+
+
+def test_import_has_no_ui_dependencies():
+    """O módulo não pode puxar Streamlit, pandas nem os modelos (que conectam no import)."""
+    code = (
+        "import sys; sys.path.insert(0, %r); import services.chat_store; "
+        "print(','.join(m for m in ('streamlit', 'pandas', 'sqlmodel', 'models', 'database') if m in sys.modules))"
+        % str(Path(__file__).resolve().parents[1])
+    )
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == ""
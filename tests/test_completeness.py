@@ -0,0 +1,54 @@
+from sqlalchemy import create_engine, text
+
+from services.completeness import ensure_completeness_flags, missing_filter, refresh_completeness
+
+
+def make_legacy_db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE clientes (id INTEGER PRIMARY KEY, nome_completo TEXT)"))
+        conn.execute(text("CREATE TABLE contatos (id INTEGER PRIMARY KEY, cliente_id INTEGER, telefone TEXT, email_contato TEXT, tipo_contato TEXT)"))
+        conn.execute(text("CREATE TABLE enderecos (id INTEGER PRIMARY KEY, cliente_id INTEGER, cep TEXT, tipo_endereco TEXT)"))
+        conn.execute(text("INSERT INTO clientes (id, nome_completo) VALUES (1, 'Completo'), (2, 'Sem email'), (3, 'Vazio')"))
+        conn.execute(text("""INSERT INTO contatos (cliente_id, telefone, email_contato, tipo_contato) VALUES
+            (1, '11999', 'a@b.c', 'Principal'), (2, '11999', '', 'Principal'), (3, '', 'x@y.z', 'Secundário')"""))
+        conn.execute(text("INSERT INTO enderecos (cliente_id, cep, tipo_endereco) VALUES (1, '01234567', 'Principal')"))
+    return engine
+
+
+def flags(engine):
+    with engine.connect() as conn:
+        return [tuple(row) for row in conn.execute(text(
+            "SELECT id, missing_email, missing_phone, missing_cep FROM clientes ORDER BY id"))]
+
+
+class TestCompleteness:
+    """Testes para os flags de completude mantidos por cliente."""
+
+    def test_ensure_adds_columns_backfills_and_indexes(self, tmp_path):
+        engine = make_legacy_db(tmp_path)
+        ensure_completeness_flags(engine)
+        ensure_completeness_flags(engine)  # idempotente
+
+        assert flags(engine) == [(1, 0, 0, 0), (2, 1, 0, 1), (3, 1, 1, 1)]
+        with engine.connect() as conn:
+            plan = conn.execute(text(
+                f"EXPLAIN QUERY PLAN SELECT id FROM clientes WHERE {missing_filter(['email'])} ORDER BY id DESC"
+            )).fetchall()
+        assert "ix_clientes_incompletos" in str(plan)
+        engine.dispose()
+
+    def test_refresh_single_customer(self, tmp_path):
+        engine = make_legacy_db(tmp_path)
+        ensure_completeness_flags(engine)
+        with engine.begin() as conn:
+            conn.execute(text("UPDATE contatos SET email_contato = 'novo@b.c' WHERE cliente_id = 2"))
+            conn.execute(text("DELETE FROM enderecos WHERE cliente_id = 1"))
+            refresh_completeness(conn, 2)
+
+        assert flags(engine)[:2] == [(1, 0, 0, 0), (2, 0, 0, 1)]  # só o cliente 2 foi recalculado
+        engine.dispose()
+
+    def test_missing_filter_ignores_unknown_fields(self):
+        assert missing_filter() == missing_filter(["cpf"])
+        assert missing_filter(["cep", "email"]).endswith("(missing_cep OR missing_email)")
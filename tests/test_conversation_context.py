@@ -0,0 +1,96 @@
+import datetime
+
+import pytest
+from sqlalchemy import create_engine, insert
+
+from services.bot_tables import chat_history, ensure_tables
+from services.conversation_context import ConversationContext, estimate_tokens, fit_to_budget
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'context.db'}")
+    ensure_tables(engine, [chat_history])
+    yield engine
+    engine.dispose()
+
+
+def add_messages(engine, phone, count, start=0):
+    with engine.begin() as conn:
+        for i in range(start, start + count):
+            conn.execute(insert(chat_history).values(
+                phone_number=phone, role="user" if i % 2 == 0 else "model", content=f"msg {i}",
+                timestamp=datetime.datetime(2026, 1, 1) + datetime.timedelta(minutes=i), is_read=0,
+            ))
+
+
+class FakeSummarizer:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, previous, messages):
+        self.calls.append((previous, [m["parts"][0] for m in messages]))
+        return f"resumo até {messages[-1]['parts'][0]}"
+
+
+class TestConversationContext:
+    """Testes para o resumo acumulado e o orçamento de tokens do contexto."""
+
+    def test_short_conversation_goes_raw(self, engine):
+        add_messages(engine, "111", 5)
+        summarizer = FakeSummarizer()
+        context = ConversationContext(engine, recent_messages=4, summarize_every=3)
+
+        summary, history = context.build("111", summarizer=summarizer)
+        assert summary == ""
+        assert [m["parts"][0] for m in history] == [f"msg {i}" for i in range(5)]
+        assert summarizer.calls == []
+
+    def test_summarizes_lazily_every_k_messages(self, engine):
+        add_messages(engine, "111", 7)
+        summarizer = FakeSummarizer()
+        context = ConversationContext(engine, recent_messages=4, summarize_every=3)
+
+        summary, history = context.build("111", summarizer=summarizer)
+        assert summary == "resumo até msg 2"
+        assert [m["parts"][0] for m in history] == ["msg 3", "msg 4", "msg 5", "msg 6"]
+
+        # Poucas mensagens novas: reaproveita o resumo salvo, sem chamar o modelo
+        add_messages(engine, "111", 2, start=7)
+        summary, history = context.build("111", summarizer=summarizer)
+        assert len(summarizer.calls) == 1
+        assert summary == "resumo até msg 2"
+        assert [m["parts"][0] for m in history][0] == "msg 3"
+
+        # K novas além das recentes: atualiza a partir do resumo anterior
+        add_messages(engine, "111", 1, start=9)
+        summary, _ = context.build("111", summarizer=summarizer)
+        assert summarizer.calls[-1] == ("resumo até msg 2", ["msg 3", "msg 4", "msg 5"])
+        assert summary == "resumo até msg 5"
+
+    def test_failed_summary_keeps_raw_history(self, engine):
+        add_messages(engine, "111", 7)
+        context = ConversationContext(engine, recent_messages=4, summarize_every=3)
+
+        summary, history = context.build("111", summarizer=lambda prev, msgs: None)
+        assert summary == ""
+        assert len(history) == 7
+
+    def test_pending_messages_are_appended(self, engine):
+        add_messages(engine, "111", 2)
+        context = ConversationContext(engine)
+        _, history = context.build("111", pending_messages=[{"role": "user", "parts": ["ainda no buffer"]}])
+        assert history[-1]["parts"] == ["ainda no buffer"]
+
+
+def test_fit_to_budget_drops_oldest_first():
+    history = [{"role": "user", "parts": ["x" * 400]} for _ in range(5)]  # ~102 tokens cada
+    summary, trimmed = fit_to_budget("resumo " * 20, history, token_budget=300)
+
+    assert len(trimmed) == 2
+    assert trimmed[-1] is history[-1]
+    assert summary == "resumo " * 20
+
+    summary, trimmed = fit_to_budget("r" * 4000, history[:1], token_budget=150)
+    assert trimmed == history[:1]
+    assert estimate_tokens(summary) <= 150 - 102
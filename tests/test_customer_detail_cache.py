@@ -0,0 +1,81 @@
+import threading
+
+from services.customer_detail_cache import CustomerDetailCache, invalidate_all
+
+
+class FakeLoader:
+    def __init__(self, release=None):
+        self.calls = []
+        self.release = release
+        self.version = 1
+        self.started = threading.Event()
+
+    def __call__(self, ids):
+        self.calls.append(list(ids))
+        self.started.set()
+        if self.release:
+            self.release.wait(5)
+        return {i: {"id": i, "v": self.version} for i in ids if i != 404}
+
+
+class TestCustomerDetailCache:
+    """Testes para o cache de detalhes por sessão do Banco de Dados."""
+
+    def test_prefetched_page_is_served_without_loading_again(self):
+        loader = FakeLoader()
+        cache = CustomerDetailCache(loader)
+        cache.prefetch([1, 2, 3]).result(timeout=5)
+
+        assert [cache.get(i)["id"] for i in (1, 2, 3)] == [1, 2, 3]
+        assert loader.calls == [[1, 2, 3]]
+        cache.prefetch([2, 3, 4]).result(timeout=5)
+        assert loader.calls[-1] == [4]  # só o que faltava
+
+    def test_get_waits_for_pending_prefetch(self):
+        release = threading.Event()
+        loader = FakeLoader(release)
+        cache = CustomerDetailCache(loader)
+        cache.prefetch([7])
+        threading.Timer(0.1, release.set).start()
+
+        assert cache.get(7) == {"id": 7, "v": 1}
+        assert loader.calls == [[7]]
+
+    def test_prefetch_with_lazy_ids(self):
+        loader = FakeLoader()
+        cache = CustomerDetailCache(loader)
+        cache.prefetch(lambda: [10, 11]).result(timeout=5)
+        assert 10 in cache and 11 in cache
+
+    def test_invalidate_reloads_and_discards_in_flight_result(self):
+        release = threading.Event()
+        loader = FakeLoader(release)
+        cache = CustomerDetailCache(loader)
+        future = cache.prefetch([1])
+        assert loader.started.wait(5)
+        cache.invalidate(1)  # editado enquanto o prefetch lia a versão antiga
+        release.set()
+        future.result(timeout=5)
+        assert 1 not in cache
+
+        loader.version = 2
+        assert cache.get(1)["v"] == 2
+        cache.invalidate()
+        assert 1 not in cache
+
+    def test_missing_customer_and_lru_limit(self):
+        cache = CustomerDetailCache(FakeLoader(), max_entries=2)
+        assert cache.get(404) is None
+        for i in (1, 2, 3):
+            cache.get(i)
+        assert 1 not in cache and 2 in cache and 3 in cache
+
+    def test_invalidate_all_reaches_every_session(self):
+        sessions = [CustomerDetailCache(FakeLoader()) for _ in range(2)]
+        for cache in sessions:
+            cache.get(1)
+            cache.get(2)
+        invalidate_all(1)
+        assert all(1 not in cache and 2 in cache for cache in sessions)
+        invalidate_all()
+        assert all(2 not in cache for cache in sessions)
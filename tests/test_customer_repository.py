@@ -187,3 +187,111 @@ class TestCustomerRepository:
         assert len(states) == 2
         assert "SP" in states
         assert "RJ" in states
+
+    def test_get_dashboard_snapshot(self, customer_repository, sample_contato, sample_endereco):
+        """Testa KPIs e série temporal vindos da mesma consulta."""
+        cliente_jan = Cliente(nome_completo="Cliente Jan", tipo_documento="CPF", cpf="11111111111", data_cadastro=date(2026, 1, 5))
+        cliente_fev = Cliente(nome_completo="Cliente Fev", tipo_documento="CPF", cpf="22222222222", data_cadastro=date(2026, 2, 5))
+        cliente_antigo = Cliente(nome_completo="Cliente Antigo", tipo_documento="CPF", cpf="33333333333", data_cadastro=date(2020, 1, 1))
+
+        customer_repository.create_customer(cliente_jan, [sample_contato], [sample_endereco])
+        customer_repository.create_customer(cliente_fev, [], [])
+        customer_repository.create_customer(cliente_antigo, [], [])
+
+        snapshot = customer_repository.get_dashboard_snapshot(date(2026, 1, 1), date(2026, 12, 31), period='M')
+
+        assert snapshot['total_customers'] == 3
+        assert snapshot['new_in_period'] == 2
+        assert round(snapshot['email_completeness'], 1) == 33.3
+        assert snapshot['timeseries']['time_period'].dt.strftime('%Y-%m').tolist()[:3] == ['2026-01', '2026-02', '2026-03']
+        assert snapshot['timeseries']['count'].tolist()[:3] == [1, 1, 0]
+
+        empty = customer_repository.get_dashboard_snapshot(date(2030, 1, 1), date(2030, 12, 31), period='D')
+        assert empty['new_in_period'] == 0
+        assert empty['timeseries'].empty
+
+    def test_get_location_clusters_and_states(self, customer_repository):
+        """Testa a agregação do mapa em células e a contagem por estado no banco."""
+        def endereco(lat, lon, estado):
+            return Endereco(cep="01234567", logradouro="Rua", numero="1", bairro="Centro", cidade="Cidade",
+                            estado=estado, tipo_endereco="Principal", latitude=lat, longitude=lon)
+
+        pontos = [(-23.55, -46.63, "SP"), (-23.56, -46.64, "SP"), (-22.90, -43.20, "RJ")]
+        for i, (lat, lon, estado) in enumerate(pontos):
+            cliente = Cliente(nome_completo=f"Cliente {i}", tipo_documento="CPF", cpf=f"{i}" * 11, data_cadastro=date(2026, 3, 1))
+            customer_repository.create_customer(cliente, [], [endereco(lat, lon, estado)])
+
+        clusters = customer_repository.get_location_clusters(1.0)
+        assert sorted(clusters['count'].tolist()) == [1, 2]
+        sp = clusters[clusters['count'] == 2].iloc[0]
+        assert round(sp['latitude'], 3) == -23.555
+
+        assert customer_repository.get_location_clusters(1.0, date(2030, 1, 1), date(2030, 12, 31)).empty
+
+        states = customer_repository.get_customers_per_state()
+        assert dict(zip(states['estado'], states['count'])) == {"SP": 2, "RJ": 1}
+
+    def test_get_customers_in_box_uses_geo_cell(self, customer_repository, sample_endereco):
+        """Testa que o endereço recebe a célula da grade e é achado pelo pré-filtro."""
+        from services.geo_search import bounding_box, cell_ranges, grid_cell
+
+        cliente = Cliente(nome_completo="Cliente Geo", tipo_documento="CPF", cpf="44444444444")
+        customer_repository.create_customer(cliente, [], [sample_endereco])
+        assert sample_endereco.geo_cell == grid_cell(sample_endereco.latitude, sample_endereco.longitude)
+
+        box = bounding_box(-23.55, -46.63, 5)
+        found = customer_repository.get_customers_in_box(box, cell_ranges(box))
+        assert found['nome_completo'].tolist() == ["Cliente Geo"]
+        assert customer_repository.get_customers_in_box(bounding_box(-22.9, -43.2, 5)).empty
+
+    def test_get_new_customers_timeseries_fills_gaps(self, customer_repository):
+        """Testa buckets por semana (segunda-feira) com zero nas semanas sem cadastro."""
+        for i, dia in enumerate([date(2026, 1, 6), date(2026, 1, 8), date(2026, 1, 21)]):
+            cliente = Cliente(nome_completo=f"Cliente {i}", tipo_documento="CPF", cpf=f"{i}" * 11, data_cadastro=dia)
+            customer_repository.create_customer(cliente, [], [])
+
+        series = customer_repository.get_new_customers_timeseries(date(2026, 1, 1), date(2026, 1, 31), period='W')
+        assert series['time_period'].dt.strftime('%m-%d').tolist() == ['01-05', '01-12', '01-19', '01-26']
+        assert series['count'].tolist() == [2, 0, 1, 0]
+
+        # Antes do primeiro cadastro não há lacuna para preencher
+        monthly = customer_repository.get_new_customers_timeseries(date(2000, 1, 1), date(2026, 2, 10), period='M')
+        assert monthly['count'].tolist() == [3, 0]
+        assert customer_repository.get_new_customers_timeseries(date(2030, 1, 1), date(2030, 2, 1)).empty
+
+    def test_incomplete_customers_flags_and_keyset_pages(self, customer_repository, sample_contato, sample_endereco):
+        """Testa os flags mantidos a cada mudança e a paginação por keyset do relatório."""
+        completo = customer_repository.create_customer(
+            Cliente(nome_completo="Completo", tipo_documento="CPF", cpf="11111111111"), [sample_contato], [sample_endereco])
+        for i in range(2, 7):
+            customer_repository.create_customer(Cliente(nome_completo=f"Vazio {i}", tipo_documento="CPF", cpf=f"{i}" * 11), [], [])
+
+        assert (completo.missing_email, completo.missing_phone, completo.missing_cep) == (False, False, False)
+        assert customer_repository.count_incomplete_customers() == 5
+
+        first = customer_repository.get_incomplete_customers(limit=3)
+        second = customer_repository.get_incomplete_customers(after_id=int(first['id'].iloc[-1]), limit=3)
+        assert first['id'].tolist() + second['id'].tolist() == [6, 5, 4, 3, 2]
+
+        customer_repository.update_customer(completo.id, {'email': '', 'cep': '99999999', 'missing_cep': True})
+        assert customer_repository.count_incomplete_customers(['cep']) == 5
+        customer_repository.delete_customer(completo.id)
+        assert customer_repository.get_incomplete_customers(['email'], limit=None)['missing_email'].tolist() == [1] * 5
+
+    def test_list_customer_rows_projects_only_requested_columns(self, customer_repository, sample_contato, sample_endereco):
+        """Testa o grid com projeção: só as colunas pedidas, contato/endereço principal."""
+        secundario = Contato(nome_contato="Outro", telefone="11888888888", tipo_contato="Secundário")
+        customer_repository.create_customer(
+            Cliente(nome_completo="Com Dados", tipo_documento="CPF", cpf="11111111111"),
+            [secundario, sample_contato], [sample_endereco])
+        customer_repository.create_customer(Cliente(nome_completo="Sem Dados", tipo_documento="CPF", cpf="22222222222"), [], [])
+
+        rows = customer_repository.list_customer_rows(["nome_completo", "telefone1", "email", "estado"])
+        assert rows == [
+            {"id": 1, "nome_completo": "Com Dados", "telefone1": sample_contato.telefone,
+             "email": sample_contato.email_contato, "estado": "SP"},
+            {"id": 2, "nome_completo": "Sem Dados", "telefone1": None, "email": None, "estado": None},
+        ]
+        assert customer_repository.list_customer_rows(["nome_completo"], state_filter="SP") == [
+            {"id": 1, "nome_completo": "Com Dados"}]
+        assert customer_repository.list_customer_rows(["id"], search_query="sem", offset=0, limit=1) == [{"id": 2}]
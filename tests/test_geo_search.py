@@ -0,0 +1,55 @@
+import pytest
+from sqlalchemy import create_engine, text
+
+from services.geo_search import (
+    bounding_box, cell_ranges, ensure_geo_cells, grid_cell, haversine_km,
+)
+
+SAO_PAULO = (-23.5505, -46.6333)
+CAMPINAS = (-22.9056, -47.0608)
+RIO = (-22.9068, -43.1729)
+
+
+class TestGeoSearch:
+    """Testes para a grade e o haversine da busca por proximidade."""
+
+    def test_haversine_known_distances(self):
+        distances = haversine_km(*SAO_PAULO, [CAMPINAS[0], RIO[0], SAO_PAULO[0]], [CAMPINAS[1], RIO[1], SAO_PAULO[1]])
+        assert distances[0] == pytest.approx(84, abs=2)
+        assert distances[1] == pytest.approx(361, abs=3)
+        assert distances[2] == pytest.approx(0)
+
+    def test_cells_cover_everything_in_the_box(self):
+        box = bounding_box(*SAO_PAULO, 100)
+        ranges = cell_ranges(box)
+        assert len(ranges) == pytest.approx(19, abs=1)  # ~1,8° de latitude em faixas de 0,1°
+
+        def covered(lat, lon):
+            return any(first <= grid_cell(lat, lon) <= last for first, last in ranges)
+
+        assert covered(*SAO_PAULO) and covered(*CAMPINAS)
+        assert covered(box[0], box[2]) and covered(box[1], box[3])  # cantos da caixa
+        assert not covered(*RIO)
+
+    def test_large_radius_skips_cell_ranges(self):
+        assert cell_ranges(bounding_box(*SAO_PAULO, 2000)) is None
+        assert bounding_box(0, 179.9, 50)[2:] == (-180.0, 180.0)
+
+    def test_grid_cell_rejects_invalid_coordinates(self):
+        assert grid_cell(None, -46.6) is None
+        assert grid_cell(95, 0) is None
+        assert grid_cell("abc", 0) is None
+        assert grid_cell(90, 180) is not None
+
+    def test_ensure_geo_cells_migrates_and_backfills(self, tmp_path):
+        engine = create_engine(f"sqlite:///{tmp_path / 'geo.db'}")
+        with engine.begin() as conn:
+            conn.execute(text("CREATE TABLE enderecos (id INTEGER PRIMARY KEY, latitude FLOAT, longitude FLOAT)"))
+            conn.execute(text("INSERT INTO enderecos (latitude, longitude) VALUES (-23.55, -46.63), (NULL, NULL), (999, 0)"))
+
+        assert ensure_geo_cells(engine, batch_size=1) == 2
+        assert ensure_geo_cells(engine) == 0
+        with engine.connect() as conn:
+            cells = conn.execute(text("SELECT geo_cell FROM enderecos ORDER BY id")).scalars().all()
+        assert cells == [grid_cell(-23.55, -46.63), None, -1]
+        engine.dispose()
@@ -0,0 +1,108 @@
+import subprocess
+import sys
+import textwrap
+import time
+from pathlib import Path
+
+import pytest
+from sqlalchemy import create_engine
+
+from services.leader_lease import LeaderLease, LeaderElector, current_leader
+
+ROOT = str(Path(__file__).resolve().parents[1])
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return tmp_path / "leases.db"
+
+
+@pytest.fixture
+def engine(db_path):
+    engine = create_engine(f"sqlite:///{db_path}")
+    yield engine
+    engine.dispose()
+
+
+class TestLeaderLease:
+    """Testes para o lease de liderança entre réplicas do bot."""
+
+    def test_only_one_leader(self, engine):
+        a = LeaderLease("bot:x", holder_id="a", engine=engine, ttl_seconds=30)
+        b = LeaderLease("bot:x", holder_id="b", engine=engine, ttl_seconds=30)
+
+        assert a.try_acquire()
+        assert not b.try_acquire()
+        assert a.try_acquire()  # renovação
+        assert a.is_leader() and not b.is_leader()
+        assert current_leader("bot:x", engine=engine)["holder"] == "a"
+
+    def test_takeover_after_expiry_bumps_term(self, engine):
+        a = LeaderLease("bot:x", holder_id="a", engine=engine, ttl_seconds=0.2)
+        b = LeaderLease("bot:x", holder_id="b", engine=engine, ttl_seconds=0.2)
+        assert a.try_acquire()
+        first_term = a.term
+
+        time.sleep(0.3)
+        assert not a.is_leader()
+        assert b.try_acquire()
+        assert b.term == first_term + 1
+        assert not a.try_acquire()
+
+    def test_local_clock_skew_does_not_create_two_leaders(self, engine, monkeypatch):
+        a = LeaderLease("bot:x", holder_id="a", engine=engine, ttl_seconds=30)
+        b = LeaderLease("bot:x", holder_id="b", engine=engine, ttl_seconds=30)
+        assert a.try_acquire()
+
+        real_time = time.time
+        monkeypatch.setattr(time, "time", lambda: real_time() + 120)  # host de b adiantado 2 min
+        assert not b.try_acquire()
+        assert current_leader("bot:x", engine=engine)["holder"] == "a"
+        monkeypatch.undo()
+        assert a.is_leader() and a.try_acquire()
+
+    def test_release_hands_over_immediately(self, engine):
+        a = LeaderLease("bot:x", holder_id="a", engine=engine, ttl_seconds=30)
+        b = LeaderLease("bot:x", holder_id="b", engine=engine, ttl_seconds=30)
+        a.try_acquire()
+        a.release()
+
+        assert not a.is_leader()
+        assert b.try_acquire()
+
+    def test_db_failure_means_not_leader(self):
+        lease = LeaderLease("bot:x", engine=create_engine("sqlite:////caminho/inexistente/leases.db"))
+        assert not lease.try_acquire()
+        assert not lease.is_leader()
+
+    def test_standby_process_takes_over_when_leader_dies(self, engine, db_path):
+        """Dois processos no mesmo banco: o standby assume quando o líder morre."""
+        leader_code = textwrap.dedent(f"""
+            import sys, time
+            sys.path.insert(0, {ROOT!r})
+            from sqlalchemy import create_engine
+            from services.leader_lease import LeaderLease, LeaderElector
+            elector = LeaderElector(LeaderLease("bot:x", holder_id="processo-a",
+                                                engine=create_engine("sqlite:///{db_path}"), ttl_seconds=1))
+            elector.start()
+            while not elector.is_leader():
+                time.sleep(0.05)
+            print("lider", flush=True)
+            time.sleep(60)
+        """)
+        proc = subprocess.Popen([sys.executable, "-c", leader_code], stdout=subprocess.PIPE, text=True)
+        try:
+            assert proc.stdout.readline().strip() == "lider"
+            standby = LeaderElector(LeaderLease("bot:x", holder_id="processo-b", engine=engine, ttl_seconds=1))
+            assert not standby.step()
+
+            proc.kill()
+            proc.wait()
+            deadline = time.time() + 5
+            while not standby.step() and time.time() < deadline:
+                time.sleep(0.1)
+            assert standby.is_leader()
+            assert current_leader("bot:x", engine=engine)["holder"] == "processo-b"
+        finally:
+            if proc.poll() is None:
+                proc.kill()
@@ -0,0 +1,42 @@
+from services.message_coalescer import MessageCoalescer
+
+
+class TestMessageCoalescer:
+    """Testes para a janela de debounce por conversa."""
+
+    def test_combines_consecutive_messages(self):
+        coalescer = MessageCoalescer(quiet_seconds=5, max_wait_seconds=30)
+        coalescer.add("111", "111@s.whatsapp.net", "m1", "oi", timestamp=100)
+        coalescer.add("111", "111@s.whatsapp.net", "m2", "tudo bem?", timestamp=102)
+        coalescer.add("111", "111@s.whatsapp.net", "m3", "qual o preço?", timestamp=103)
+
+        assert coalescer.pop_ready(now=106) == []
+
+        ready = coalescer.pop_ready(now=108)
+        assert len(ready) == 1
+        assert ready[0]["text"] == "oi\ntudo bem?\nqual o preço?"
+        assert ready[0]["message_ids"] == ["m1", "m2", "m3"]
+        assert coalescer.pending_count() == 0
+
+    def test_max_wait_forces_turn(self):
+        coalescer = MessageCoalescer(quiet_seconds=5, max_wait_seconds=10)
+        for i, ts in enumerate(range(100, 112, 3)):
+            coalescer.add("111", "jid", f"m{i}", f"msg {i}", timestamp=ts)
+
+        assert coalescer.seconds_until_next_ready(now=105) == 5
+        assert len(coalescer.pop_ready(now=110)) == 1
+
+    def test_conversations_are_independent(self):
+        coalescer = MessageCoalescer(quiet_seconds=5, max_wait_seconds=30)
+        coalescer.add("111", "jid1", "a", "oi", timestamp=100)
+        coalescer.add("222", "jid2", "b", "olá", timestamp=104)
+
+        ready = coalescer.pop_ready(now=106)
+        assert [t["phone_number"] for t in ready] == ["111"]
+        assert coalescer.pending_count() == 1
+        assert coalescer.seconds_until_next_ready(now=106) == 3
+
+    def test_zero_quiet_period_replies_immediately(self):
+        coalescer = MessageCoalescer(quiet_seconds=0, max_wait_seconds=0)
+        coalescer.add("111", "jid", "a", "oi", timestamp=100)
+        assert len(coalescer.pop_ready(now=100)) == 1
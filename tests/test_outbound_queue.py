@@ -0,0 +1,123 @@
+import datetime
+import time
+
+import pytest
+from sqlalchemy import create_engine, update
+
+from services.bot_tables import outbound_messages
+
+from services.outbound_queue import OutboundQueue
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'outbound.db'}")
+    yield engine
+    engine.dispose()
+
+
+class FakeSender:
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.sent = []
+
+    def __call__(self, remote_jid, text):
+        if self.failures:
+            self.failures -= 1
+            return None
+        self.sent.append((remote_jid, text, time.time()))
+        return {"key": {"id": f"out-{len(self.sent)}"}}
+
+
+class TestOutboundQueue:
+    """Testes para a fila persistente de envio pelo WhatsApp."""
+
+    def test_sends_in_order_with_pacing(self, engine):
+        sender = FakeSender()
+        delivered = []
+        queue = OutboundQueue(engine, sender=sender, min_interval_seconds=0.1, on_sent=delivered.append)
+        queue.enqueue("111", "111@s", "primeira")
+        queue.enqueue("222", "222@s", "segunda")
+
+        assert queue.process_once() == 2
+        assert [t for _, t, _ in sender.sent] == ["primeira", "segunda"]
+        assert sender.sent[1][2] - sender.sent[0][2] >= 0.09
+        assert [r["phone_number"] for r in delivered] == ["111", "222"]
+        assert queue.counts() == {"queued": 0, "sent": 2, "failed": 0, "expired": 0}
+        assert queue.metrics.snapshot()["histograms"]["delivery_latency_seconds"]["count"] == 2
+
+    def test_retries_with_backoff_then_delivers(self, engine):
+        sender = FakeSender(failures=1)
+        queue = OutboundQueue(engine, sender=sender, min_interval_seconds=0, base_backoff_seconds=0.2)
+        queue.enqueue("111", "111@s", "oi")
+
+        assert queue.process_once() == 0
+        assert queue.process_once() == 0  # ainda no backoff
+        time.sleep(0.25)
+        assert queue.process_once() == 1
+        assert queue.counts()["sent"] == 1
+
+    def test_gives_up_after_max_attempts(self, engine):
+        queue = OutboundQueue(engine, sender=FakeSender(failures=99), min_interval_seconds=0,
+                              base_backoff_seconds=0, max_attempts=3)
+        queue.enqueue("111", "111@s", "oi")
+        for _ in range(5):
+            queue.process_once()
+
+        assert queue.counts() == {"queued": 0, "sent": 0, "failed": 1, "expired": 0}
+
+    def test_backoff_blocks_later_messages_to_the_same_phone(self, engine):
+        sender = FakeSender(failures=1)
+        queue = OutboundQueue(engine, sender=sender, min_interval_seconds=0, base_backoff_seconds=0.2)
+        queue.enqueue("111", "111@s", "primeira")
+        queue.enqueue("111", "111@s", "segunda")
+        queue.enqueue("222", "222@s", "outro cliente")
+
+        assert queue.process_once() == 1  # "primeira" falhou; só o outro telefone segue
+        assert [t for _, t, _ in sender.sent] == ["outro cliente"]
+        time.sleep(0.25)
+        assert queue.process_once() == 2
+        assert [t for _, t, _ in sender.sent] == ["outro cliente", "primeira", "segunda"]
+
+    def test_old_messages_expire_instead_of_being_sent(self, engine):
+        sender = FakeSender()
+        queue = OutboundQueue(engine, sender=sender, min_interval_seconds=0, max_age_seconds=600)
+        stale_id = queue.enqueue("111", "111@s", "antes da queda")
+        queue.enqueue("111", "111@s", "agora")
+        with engine.begin() as conn:
+            conn.execute(update(outbound_messages).where(outbound_messages.c.id == stale_id)
+                         .values(created_at=datetime.datetime.now() - datetime.timedelta(hours=2)))
+
+        assert queue.process_once() == 1
+        assert [t for _, t, _ in sender.sent] == ["agora"]
+        assert queue.counts() == {"queued": 0, "sent": 1, "failed": 0, "expired": 1}
+
+    def test_unsent_messages_survive_restart(self, engine):
+        OutboundQueue(engine).enqueue("111", "111@s", "pendente")  # sem sender: nada é enviado
+
+        sender = FakeSender()
+        assert OutboundQueue(engine, sender=sender, min_interval_seconds=0).process_once() == 1
+        assert sender.sent[0][1] == "pendente"
+
+    def test_only_sends_when_allowed(self, engine):
+        sender = FakeSender()
+        allowed = [False]
+        queue = OutboundQueue(engine, sender=sender, min_interval_seconds=0, can_send=lambda: allowed[0])
+        queue.enqueue("111", "111@s", "oi")
+
+        assert queue.process_once() == 0
+        allowed[0] = True
+        assert queue.process_once() == 1
+
+    def test_background_thread_delivers(self, engine):
+        sender = FakeSender()
+        queue = OutboundQueue(engine, sender=sender, min_interval_seconds=0)
+        queue.start()
+        try:
+            queue.enqueue("111", "111@s", "oi")
+            deadline = time.time() + 5
+            while not sender.sent and time.time() < deadline:
+                time.sleep(0.05)
+        finally:
+            queue.stop()
+        assert sender.sent
@@ -0,0 +1,57 @@
+import datetime
+
+import pytest
+from sqlalchemy import create_engine, update
+
+from services.bot_tables import pending_replies
+from services.pending_replies import PendingReplyQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'pending.db'}")
+    yield PendingReplyQueue(engine, max_age_seconds=600)
+    engine.dispose()
+
+
+class TestPendingReplyQueue:
+    """Testes para a fila persistente de respostas adiadas."""
+
+    def test_one_pending_turn_per_conversation(self, queue):
+        queue.enqueue("111", "111@s.whatsapp.net", "oi", ["m1"])
+        queue.enqueue("111", "111@s.whatsapp.net", "qual o preço?", ["m2"])
+
+        batch = queue.next_batch()
+        assert len(batch) == 1
+        assert batch[0]["text"] == "oi\nqual o preço?"
+        assert batch[0]["message_ids"] == "m1,m2"
+        assert queue.has_pending("111")
+
+    def test_oldest_first_and_done(self, queue):
+        first = queue.enqueue("111", "jid1", "primeira")
+        queue.enqueue("222", "jid2", "segunda")
+
+        assert [r["phone_number"] for r in queue.next_batch()] == ["111", "222"]
+
+        queue.mark_done(first)
+        assert [r["phone_number"] for r in queue.next_batch()] == ["222"]
+        assert not queue.has_pending("111")
+
+    def test_retry_keeps_pending_and_counts_attempts(self, queue):
+        reply_id = queue.enqueue("111", "jid", "oi")
+        queue.mark_retry(reply_id)
+
+        batch = queue.next_batch()
+        assert batch[0]["attempts"] == 1
+        assert batch[0]["status"] == "pending"
+
+    def test_expires_old_turns(self, queue):
+        reply_id = queue.enqueue("111", "jid", "antiga")
+        old = datetime.datetime.now() - datetime.timedelta(hours=2)
+        with queue.engine.begin() as conn:
+            conn.execute(update(pending_replies).where(pending_replies.c.id == reply_id).values(created_at=old))
+
+        assert queue.next_batch() == []
+        counts = queue.counts()
+        assert counts["expired"] == 1
+        assert counts["pending"] == 0
@@ -0,0 +1,37 @@
+from services.poll_scheduler import AdaptivePollScheduler, ConnectionCheckSchedule
+
+
+class TestAdaptivePollScheduler:
+    """Testes para o intervalo de polling adaptativo."""
+
+    def test_backs_off_when_idle(self):
+        scheduler = AdaptivePollScheduler(min_interval=1.5, max_interval=30, active_window_seconds=120)
+
+        intervals = [scheduler.next_interval(now=t) for t in range(6)]
+        assert intervals == [3, 6, 12, 24, 30, 30]
+
+    def test_fast_while_conversation_is_active(self):
+        scheduler = AdaptivePollScheduler(min_interval=1.5, max_interval=30, active_window_seconds=120)
+        for t in range(5):
+            scheduler.next_interval(now=t)
+
+        assert scheduler.next_interval(had_activity=True, now=100) == 1.5
+        # Sem mensagens novas, mas dentro da janela de atividade: continua rápido
+        assert scheduler.next_interval(now=150) == 1.5
+        assert scheduler.next_interval(now=219) == 1.5
+        # Janela encerrada: volta a espaçar
+        assert scheduler.next_interval(now=221) == 3
+
+
+class TestConnectionCheckSchedule:
+    def test_checks_periodically_and_after_failure(self):
+        schedule = ConnectionCheckSchedule(every_seconds=300)
+        assert schedule.due(now=0)
+
+        schedule.mark_ok(now=0)
+        assert not schedule.due(now=299)
+        assert schedule.due(now=300)
+
+        schedule.mark_ok(now=300)
+        schedule.mark_failed()
+        assert schedule.due(now=301)
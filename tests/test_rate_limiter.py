@@ -0,0 +1,94 @@
+import time
+
+import pytest
+from sqlalchemy import create_engine, inspect, update
+
+from services.bot_tables import rate_limits
+from services.rate_limiter import SharedRateLimiter, gemini_bucket
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'limits.db'}")
+    yield engine
+    engine.dispose()
+
+
+class TestSharedRateLimiter:
+    """Testes para o limitador de cota compartilhado."""
+
+    def test_per_minute_bucket(self, engine):
+        limiter = SharedRateLimiter(engine, per_minute=3, per_day=100)
+        assert [limiter.try_acquire()[0] for _ in range(4)] == [True, True, True, False]
+
+        remaining = limiter.remaining()
+        assert remaining["available_now"] == 0
+        assert remaining["calls_today"] == 3
+        assert remaining["remaining_today"] == 97
+
+    def test_state_is_shared_between_instances(self, engine):
+        """Dois runners (ou processos) com o mesmo bucket dividem a mesma cota."""
+        runner_a = SharedRateLimiter(engine, bucket="gemini:x", per_minute=2, per_day=100)
+        runner_b = SharedRateLimiter(engine, bucket="gemini:x", per_minute=2, per_day=100)
+        other_key = SharedRateLimiter(engine, bucket="gemini:y", per_minute=2, per_day=100)
+
+        assert runner_a.try_acquire()[0]
+        assert runner_b.try_acquire()[0]
+        assert not runner_a.try_acquire()[0]
+        assert not runner_b.check()[0]
+        assert other_key.try_acquire()[0]
+
+    def test_daily_limit(self, engine):
+        limiter = SharedRateLimiter(engine, per_minute=100, per_day=2)
+        limiter.try_acquire()
+        limiter.try_acquire()
+
+        ok, reason = limiter.try_acquire()
+        assert not ok
+        assert "limite diário" in reason
+
+    def test_refill_over_time(self, engine):
+        limiter = SharedRateLimiter(engine, per_minute=60, per_day=1000)
+        for _ in range(60):
+            limiter.try_acquire()
+        assert not limiter.check()[0]
+
+        # Simula 2 segundos decorridos (60/min = 1 token por segundo)
+        with engine.begin() as conn:
+            conn.execute(update(rate_limits).values(refilled_at=rate_limits.c.refilled_at - 2))
+        assert limiter.remaining()["available_now"] == 2
+
+    def test_cooldown_is_global(self, engine):
+        runner_a = SharedRateLimiter(engine, per_minute=10, per_day=100)
+        runner_b = SharedRateLimiter(engine, per_minute=10, per_day=100)
+        runner_a.set_cooldown(time.time() + 60)
+
+        ok, reason = runner_b.try_acquire()
+        assert not ok
+        assert "cooldown" in reason
+        assert runner_b.remaining()["cooldown_remaining"] > 0
+
+    def test_falls_back_to_memory_when_db_fails(self):
+        engine = create_engine("sqlite:////caminho/inexistente/limits.db")
+        limiter = SharedRateLimiter(engine, per_minute=1, per_day=10)
+        assert limiter.try_acquire()[0]
+        assert not limiter.try_acquire()[0]
+
+
+def test_gemini_bucket_per_key():
+    assert gemini_bucket("chave-a") != gemini_bucket("chave-b")
+    assert gemini_bucket("chave-a").startswith("gemini:")
+
+    def test_peek_is_read_only(self, engine):
+        reader = SharedRateLimiter(engine, bucket="gemini:x", per_minute=5, per_day=100)
+        assert reader.peek() is None  # bucket inexistente: sem dados, não uma cota cheia
+        assert "bot_rate_limits" not in inspect(engine).get_table_names()  # nada foi criado
+
+        SharedRateLimiter(engine, bucket="gemini:x", per_minute=5, per_day=100).try_acquire()
+        usage = reader.peek()
+        assert (usage["calls_today"], usage["available_now"]) == (1, 4)
+        assert reader.peek()["calls_today"] == 1
+
+    def test_peek_returns_none_when_db_fails(self):
+        limiter = SharedRateLimiter(create_engine("sqlite:////caminho/inexistente/limits.db"))
+        assert limiter.peek() is None